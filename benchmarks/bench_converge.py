@@ -0,0 +1,214 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Measure convergence and flooding load of a network of instances in one process.
+
+Every node of a synthetic topology is an instance and every adjacency a virtual
+LAN (see pyisis.lib.vnet), so no interfaces or root are needed. The time until
+all adjacencies are up and until every instance has the same router LSPs (not
+pseudonode LSPs, which follow DIS election), and the frames flooded to get
+there, are reported. Run from the top of the tree::
+
+    python -m benchmarks.bench_converge --topology grid --nodes 25 100
+    python -m benchmarks.bench_converge --nodes 49 --delay .001 --loss .01
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from pyisis.lib.util import tlvrdb
+from timeit import default_timer
+
+import argparse
+import json
+import logbook
+import random
+import sys
+import threading
+import time
+import pyisis.clns as clns
+import pyisis.instance as instance
+import pyisis.spf as spf
+import pyisis.lib.vnet as vnet
+import benchmarks.bench_spf as bench_spf
+import benchmarks.topology as topology
+
+
+def get_lsdb (inst):
+    """Get the { lspid: seqno } of the unpurged router LSPs in an instance's L1 LSDB"""
+    uproc = inst.update[0]
+    with uproc.dblock:
+        return dict((lspid, lspseg.lsphdr.seqno) for lspid, lspseg in uproc.dbhash.items()
+                    if lspseg.lsphdr.lifetime and not tlvrdb(lspid[clns.CLNS_SYSID_LEN]))
+
+
+def count_up_adjacencies (inst):
+    count = 0
+    with inst.linkdb:
+        links = list(inst.linkdb.links)
+    for link in links:
+        count += sum(1 for unused in link.lxlink[0].adjdb.up_iter())
+    return count
+
+
+def build (net, topo, delay, loss, use_spf, executor):
+    """Create an instance per node with a link on a virtual LAN per adjacency.
+
+    The instances share executor for SPF rather than each starting a pool.
+    """
+    lans = {}
+    for sysid in sorted(topo):
+        for nbr in sorted(topo[sysid]):
+            key = tuple(sorted((sysid, nbr)))
+            if key not in lans:
+                lans[key] = net.add_lan("vlan{}".format(len(lans)), delay, loss).name
+
+    insts = []
+    for sysid in sorted(topo):
+        inst = instance.Instance(clns.CTYPE_L1, clns.iso_encode("49.0001"), sysid, 64,
+                                 intf_factory=net.get_intf_factory(), spf_executor=executor)
+        if not use_spf:
+            inst.decision = [ None, None ]
+        for nbr in sorted(topo[sysid]):
+            inst.linkdb.add_link(lans[tuple(sorted((sysid, nbr)))])
+        insts.append(inst)
+    return insts, len(lans)
+
+
+def run_one (name, count, seed, delay, loss, use_spf, timeout, settle, executor):
+    rand = random.Random(seed)
+    topo = topology.TOPOLOGIES[name](count, rand)
+    net = vnet.VirtualNetwork(seed)
+    start = default_timer()
+    insts, nlans = build(net, topo, delay, loss, use_spf, executor)
+    for inst in insts:
+        thread = threading.Thread(name="Packets", target=inst.linkdb.process_packets)
+        thread.daemon = True
+        thread.start()
+
+    result = { "topology": name, "nodes": len(topo), "lans": nlans, "delay": delay,
+               "loss": loss }
+    nadj = 2 * nlans
+    converged = None
+    last = None
+    while default_timer() - start < timeout:
+        time.sleep(.1)
+        now = default_timer() - start
+        if "adjacency_s" not in result:
+            if sum(count_up_adjacencies(x) for x in insts) >= nadj:
+                result["adjacency_s"] = now
+            continue
+
+        # Converged when every LSDB has the same LSPs from all the routers
+        # and stays that way for settle seconds.
+        lsdbs = [ get_lsdb(x) for x in insts ]
+        same = (all(x == lsdbs[0] for x in lsdbs) and
+                len(set(x[:clns.CLNS_SYSID_LEN] for x in lsdbs[0])) == len(topo))
+        if not same:
+            converged = last = None
+        elif lsdbs[0] != last:
+            converged, last = now, lsdbs[0]
+            stats = net.get_stats()
+        elif now - converged >= settle:
+            break
+    else:
+        converged = None
+
+    if converged is None:
+        result["converged"] = False
+        stats = net.get_stats()
+    else:
+        result["converged"] = True
+        result["converge_s"] = converged
+        result["lsps"] = len(last)
+
+    frames, delivered, lost, pdu_types = stats
+    result["frames"] = frames
+    result["delivered"] = delivered
+    result["lost"] = lost
+    result["lsp_frames"] = sum(pdu_types.get(x, 0) for x in clns.PDU_TYPE_LSP_LX)
+    result["snp_frames"] = sum(pdu_types.get(x, 0)
+                               for x in clns.PDU_TYPE_CSNP_LX + clns.PDU_TYPE_PSNP_LX)
+    result["iih_frames"] = sum(pdu_types.get(x, 0) for x in clns.PDU_TYPE_IIH_LAN_LX)
+    result["threads"] = threading.active_count()
+    result["maxrss_kb"] = bench_spf.get_maxrss_kb()
+    for inst in insts:
+        inst.close()
+    return result
+
+
+def print_result (result):
+    print("{topology:>14} {nodes:>5} nodes {lans:>5} lans delay {delay}s loss {loss}".format(
+        **result))
+    for key in sorted(result):
+        if key.endswith("_s"):
+            print("    {:<16} {:>10.2f} s".format(key[:-2], result[key]))
+    if not result["converged"]:
+        print("    NOT CONVERGED")
+    else:
+        print("    {:<16} {:>10}".format("lsps", result["lsps"]))
+        print("    {:<16} {:>10.1f}".format("lsp frames/lsp",
+                                            result["lsp_frames"] / result["lsps"]))
+    for key in ("frames", "lsp_frames", "snp_frames", "iih_frames", "lost", "threads"):
+        print("    {:<16} {:>10}".format(key, result[key]))
+    print("    {:<16} {:>10.1f} MiB".format("maxrss", result["maxrss_kb"] / 1024))
+
+
+def main ():
+    parser = argparse.ArgumentParser("bench_converge")
+    parser.add_argument('--topology', choices=sorted(topology.TOPOLOGIES), default="grid",
+                        help='Topology to run')
+    parser.add_argument('--nodes', nargs="+", type=int, default=[ 25 ],
+                        help='Approximate node counts to run')
+    parser.add_argument('--delay', type=float, default=0, help='Seconds each frame is delayed')
+    parser.add_argument('--loss', type=float, default=0, help='Fraction of frames lost')
+    parser.add_argument('--no-spf', action="store_true", help="Don't run SPF")
+    parser.add_argument('--spf-workers', type=int, default=0,
+                        help='Worker processes for SPF shared by all instances (0 is inline)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='Seconds to wait for convergence')
+    parser.add_argument('--settle', type=float, default=2,
+                        help='Seconds the LSDBs must stay the same to be converged')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    logbook.NullHandler().push_application()
+
+    executor = spf.SPFExecutor(args.spf_workers)
+    results = []
+    try:
+        for count in args.nodes:
+            result = run_one(args.topology, count, args.seed, args.delay, args.loss,
+                             not args.no_spf, args.timeout, args.settle, executor)
+            print_result(result)
+            results.append(result)
+    finally:
+        executor.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump(results, jfile, indent=2, sort_keys=True)
+
+    if not all(x["converged"] for x in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,211 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Benchmark decoding received LSPs inline against the receive pipeline.
+
+Batches of LSP frames of a given size, filled with extended IS and IP
+reachability TLVs, are verified and decoded by the receiving thread and by a
+ReceivePipeline with worker processes. The smallest batch for which the
+pipeline is faster is the break-even, below it the cost of handing the frames
+to the workers is more than the work it saves and LSPs should be decoded inline
+(see pipeline.PIPELINE_MIN_BYTES).
+
+The costs of each stage are also measured: the checksum and the TLV decoding
+of an LSP, unpickling its decoded TLVs (what the receiving thread still does
+for an LSP decoded by a worker) and a round trip to a worker. From these the
+speedup is projected for a machine with a core for each worker, which a
+machine with fewer cores can't measure. Run from the top of the tree::
+
+    python -m benchmarks.bench_pipeline --workers 2 --lsp-size 1492
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from ctypes import sizeof
+from pyisis.lib.cksum import iso_cksum
+from timeit import default_timer
+
+import argparse
+import json
+import pickle
+import struct
+import pyisis.pdu as pdu
+import pyisis.pipeline as pipeline
+import pyisis.tlv as tlv
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def get_reach_tlvs (space):
+    """Get extended IS and IP reachability TLVs filling at most space bytes"""
+    tlvs = []
+    index = 0
+    while space >= 2 + 11:
+        # Alternate full TLVs of 23 neighbors and of 31 /24 prefixes.
+        if len(tlvs) % 2:
+            count = min(31, (space - 2) // 8)
+            value = b"".join(struct.pack(">IB3s", 10, 24, struct.pack(">I", index + x)[1:])
+                             for x in range(0, count))
+            tlvs.append(struct.pack(">BB", tlv.TLV_EXT_IPV4_PREFIX, len(value)) + value)
+        else:
+            count = min(23, (space - 2) // 11)
+            value = b"".join(struct.pack(">I3sx", index + x, b"\x00\x00\x0a").rjust(11, b"\x00")
+                             for x in range(0, count))
+            tlvs.append(struct.pack(">BB", tlv.TLV_EXT_IS_REACH, len(value)) + value)
+        index += count
+        space -= len(tlvs[-1])
+    return b"".join(tlvs)
+
+
+def get_lsp_frame (seqno, lsp_size):
+    """Get an Ethernet frame with an LSP of about lsp_size bytes and a valid checksum"""
+    lsphdr, buf, unused = pdu.get_raw_lsp_pdu(0)
+    tlvdata = get_reach_tlvs(min(lsp_size, len(buf)) - sizeof(lsphdr))
+    pdulen = sizeof(lsphdr) + len(tlvdata)
+    buf[sizeof(lsphdr):pdulen] = tlvdata
+    lsphdr.pdu_len = pdulen
+    lsphdr.lifetime = 1200
+    lsphdr.seqno = seqno
+    lsphdr.checksum = iso_cksum(buf[12:pdulen], 12)
+    llc = b"\xfe\xfe\x03"
+    return bytes(b"\x01\x80\xc2\x00\x00\x14" + b"\x02" * 6 + b"\x00\x40" + llc + buf[:pdulen])
+
+
+def time_batches (verify, pkts, rounds):
+    """Return the mean seconds to verify pkts"""
+    verify(pkts)
+    start = default_timer()
+    for unused in range(0, rounds):
+        verify(pkts)
+    return (default_timer() - start) / rounds
+
+
+def time_call (func, rounds):
+    """Return the mean seconds to call func"""
+    func()
+    start = default_timer()
+    for unused in range(0, rounds):
+        func()
+    return (default_timer() - start) / rounds
+
+
+def measure_costs (rxpipe, frame, rounds):
+    """Return the seconds each stage of receiving frame takes"""
+    tlvs = pipeline.decode_lsp_frame(frame)
+    pickled = pickle.dumps(tlvs, pickle.HIGHEST_PROTOCOL)
+    verify = time_call(lambda: pipeline.verify_lsp_frame(frame), rounds)
+    return {
+        "checksum_s": verify,
+        "decode_s": time_call(lambda: pipeline.decode_lsp_frame(frame), rounds) - verify,
+        "unpickle_s": time_call(lambda: pickle.loads(pickled), rounds),
+        "round_trip_s": time_call(
+            lambda: rxpipe.executor.submit(pipeline.decode_lsp_frames, []).result(), rounds),
+    }
+
+
+def get_projected_time (costs, workers, batch):
+    """Return the projected seconds to decode batch LSPs with a core for each worker.
+
+    The receiving thread decodes the first chunk while the workers decode the
+    others and then unpickles the TLVs the workers decoded.
+    """
+    inline = costs["checksum_s"] + costs["decode_s"]
+    chunk = (batch + workers) // (workers + 1)
+    if chunk >= batch:
+        return inline * batch
+    return inline * chunk + costs["round_trip_s"] + costs["unpickle_s"] * (batch - chunk)
+
+
+def run (workers, lsp_size, batch_sizes, rounds):
+    frames = [ get_lsp_frame(x, lsp_size) for x in range(1, max(batch_sizes) + 1) ]
+    rxpipe = pipeline.ReceivePipeline(workers, min_bytes=1)
+    results = []
+    try:
+        costs = measure_costs(rxpipe, frames[0], rounds * 10)
+        for batch in batch_sizes:
+            pkts = frames[:batch]
+            inline = time_batches(pipeline.decode_lsp_frames, pkts, rounds)
+            pipelined = time_batches(rxpipe.decode, pkts, rounds)
+            projected = get_projected_time(costs, workers, batch)
+            results.append({
+                "batch": batch,
+                "bytes": sum(len(x) for x in pkts),
+                "inline_s": inline,
+                "pipeline_s": pipelined,
+                "speedup": inline / pipelined if pipelined else 0,
+                "projected_speedup": batch * (costs["checksum_s"] + costs["decode_s"]) / projected,
+            })
+    finally:
+        rxpipe.shutdown()
+    return costs, results
+
+
+def get_break_even (results):
+    """Return the smallest batch result the pipeline is faster for from then on, or None"""
+    even = None
+    for result in results:
+        if result["speedup"] > 1:
+            if even is None:
+                even = result
+        else:
+            even = None
+    return even
+
+
+def main ():
+    parser = argparse.ArgumentParser("bench_pipeline")
+    parser.add_argument('--workers', type=int, default=2, help='Receive pipeline workers')
+    parser.add_argument('--lsp-size', type=int, default=1492, help='Bytes in each LSP')
+    parser.add_argument('--batch', type=int, action='append',
+                        help='Batch size to run (may be repeated), default a range')
+    parser.add_argument('--rounds', type=int, default=20, help='Rounds of each batch size')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    batch_sizes = sorted(args.batch) if args.batch else BATCH_SIZES
+    workers = max(1, args.workers)
+    costs, results = run(workers, args.lsp_size, batch_sizes, args.rounds)
+    print("per LSP: checksum {:.1f}us decode {:.1f}us unpickle {:.1f}us, "
+          "worker round trip {:.1f}us".format(costs["checksum_s"] * 1e6, costs["decode_s"] * 1e6,
+                                              costs["unpickle_s"] * 1e6,
+                                              costs["round_trip_s"] * 1e6))
+    print("{:>8} {:>12} {:>12} {:>8} {:>10}".format("batch", "inline", "pipeline", "speedup",
+                                                    "projected"))
+    for result in results:
+        print("{batch:>8} {inline_us:>10.1f}us {pipeline_us:>10.1f}us {speedup:>8.2f} "
+              "{projected_speedup:>10.2f}".format(
+                  inline_us=result["inline_s"] * 1e6, pipeline_us=result["pipeline_s"] * 1e6,
+                  **result))
+    even = get_break_even(results)
+    if even is None:
+        print("break-even: none, decode inline")
+    else:
+        print("break-even: {} LSPs {} bytes per batch (PIPELINE_MIN_BYTES is {})".format(
+            even["batch"], even["bytes"], pipeline.PIPELINE_MIN_BYTES))
+    print("projected with {} cores: {:.2f}x at {} LSPs a batch".format(
+        workers + 1, results[-1]["projected_speedup"], results[-1]["batch"]))
+
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump({ "costs": costs, "results": results }, jfile, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
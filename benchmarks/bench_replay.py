@@ -0,0 +1,272 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Benchmark the receive path by replaying a packet capture.
+
+The frames received in a capture (e.g., from ``pyisis.main --pcap``) are fed to
+the links of an in-process instance at the captured rate, a multiple of it or
+as fast as possible. A synthetic capture of an LSDB flood can be generated so
+the benchmark can be run anywhere. Run from the top of the tree::
+
+    python -m benchmarks.bench_replay --generate grid --nodes 1000 flood.pcapng
+    python -m benchmarks.bench_replay flood.pcapng --json results.json
+    python -m benchmarks.bench_replay flood.pcapng --speed 1 --baseline results.json
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from ctypes import sizeof
+from pyisis.lib.util import memcpy
+from timeit import default_timer
+
+import argparse
+import json
+import logbook
+import os
+import random
+import struct
+import sys
+import time
+import pyisis.clns as clns
+import pyisis.instance as instance
+import pyisis.link as link
+import pyisis.lib.pcap as pcap
+import pyisis.pdu as pdu
+import pyisis.tlv as tlv
+import benchmarks.topology as topology
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPLAY_MAC = clns.mac_encode("02:00:5e:00:00:01")
+NBR_MAC = clns.mac_encode("02:00:5e:00:00:02")
+ETHER_MIN_FRAME = 60
+
+
+class ReplayInterface (object):
+    """Stands in for the raw interface of a replay link, frames sent are discarded"""
+
+    def __init__ (self, ifname, mac_addr):
+        self.name = ifname
+        self.ifindex = 0
+        self.mac_addr = mac_addr
+        self.sent = 0
+
+    def add_drop_group (self, add, maddr):
+        pass
+
+    def set_filter (self, insns):
+        pass
+
+    def sendmmsg (self, frames):
+        self.sent += len(frames)
+        return len(frames)
+
+    def recv_pkts (self):
+        return []
+
+    def release_pkts (self):
+        pass
+
+    def get_if_addrs (self):
+        return self.mac_addr, None
+
+
+def get_cpu_s ():
+    if not resource:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_percentile (values, percent):
+    """Get the percentile of the sorted list values"""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def get_instance (is_type, areaid):
+    inst = instance.Instance(is_type, areaid, topology.get_sysid(0xFFFFFFF), 64, spf_workers=0,
+                             intf_factory=lambda ifname: ReplayInterface(ifname, REPLAY_MAC))
+    # Keep SPF and our own LSP generation out of the measurements.
+    inst.decision = [ None, None ]
+    for uproc in inst.update:
+        if uproc is not None:
+            uproc.our_lsp.gen_timer.stop()
+    return inst
+
+
+def get_frame (pdubuf, lindex):
+    frame = (clns.ALL_LX_IS[lindex] + NBR_MAC + struct.pack(">H", len(pdubuf) + 3) +
+             b"\xfe\xfe\x03" + bytes(pdubuf))
+    return frame + b"\x00" * max(0, ETHER_MIN_FRAME - len(frame))
+
+
+def get_iih_frame (lindex, areaid, sysid):
+    """Get a LAN IIH from the neighbor listing the replay link so the adjacency comes up"""
+    iih, buf, tlvview = pdu.get_pdu_buffer(clns.originatingLxLSPBufferSize(lindex),
+                                           clns.PDU_TYPE_IIH_LAN_LX[lindex])
+    tlvspace = len(tlvview)
+    iih.circuit_type = clns.CTYPE_L12
+    memcpy(iih.source_id, sysid)
+    iih.hold_time = 3600
+    iih.priority = 64
+    memcpy(iih.lan_id, sysid + b"\x01")
+    tlvview = tlv.tlv_append(tlvview, tlv.TLV_AREA_ADDRS, struct.pack("B", len(areaid)) + areaid)
+    tlvview = tlv.tlv_append(tlvview, tlv.TLV_IS_NEIGHBORS, REPLAY_MAC)
+    tlvview = tlv.tlv_append(tlvview, tlv.TLV_NLPID, struct.pack("B", clns.NLPID_IPV4))
+    iih.pdu_len = sizeof(iih) + tlvspace - len(tlvview)
+    return get_frame(memoryview(buf)[:iih.pdu_len], lindex)
+
+
+def generate (path, name, count, seed, interval):
+    """Write a capture of a neighbor flooding the LSDB of a synthetic topology"""
+    topo = topology.TOPOLOGIES[name](count, random.Random(seed))
+    inst = get_instance(clns.CTYPE_L1, clns.iso_encode("49.0001"))
+    pdus = topology.get_lsdb_pdus(inst, 0, topo)
+    writer = pcap.PcapWriter(path)
+    ts_ns = pcap.get_time_ns()
+    writer.write("replay0", ts_ns, get_iih_frame(0, inst.areaid, topology.get_sysid(0xFFFFFFE)),
+                 pcap.DIR_INBOUND)
+    for pdubuf in pdus:
+        ts_ns += int(interval * 1000000000)
+        writer.write("replay0", ts_ns, get_frame(pdubuf, 0), pcap.DIR_INBOUND)
+    writer.close()
+    print("Wrote {} LSPs of a {} node {} topology to {}".format(len(pdus), len(topo), name, path))
+
+
+def replay (inst, path, speed):
+    """Feed the received frames in a capture to replay links.
+
+    With speed 0 frames are fed as fast as possible, otherwise at speed times
+    the captured rate.
+    """
+    links = {}
+    latencies = []
+    first_ts = None
+    start = default_timer()
+    cpu = get_cpu_s()
+    for ifname, ts_ns, direction, data in pcap.read_pcap(path):
+        if direction == pcap.DIR_OUTBOUND:
+            continue
+        rlink = links.get(ifname)
+        if rlink is None:
+            index = len(inst.linkdb.links) + len(links)
+            rlink = links[ifname] = link.LanLink(inst.linkdb, ifname or "replay0", index,
+                                                 clns.CTYPE_L12 & inst.is_type)
+        if speed:
+            if first_ts is None:
+                first_ts = ts_ns
+            delay = (ts_ns - first_ts) / 1000000000 / speed - (default_timer() - start)
+            if delay > 0:
+                time.sleep(delay)
+        # Received frames are in a buffer of their own.
+        pkt = memoryview(bytearray(data))
+        fstart = default_timer()
+        rlink.receive_packet(pkt)
+        latencies.append(default_timer() - fstart)
+    elapsed = default_timer() - start
+
+    latencies.sort()
+    result = {
+        "capture": os.path.basename(path),
+        "pdus": len(latencies),
+        "elapsed_s": elapsed,
+        "cpu_s": get_cpu_s() - cpu,
+        "p50_s": get_percentile(latencies, 50),
+        "p99_s": get_percentile(latencies, 99),
+        "pdu_rate": len(latencies) / elapsed if elapsed else 0,
+        "lsps": sum(len(x.dbhash) for x in inst.update if x is not None),
+    }
+    return result
+
+
+def print_result (result):
+    print("{capture:>20} {pdus:>8} pdus {lsps:>8} lsps {pdu_rate:>10.0f} pdus/s".format(**result))
+    for key in sorted(result):
+        if key.endswith("_s"):
+            print("    {:<16} {:>10.3f} ms".format(key[:-2], result[key] * 1000))
+
+
+def compare (result, baseline, threshold):
+    """Return the list of timings that regressed more than threshold percent"""
+    regressions = []
+    for old in baseline:
+        if old["capture"] != result["capture"]:
+            continue
+        for key in sorted(result):
+            if not key.endswith("_s") or not old.get(key):
+                continue
+            change = (result[key] - old[key]) * 100 / old[key]
+            if change > threshold:
+                regressions.append((key, change))
+    return regressions
+
+
+def main ():
+    parser = argparse.ArgumentParser("bench_replay")
+    parser.add_argument('capture', help='The pcap-ng or pcap file to replay')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='Replay at this multiple of the captured rate, 0 is flat out')
+    parser.add_argument('--is-type', default='l1', choices=["l1", "l2", "l12"],
+                        help='The is-type of the instance')
+    parser.add_argument('-a', '--areaid', default='49.0001', help='The area id')
+    parser.add_argument('--generate', choices=sorted(topology.TOPOLOGIES),
+                        help='Write a capture of flooding a synthetic LSDB rather than replay')
+    parser.add_argument('--nodes', type=int, default=1000,
+                        help='Approximate node count of the generated topology')
+    parser.add_argument('--interval', type=float, default=clns.MIN_BCAST_LSP_TX_INTERVAL,
+                        help='Seconds between the generated LSPs')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='Percent slowdown vs baseline considered a regression')
+    args = parser.parse_args()
+
+    logbook.NullHandler().push_application()
+
+    if args.generate:
+        generate(args.capture, args.generate, args.nodes, args.seed, args.interval)
+        return
+
+    is_type = { "l1": clns.CTYPE_L1, "l2": clns.CTYPE_L2, "l12": clns.CTYPE_L12 }[args.is_type]
+    inst = get_instance(is_type, clns.iso_encode(args.areaid))
+    result = replay(inst, args.capture, args.speed)
+    print_result(result)
+
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump([ result ], jfile, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as jfile:
+            regressions = compare(result, json.load(jfile), args.threshold)
+        for key, change in regressions:
+            print("REGRESSION: {} {} +{:.1f}%".format(result["capture"], key, change))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,249 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Benchmark SPF and route computation on synthetic LSDBs.
+
+The LSDB is built by receiving generated LSP PDUs through the update process,
+so snapshot timing includes the real LSDB. Run from the top of the tree::
+
+    python -m benchmarks.bench_spf --topology grid --nodes 1000 10000
+    python -m benchmarks.bench_spf --json results.json
+    python -m benchmarks.bench_spf --baseline results.json --threshold 20
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from timeit import default_timer
+
+import argparse
+import gc
+import json
+import logbook
+import random
+import sys
+import pyisis.clns as clns
+import pyisis.instance as instance
+import pyisis.spf as spf
+import benchmarks.topology as topology
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_maxrss_kb ():
+    if not resource:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Darwin reports bytes everyone else kilobytes.
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def timed (func, *args):
+    start = default_timer()
+    rv = func(*args)
+    return rv, default_timer() - start
+
+
+def best_of (repeat, func, *args):
+    best = None
+    for unused in range(0, repeat):
+        rv, elapsed = timed(func, *args)
+        if best is None or elapsed < best:
+            best = elapsed
+    return rv, best
+
+
+def get_instance ():
+    inst = instance.Instance(clns.CTYPE_L1, clns.iso_encode("49.0001"),
+                             topology.get_sysid(0xFFFFFFF), 64, spf_workers=0)
+    # Keep the timer driven machinery out of the measurements.
+    inst.decision = [ None, None ]
+    inst.update[0].our_lsp.gen_timer.stop()
+    return inst
+
+
+def change_one_metric (topo, rand, spt):
+    """Change the metric of an adjacency of a node in spt, return the changed system-id"""
+    sysid = rand.choice(sorted(x[:clns.CLNS_SYSID_LEN] for x in spt
+                               if spt[x][1] and not spf.is_pnode(x)))
+    nbr = sorted(topo[sysid])[0]
+    topo[sysid][nbr] += 1
+    return sysid
+
+
+def run_one (name, count, repeat, workers, seed):
+    rand = random.Random(seed)
+    topo = topology.TOPOLOGIES[name](count, rand)
+    sysids = sorted(topo)
+    result = { "topology": name, "nodes": len(topo) }
+
+    inst = get_instance()
+    uproc = inst.update[0]
+    link = topology.BenchLink(inst.linkdb)
+
+    pdus, result["lsp_gen_s"] = timed(topology.get_lsdb_pdus, inst, 0, topo)
+    result["lsps"] = len(pdus)
+    if tracemalloc:
+        tracemalloc.start()
+    unused, result["lsdb_load_s"] = timed(topology.inject, uproc, link, pdus)
+    del pdus
+    if tracemalloc:
+        result["lsdb_bytes"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    # The root must be one of the synthetic nodes; LSPs with our own system-id
+    # are purged rather than installed.
+    root = sysids[0] + b"\x00"
+    gc.collect()
+
+    snapshot, result["snapshot_s"] = best_of(repeat, spf.get_snapshot, uproc)
+    spt, result["spt_s"] = best_of(repeat, spf.compute_spt, snapshot, root)
+    routes, result["routes_s"] = best_of(repeat, spf.compute_routes, snapshot, spt)
+    result["full_spf_s"] = result["snapshot_s"] + result["spt_s"] + result["routes_s"]
+    result["routes"] = len(routes)
+    sysid = change_one_metric(topo, rand, spt)
+
+    # Measure memory separately as tracing slows everything down.
+    if tracemalloc:
+        del snapshot, spt
+        gc.collect()
+        tracemalloc.start()
+        snapshot = spf.get_snapshot(uproc)
+        spf.compute_routes(snapshot, spf.compute_spt(snapshot, root))
+        result["spf_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # Incremental: a single link metric change received from the network.
+    index = sysids.index(sysid)
+    pdus = topology.get_node_pdus(inst, 0, sysid, topo[sysid],
+                                  [ (topology.get_loopback(index), 32, 0) ], 2)
+    start = default_timer()
+    topology.inject(uproc, link, pdus)
+    snapshot = spf.get_snapshot(uproc)
+    spt2, routes2 = spf.run_spf(snapshot, root)
+    result["incremental_s"] = default_timer() - start
+    unused = spf.route_delta(routes, routes2)
+
+    # Partial route calculation: a prefix only change reuses the SPT.
+    pdus = topology.get_node_pdus(inst, 0, sysid, topo[sysid],
+                                  [ (topology.get_loopback(index), 32, 0),
+                                    (topology.get_loopback(len(topo) + 1), 32, 5) ], 3)
+    start = default_timer()
+    topology.inject(uproc, link, pdus)
+    snapshot = spf.get_snapshot(uproc)
+    routes3 = spf.compute_routes(snapshot, spt2)
+    result["prc_s"] = default_timer() - start
+    # The new prefix is only routed if the changed node is still reachable.
+    expect = len(routes2) + (1 if sysid + b"\x00" in spt2 else 0)
+    if len(routes3) != expect:
+        print("WARNING: {} {}: PRC computed {} routes expected {}".format(
+            name, count, len(routes3), expect), file=sys.stderr)
+
+    if workers:
+        executor = spf.SPFExecutor(workers)
+        try:
+            # Prime the pool so process startup isn't measured.
+            executor.submit(spf.run_spf, {}, root).result()
+            unused, result["pool_spf_s"] = best_of(repeat,
+                                                   lambda: executor.submit(spf.run_spf,
+                                                                           snapshot,
+                                                                           root).result())
+        finally:
+            executor.shutdown()
+
+    result["maxrss_kb"] = get_maxrss_kb()
+    return result
+
+
+def print_result (result):
+    print("{topology:>14} {nodes:>7} nodes {lsps:>7} lsps {routes:>7} routes".format(**result))
+    for key in sorted(result):
+        if key.endswith("_s"):
+            print("    {:<16} {:>10.2f} ms".format(key[:-2], result[key] * 1000))
+    for key in ("lsdb_bytes", "spf_peak_bytes"):
+        if key in result:
+            print("    {:<16} {:>10.1f} MiB".format(key[:-6], result[key] / (1 << 20)))
+    print("    {:<16} {:>10.1f} MiB".format("maxrss", result["maxrss_kb"] / 1024))
+
+
+def compare (results, baseline, threshold):
+    """Return the list of timings that regressed more than threshold percent"""
+    base = dict(((r["topology"], r["nodes"]), r) for r in baseline)
+    regressions = []
+    for result in results:
+        old = base.get((result["topology"], result["nodes"]))
+        if not old:
+            continue
+        for key in sorted(result):
+            if not key.endswith("_s") or not old.get(key):
+                continue
+            change = (result[key] - old[key]) * 100 / old[key]
+            if change > threshold:
+                regressions.append((result["topology"], result["nodes"], key, change))
+    return regressions
+
+
+def main ():
+    parser = argparse.ArgumentParser("bench_spf")
+    parser.add_argument('--topology', nargs="+", choices=sorted(topology.TOPOLOGIES),
+                        default=sorted(topology.TOPOLOGIES), help='Topologies to run')
+    parser.add_argument('--nodes', nargs="+", type=int, default=[ 1000, 10000 ],
+                        help='Approximate node counts to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Take the best of repeat runs')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Also time SPF submitted to a pool of this many workers')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='Percent slowdown vs baseline considered a regression')
+    args = parser.parse_args()
+
+    logbook.NullHandler().push_application()
+
+    results = []
+    for name in args.topology:
+        for count in args.nodes:
+            result = run_one(name, count, args.repeat, args.workers, args.seed)
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump(results, jfile, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as jfile:
+            regressions = compare(results, json.load(jfile), args.threshold)
+        for name, count, key, change in regressions:
+            print("REGRESSION: {} {} {} +{:.1f}%".format(name, count, key, change))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
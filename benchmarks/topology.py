@@ -0,0 +1,285 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Synthetic topologies and LSDBs for benchmarking.
+
+A topology is a dictionary keyed by system-id of { neighbor-system-id: metric }
+(always symmetric). Each node also advertises a /32 loopback prefix.
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from ctypes import sizeof
+from pyisis.bstr import bchr, memspan                       # pylint: disable=E0611
+from pyisis.lib.cksum import iso_cksum
+from pyisis.lib.util import xrange3
+
+import math
+import random
+import struct
+import pyisis.clns as clns
+import pyisis.lsp as lsp
+import pyisis.pdu as pdu
+import pyisis.tlv as tlv
+import pyisis.lib.util as util
+
+DEFAULT_METRIC = 10
+
+
+def get_sysid (index):
+    return struct.pack(">HI", 0x1000, index)
+
+
+def get_loopback (index):
+    return struct.pack(">I", 0x0a000000 + index)
+
+
+def _add_link (topo, a, b, metric=DEFAULT_METRIC):
+    if a == b:
+        return
+    topo[get_sysid(a)][get_sysid(b)] = metric
+    topo[get_sysid(b)][get_sysid(a)] = metric
+
+
+def _new_topology (count):
+    return dict((get_sysid(i), {}) for i in xrange3(0, count))
+
+
+def grid (count, unused_rand=None):
+    """A square grid with each node connected to its 4 neighbors"""
+    side = int(math.ceil(math.sqrt(count)))
+    count = side * side
+    topo = _new_topology(count)
+    for i in xrange3(0, count):
+        if (i + 1) % side:
+            _add_link(topo, i, i + 1)
+        if i + side < count:
+            _add_link(topo, i, i + side)
+    return topo
+
+
+def clos (count, unused_rand=None):
+    """A k-ary fat-tree (5k^2/4 switches) with k chosen to get close to count"""
+    k = max(4, int(round(math.sqrt(count * 4 / 5))))
+    k += k % 2
+    half = k // 2
+    ncore = half * half
+    topo = _new_topology(ncore + k * k)
+    for pod in xrange3(0, k):
+        aggbase = ncore + pod * k
+        edgebase = aggbase + half
+        for a in xrange3(0, half):
+            for c in xrange3(0, half):
+                _add_link(topo, aggbase + a, a * half + c)
+            for e in xrange3(0, half):
+                _add_link(topo, aggbase + a, edgebase + e)
+    return topo
+
+
+def _largest_component (topo):
+    """Return the largest connected component of topo renumbered from 0"""
+    seen = set()
+    best = []
+    for sysid in sorted(topo):
+        if sysid in seen:
+            continue
+        seen.add(sysid)
+        component = [ sysid ]
+        stack = [ sysid ]
+        while stack:
+            for nbr in topo[stack.pop()]:
+                if nbr not in seen:
+                    seen.add(nbr)
+                    component.append(nbr)
+                    stack.append(nbr)
+        if len(component) > len(best):
+            best = component
+    index = dict((sysid, get_sysid(i)) for i, sysid in enumerate(sorted(best)))
+    return dict((index[sysid], dict((index[nbr], metric) for nbr, metric in topo[sysid].items()))
+                for sysid in best)
+
+
+def geometric (count, rand=None, degree=6):
+    """Random geometric graph in a unit square with average degree about degree.
+
+    Only the largest connected component is kept so there may be a few percent
+    fewer than count nodes.
+    """
+    rand = rand or random.Random(count)
+    radius = math.sqrt(degree / (math.pi * count))
+    cells = max(1, int(1 / radius))
+    buckets = {}
+    points = []
+    for i in xrange3(0, count):
+        x, y = rand.random(), rand.random()
+        points.append((x, y))
+        buckets.setdefault((int(x * cells), int(y * cells)), []).append(i)
+
+    topo = _new_topology(count)
+    r2 = radius * radius
+    for i, (x, y) in enumerate(points):
+        cx, cy = int(x * cells), int(y * cells)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in buckets.get((cx + dx, cy + dy), ()):
+                    if j <= i:
+                        continue
+                    ox, oy = points[j]
+                    d2 = (x - ox) ** 2 + (y - oy) ** 2
+                    if d2 <= r2:
+                        _add_link(topo, i, j, 1 + int(math.sqrt(d2) / radius * 99))
+    return _largest_component(topo)
+
+
+def hub_and_spoke (count, unused_rand=None):
+    """Fully meshed hubs with each spoke dual-homed to two hubs"""
+    hubs = max(4, count // 2000)
+    topo = _new_topology(count)
+    for a in xrange3(0, hubs):
+        for b in xrange3(a + 1, hubs):
+            _add_link(topo, a, b)
+    for i in xrange3(hubs, count):
+        _add_link(topo, i, i % hubs)
+        _add_link(topo, i, (i + 1) % hubs)
+    return topo
+
+
+TOPOLOGIES = {
+    "grid": grid,
+    "clos": clos,
+    "geometric": geometric,
+    "hub-and-spoke": hub_and_spoke,
+}
+
+
+#==================
+# LSP construction
+#==================
+
+
+class SyntheticLSP (lsp.OwnLSP):
+    """Generate the LSP segments for a synthetic node.
+
+    This uses the same buffer and TLV insertion machinery as our own LSP, but
+    rather than adding the segments to our DB the finished PDUs are collected
+    so that they may be received as if from the wire.
+    """
+    def __init__ (self, inst, lindex, sysid, seqno=1):
+        super(SyntheticLSP, self).__init__(inst, lindex)
+        self.nodeid = sysid + bchr(0)
+        self.seqno = seqno
+        self.pdus = []
+
+    def update_lsp_db (self, lsp, buf, tlvview):
+        tlvstart = self.get_tlv_start(lsp, buf)
+        lsp.pdu_len = sizeof(lsp) + memspan(tlvstart, tlvview)
+        lsp.seqno = self.seqno
+        lsp.lifetime = clns.CLNS_MAX_AGE
+        lsp.checksum = 0
+        pdubuf = memoryview(buf)[:lsp.pdu_len]
+        ckoff = pdu.LSPPDU.lspid.offset                     # pylint: disable=E1101
+        lsp.checksum = iso_cksum(pdubuf[ckoff:], 12)
+        self.pdus.append(bytearray(pdubuf))
+
+    def generate (self, nbrs, prefixes):
+        def nbr_iter ():
+            for nbr, metric in sorted(nbrs.items()):
+                yield tlv.ExtISReachEntryStruct.pack(nbr + bchr(0),
+                                                     tlv.get_3byte_metric_str(metric),
+                                                     0)
+
+        def prefix_iter ():
+            for addr, pfxlen, metric in prefixes:
+                yield tlv.get_ext_ipv4_prefix_value(addr, pfxlen, metric)
+
+        buflist = []
+        tlvview, buflist = tlv.tlv_insert_value(tlv.TLV_NLPID,
+                                                None,
+                                                bchr(clns.NLPID_IPV4),
+                                                self.get_new_buf,
+                                                buflist)
+        tlvview, buflist = tlv.tlv_insert_entries(tlv.TLV_EXT_IS_REACH,
+                                                  tlvview,
+                                                  nbr_iter,
+                                                  self.get_new_buf,
+                                                  buflist)
+        tlvview, buflist = tlv.tlv_insert_entries(tlv.TLV_EXT_IPV4_PREFIX,
+                                                  tlvview,
+                                                  prefix_iter,
+                                                  self.get_new_buf,
+                                                  buflist)
+        lsp, buf, unused = buflist[-1]
+        self.close_lsp(lsp, buf, tlvview)
+        return self.pdus
+
+
+def get_node_pdus (inst, lindex, sysid, nbrs, prefixes, seqno=1):
+    return SyntheticLSP(inst, lindex, sysid, seqno).generate(nbrs, prefixes)
+
+
+def get_lsdb_pdus (inst, lindex, topo):
+    """Return the list of LSP PDUs for an entire topology"""
+    pdus = []
+    for index, sysid in enumerate(sorted(topo)):
+        prefixes = [ (get_loopback(index), 32, 0) ]
+        pdus.extend(get_node_pdus(inst, lindex, sysid, topo[sysid], prefixes))
+    return pdus
+
+
+#===========
+# Injection
+#===========
+
+
+class BenchLink (object):
+    """The minimal link interface used by the update process when receiving LSPs"""
+    def __init__ (self, linkdb):
+        self.linkdb = linkdb
+        # Not in the linkdb so it never has flags set
+        self.index = len(linkdb.links)
+
+    def __str__ (self):
+        return "BenchLink"
+
+    def is_p2p (self):
+        return False
+
+    def set_srm_flag (self, lspseg):
+        pass
+
+    def clear_srm_flag (self, lspseg):
+        pass
+
+    def set_ssn_flag (self, lspseg):
+        pass
+
+    def clear_ssn_flag (self, lspseg):
+        pass
+
+
+def receive_pdu (uproc, link, pdubuf):
+    frame = util.cast_as(pdubuf, pdu.LSPPDU)
+    tlvs = tlv.parse_tlvs(memoryview(pdubuf)[frame.clns_len:], False)
+    uproc.receive_lsp(link, None, pdubuf, frame, tlvs)
+
+
+def inject (uproc, link, pdus):
+    for pdubuf in pdus:
+        receive_pdu(uproc, link, pdubuf)
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
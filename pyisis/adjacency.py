@@ -70,6 +70,11 @@ class AdjLinkDB (object):
                     yield adj
 
     def update_adjacency (self, iih, tlvs):
+        """Update or create the adjacency for a received IIH.
+
+        Returns (dis-election-info-changed, nexthops-changed) the latter is
+        True when the adjacency came up or went down or its addresses changed.
+        """
         with self.rlock:
             snpa = stringify3(iih.ether_src)
             source_id = stringify3(iih.source_id)
@@ -84,11 +89,12 @@ class AdjLinkDB (object):
 
                 # If our new adjacency is UP then we want to run dis election.
                 if adj.state == adj.ADJ_STATE_UP:
-                    return True
+                    return True, True
+                return False, False
             else:
                 # If the system ID changed ignore the iih.
                 if adj.sysid != source_id:
-                    return False
+                    return False, False
                 return adj.update(iih, tlvs)
 
     def expire_adjacency (self, adj):
@@ -105,6 +111,8 @@ class AdjLinkDB (object):
         if dis_election_change:
             logger.info("TRAP: adjacencyStateChange: Down: {}: Hold time expired", adj)
             self.link.dis_election_info_changed(self.lindex)
+            self.link.linkdb.flood_nbrs_changed(self.lindex)
+            self.link.linkdb.nexthops_changed(self.lindex)
 
 
 class Adjacency (object):
@@ -130,6 +138,7 @@ class Adjacency (object):
         self.hold_timer = timers.Timer(adjdb.timerheap, 0, self.expire)
 
         self.areas = []
+        self.ipv4_addrs = []
         self.hold_time = None
         self.priority = None
         self.state = self.ADJ_STATE_DOWN
@@ -144,9 +153,15 @@ class Adjacency (object):
             dis_info_changed = False
 
         # Area TLV for Level-1 IIH acceptance has guaranteed
-        # that we have only 1 area TLV and a match somewhere.
+        # that we have only 1 area TLV and a match somewhere. The
+        # TLVs are views of a receive buffer that is reused so copy.
         if self.lindex == 0:
-            self.areas = tlvs[tlv.TLV_AREA_ADDRS][0]
+            self.areas = [ stringify3(x) for x in tlvs[tlv.TLV_AREA_ADDRS][0].addrs ]
+
+        # Neighbor interface addresses are used as route nexthops.
+        ipv4_addrs = [ x.packed for t in tlvs[tlv.TLV_IPV4_INTF_ADDRS] for x in t.addrs ]
+        addrs_changed = ipv4_addrs != self.ipv4_addrs
+        self.ipv4_addrs = ipv4_addrs
 
         old_state = self.state
         self.state = self.ADJ_STATE_INITIAL
@@ -169,7 +184,9 @@ class Adjacency (object):
             elif old_state == self.ADJ_STATE_UP:
                 dis_info_changed = True
                 logger.info("TRAP: adjacencyStateChange: Down: {}", self)
-        return dis_info_changed
+        nexthops_changed = dis_info_changed or (addrs_changed and
+                                                self.state == self.ADJ_STATE_UP)
+        return dis_info_changed, nexthops_changed
 
     def expire (self):
         self.adjdb.expire_adjacency(self)
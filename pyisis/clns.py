@@ -235,6 +235,19 @@ CTYPE_L12 = 3
 
 CLNS_MAX_AGE = 1200
 
+MIN_BCAST_LSP_TX_INTERVAL = .033
+"""ISO10589:2002 minimumBroadcastLSPTransmissionInterval (seconds)"""
+
+LSP_TX_BURST = 10
+"""Number of LSPs that may be sent back-to-back before pacing"""
+
+PSNP_INTERVAL = .5
+"""Seconds to accumulate SSN flags before sending PSNPs. This is less than the
+ISO10589:2002 partialSNPInterval (2s) as on a LAN a PSNP requests LSPs."""
+
+LSP_GEN_WAIT = (.05, .2, 5)
+"""LSP generation throttle initial, secondary and maximum wait (seconds)"""
+
 
 def dataLinkBlocksize(unused):
     """ISO10589:2002 MTU of interface"""
@@ -0,0 +1,232 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Dynamic flooding (RFC 9667) using a distributed flooding topology.
+
+Every router runs the same deterministic algorithm over the LSDB, so all
+routers agree on the flooding topology (FT) without it being advertised. The
+FT is a degree limited spanning tree of each connected part of the topology
+with every router that is a leaf of the tree given a second FT neighbor where
+it has one, so most routers receive about 2 copies of each LSP rather than one
+per adjacency.
+
+Pseudonodes are nodes in the graph, flooding on a LAN reaches all of its
+members so a pseudonode FT edge is one copy.
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from collections import deque
+import logbook
+import threading
+import pyisis.clns as clns
+import pyisis.spf as spf
+
+logger = logbook.Logger(__name__)
+
+# Tree nodes stop taking children at this degree while others can.
+FT_MAX_DEGREE = 4
+
+
+def get_graph (topology):
+    """Get the graph of two-way connected nodes from an update process topology.
+
+    The topology is a dictionary keyed by LSP-ID of (overload, ((nbr, metric), ...)).
+    """
+    adv = {}
+    for lspid, topo in topology.items():
+        if topo is None:
+            continue
+        nodeid = lspid[:clns.CLNS_NODEID_LEN]
+        nbrs = adv.setdefault(nodeid, set())
+        nbrs.update(nbr for nbr, unused in topo[1])
+    graph = {}
+    for nodeid, nbrs in adv.items():
+        graph[nodeid] = set(nbr for nbr in nbrs
+                            if nbr != nodeid and nbr in adv and nodeid in adv[nbr])
+    return graph
+
+
+def _add_edge (ft, a, b):
+    ft.setdefault(a, set()).add(b)
+    ft.setdefault(b, set()).add(a)
+
+
+def _grow_tree (graph, ft, seen, queue):
+    """Breadth first growth of the tree limiting the degree of each node"""
+    while queue:
+        nodeid = queue.popleft()
+        for nbr in sorted(graph[nodeid]):
+            if len(ft[nodeid]) >= FT_MAX_DEGREE:
+                break
+            if nbr not in seen:
+                seen.add(nbr)
+                _add_edge(ft, nodeid, nbr)
+                queue.append(nbr)
+
+
+def compute_flooding_topology (graph):
+    """Compute the flooding topology for a graph returning { nodeid: set(ft-nbrs) }"""
+    ft = dict((nodeid, set()) for nodeid in graph)
+
+    # A spanning tree for each connected part rooted at its lowest node-id.
+    seen = set()
+    for root in sorted(graph):
+        if root in seen:
+            continue
+        seen.add(root)
+        queue = deque([ root ])
+        _grow_tree(graph, ft, seen, queue)
+        while True:
+            # Nodes only adjacent to full tree nodes go to the least loaded one.
+            stranded = [ x for x in sorted(graph) if x not in seen and graph[x] & seen ]
+            if not stranded:
+                break
+            for nodeid in stranded:
+                unused, parent = min((len(ft[x]), x) for x in graph[nodeid] if x in seen)
+                seen.add(nodeid)
+                _add_edge(ft, parent, nodeid)
+                queue.append(nodeid)
+            _grow_tree(graph, ft, seen, queue)
+
+    # Pseudonodes that are tree leaves carry nothing, prune them.
+    leaves = [ x for x in sorted(ft) if spf.is_pnode(x) and len(ft[x]) == 1 ]
+    while leaves:
+        pnode = leaves.pop()
+        if len(ft[pnode]) != 1:
+            continue
+        nbr = ft[pnode].pop()
+        ft[nbr].discard(pnode)
+        if spf.is_pnode(nbr) and len(ft[nbr]) == 1:
+            leaves.append(nbr)
+
+    # Give routers with a single FT neighbor a second one (if they have one)
+    # preferring neighbors with the fewest FT neighbors.
+    for nodeid in sorted(ft):
+        if spf.is_pnode(nodeid) or len(ft[nodeid]) != 1:
+            continue
+        # A pseudonode edge only helps if the LAN reaches another router.
+        candidates = [ (len(ft[x]), x) for x in graph[nodeid]
+                       if x not in ft[nodeid] and (not spf.is_pnode(x) or len(graph[x]) > 1) ]
+        if not candidates:
+            continue
+        unused, nbr = min(candidates)
+        _add_edge(ft, nodeid, nbr)
+        if spf.is_pnode(nbr) and len(ft[nbr]) == 1:
+            others = [ (len(ft[x]), x) for x in graph[nbr] if x != nodeid ]
+            _add_edge(ft, nbr, min(others)[1])
+    return ft
+
+
+class FloodingTopology (object):
+    """The flooding topology for a level, recomputed as the LSDB topology changes"""
+
+    def __init__ (self, inst, lindex):
+        self.inst = inst
+        self.lindex = lindex
+        self.lock = threading.Lock()
+        self.version = None
+        self.graph = {}
+        self.ft = {}
+
+        # The flood mask is cached until the topology, our neighbors or the
+        # links change.
+        self.nbrs_version = 0
+        self.mask_key = None
+        self.mask = 0
+
+        # Statistics
+        self.computations = 0
+        self.temporary_additions = 0
+        self.partitioned_count = 0
+
+    def __str__ (self):
+        return "FloodingTopology(L{} nodes:{} computations:{})".format(self.lindex + 1,
+                                                                         len(self.ft),
+                                                                         self.computations)
+
+    def update (self):
+        """Recompute the flooding topology if the LSDB topology has changed"""
+        uproc = self.inst.update[self.lindex]
+        with self.lock:
+            with uproc.topo_lock:
+                if uproc.topology_version == self.version:
+                    return
+                version = uproc.topology_version
+                topology = dict(uproc.topology)
+            self.graph = get_graph(topology)
+            self.ft = compute_flooding_topology(self.graph)
+            self.version = version
+            self.computations += 1
+        logger.debug("{}: recomputed for topology version {}", self, version)
+
+    def nbrs_changed (self):
+        """The neighbors reached by flooding on a link changed (adjacency or DIS)"""
+        with self.lock:
+            self.nbrs_version += 1
+
+    def get_flood_mask (self, level_mask):
+        """Get the mask of links (by index) to flood LSPs on.
+
+        Links to an FT neighbor are included. Links to neighbors not yet in
+        the topology are temporarily added. If a FT neighbor is no longer
+        reachable over any link the FT may be partitioned so flood on all
+        links until the FT is recomputed. The mask is only computed again
+        after the topology or our neighbors change.
+        """
+        self.update()
+        nodeid = self.inst.sysid + b"\x00"
+        with self.lock:
+            key = (self.version, self.nbrs_version, level_mask)
+            if key == self.mask_key:
+                return self.mask
+            ftnbrs = self.ft.get(nodeid)
+            nbrs = self.graph.get(nodeid)
+        linkdb = self.inst.linkdb
+        with linkdb:
+            links = list(linkdb.links)
+        mask = self.compute_flood_mask(links, level_mask, ftnbrs, nbrs)
+        with self.lock:
+            # A change while computing leaves the key stale so it's recomputed.
+            self.mask_key = key
+            self.mask = mask
+        return mask
+
+    def compute_flood_mask (self, links, level_mask, ftnbrs, nbrs):
+        if not ftnbrs:
+            return level_mask
+
+        mask = 0
+        reached = set()
+        for link in links:
+            bit = 1 << link.index
+            if not level_mask & bit:
+                continue
+            lnbrs = link.get_flood_nbrs(self.lindex)
+            if lnbrs & ftnbrs:
+                mask |= bit
+                reached |= lnbrs & ftnbrs
+            elif lnbrs - nbrs:
+                mask |= bit
+                self.temporary_additions += 1
+        if reached != ftnbrs:
+            self.partitioned_count += 1
+            return level_mask
+        return mask
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -16,29 +16,86 @@
 #
 from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
 import pyisis.clns as clns
+import pyisis.flooding as flooding
+import pyisis.pipeline as pipeline
+import pyisis.rib as rib
+import pyisis.spf as spf
 import pyisis.update as update
 import pyisis.link as link
+import pyisis.lib.rawsock as rawsock
 import pyisis.lib.timers as timers
 import socket
 
 
 class Instance (object):
-    def __init__ (self, is_type, areaid, sysid, priority):
+    def __init__ (self, is_type, areaid, sysid, priority, spf_workers=2, rib_sinks=None,
+                  spt_cache_size=spf.SPT_CACHE_SIZE,
+                  lsp_tx_interval=clns.MIN_BCAST_LSP_TX_INTERVAL,
+                  lsp_tx_burst=clns.LSP_TX_BURST,
+                  dynamic_flooding=False,
+                  lsp_gen_wait=clns.LSP_GEN_WAIT,
+                  psnp_interval=clns.PSNP_INTERVAL,
+                  rx_ring_blocks=0,
+                  rx_batch=rawsock.RECV_BATCH,
+                  rx_workers=0,
+                  rx_fanout=1,
+                  rx_fanout_mode="hash",
+                  rx_hello_socket=False,
+                  intf_factory=None,
+                  spf_executor=None):
         self.is_type = is_type
         self.areaid = areaid
         self.sysid = sysid
         self.overload = False
+        self.lsp_tx_interval = lsp_tx_interval
+        self.lsp_tx_burst = lsp_tx_burst
+        self.lsp_gen_wait = lsp_gen_wait
+        self.psnp_interval = psnp_interval
+        self.rx_ring_blocks = rx_ring_blocks
+        self.rx_batch = rx_batch
+        self.rx_pipeline = pipeline.ReceivePipeline(rx_workers)
+        self.rx_fanout = rx_fanout
+        self.rx_fanout_mode = rx_fanout_mode
+        self.rx_hello_socket = rx_hello_socket
+        self.intf_factory = intf_factory
         self.linkdb = link.LinkDB(self)
         self.priority = priority
         self.update = [ None, None ]
+        self.decision = [ None, None ]
         self.timerheap = timers.TimerHeap("Instance")
+        self.rib = rib.RIB(rib_sinks)
+
+        # L1 and L2 SPF share the pool so both levels can run concurrently. A
+        # pool given to us (e.g., shared by simulated instances) isn't ours to
+        # shut down.
+        self.own_spf_executor = spf_executor is None
+        if spf_executor is None:
+            spf_executor = spf.SPFExecutor(spf_workers)
+        self.spf_executor = spf_executor
+        self.spt_cache = spf.SPTCache(spt_cache_size)
         if self.is_type & clns.CTYPE_L1:
+            self.decision[0] = spf.DecisionProcess(self, 0)
             self.update[0] = update.UpdateProcess(self, 0)
         if self.is_type & clns.CTYPE_L2:
+            self.decision[1] = spf.DecisionProcess(self, 1)
             self.update[1] = update.UpdateProcess(self, 1)
+
+        # Restrict flooding to a computed flooding topology (RFC 9667)
+        self.flooding = [ None, None ]
+        if dynamic_flooding:
+            for lindex in (0, 1):
+                if self.update[lindex]:
+                    self.flooding[lindex] = flooding.FloodingTopology(self, lindex)
         self.hostname = socket.gethostname().split('.')[0]
         self.hostname = self.hostname.encode('ascii')
 
+    def close (self):
+        """Shut down the worker processes started for this instance and close the RIB sinks"""
+        if self.own_spf_executor:
+            self.spf_executor.shutdown()
+        self.rx_pipeline.shutdown()
+        self.rib.close()
+
 
 __author__ = 'Christian Hopps'
 __date__ = 'November 1 2014'
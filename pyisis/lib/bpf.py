@@ -157,22 +157,85 @@ class BPFProgram (Structure):
         ("bf_len", c_uint),
         ("bf_insns", c_void_p), ]
 
-iso_filter = (  # pylint: disable=C0103
-    # 0: Load 2 bytes from offset 12
-    bpf_stmt(BPF_LD | BPF_H | BPF_ABS, 12) +
-    # 1: Jump fwd + 1 if 0x8870 (jumboframe) otherwise fwd + 0 (continue)
-    bpf_jump(BPF_JMP | BPF_JEQ, 0x8870, 1, 0) +
-    # 2: Jump fwd + 3 if > 1500 (drop) otherwise fwd + 0 (continue)
-    bpf_jump(BPF_JMP | BPF_JGT, 1500, 3, 0) +
-    # 3: Load 2 bytes from offset 14
-    bpf_stmt(BPF_LD | BPF_H | BPF_ABS, 14) +
-    # 4: Jump fwd + 0 if 0xfefe (keep) otherwise fwd + 1 (drop)
-    bpf_jump(BPF_JMP | BPF_JEQ, 0xfefe, 0, 1) +
-    # 5: Keep
-    bpf_stmt(BPF_RET, 0xffff) +
-    # 6: Drop
-    bpf_stmt(BPF_RET, 0)
-)
+ETHERTYPE_JUMBO = 0x8870
+LLC_ISO = 0xfefe
+PDU_TYPE_OFF = 21
+"""Offset of the PDU type byte in an 802.3 LLC framed ISO PDU"""
+
+FILTER_KEEP = -1
+FILTER_DROP = -2
+
+
+def _filter_jump (target, index, count):
+    # Keep and drop are the two return instructions following the count others.
+    if target == FILTER_KEEP:
+        target = count - index - 1
+    elif target == FILTER_DROP:
+        target = count - index
+    assert 0 <= target <= 0xff
+    return target
+
+
+def _mac_jumps (off, mac, jt, jf):
+    """Instructions jumping to jt if the MAC at off is mac otherwise jf"""
+    hi, lo = struct.unpack(">IH", mac)
+    # Relative jumps are from the last jump, the first skips the 2 between.
+    return [ (BPF_LD | BPF_W | BPF_ABS, off),
+             (BPF_JMP | BPF_JEQ, hi, 0, jf + 2 if jf >= 0 else jf),
+             (BPF_LD | BPF_H | BPF_ABS, off + 4),
+             (BPF_JMP | BPF_JEQ, lo, jt, jf) ]
+
+
+def get_iso_filter (dst_macs=None, src_mac=None, pdu_types=None):
+    """Compile a filter for ISO frames into classic BPF.
+
+    Only frames sent to one of dst_macs, not sent from src_mac and with one of
+    pdu_types are kept, a check is skipped if its argument is None.
+    """
+    insns = [
+        (BPF_LD | BPF_H | BPF_ABS, 12),
+        (BPF_JMP | BPF_JEQ, ETHERTYPE_JUMBO, 1, 0),
+        (BPF_JMP | BPF_JGT, 1500, FILTER_DROP, 0),
+        (BPF_LD | BPF_H | BPF_ABS, 14),
+        (BPF_JMP | BPF_JEQ, LLC_ISO, 0, FILTER_DROP),
+    ]
+    if dst_macs:
+        dst_macs = sorted(set(dst_macs))
+        for index, mac in enumerate(dst_macs):
+            # A match skips the remaining MACs, the last mismatch drops.
+            if index == len(dst_macs) - 1:
+                insns.extend(_mac_jumps(0, mac, 0, FILTER_DROP))
+            else:
+                insns.extend(_mac_jumps(0, mac, 4 * (len(dst_macs) - index - 1), 0))
+    if src_mac:
+        insns.extend(_mac_jumps(6, src_mac, FILTER_DROP, 0))
+    if pdu_types:
+        pdu_types = sorted(set(pdu_types))
+        insns.append((BPF_LD | BPF_B | BPF_ABS, PDU_TYPE_OFF))
+        insns.append((BPF_ALU | BPF_AND | BPF_K, 0x1f))
+        for index, pdu_type in enumerate(pdu_types):
+            jf = FILTER_DROP if index == len(pdu_types) - 1 else 0
+            insns.append((BPF_JMP | BPF_JEQ, pdu_type, FILTER_KEEP, jf))
+
+    count = len(insns)
+    program = b""
+    for index, insn in enumerate(insns):
+        if len(insn) == 2:
+            program += bpf_stmt(*insn)
+        else:
+            code, k, jt, jf = insn
+            program += bpf_jump(code, k, _filter_jump(jt, index, count),
+                                _filter_jump(jf, index, count))
+    return program + bpf_stmt(BPF_RET, 0xffff) + bpf_stmt(BPF_RET, 0)
+
+
+IIH_PDU_TYPES = (clns.PDU_TYPE_IIH_LAN_L1, clns.PDU_TYPE_IIH_LAN_L2)
+NON_IIH_PDU_TYPES = tuple(clns.PDU_TYPE_LSP_LX + clns.PDU_TYPE_CSNP_LX + clns.PDU_TYPE_PSNP_LX)
+
+iso_filter = get_iso_filter()                               # pylint: disable=C0103
+iso_iih_filter = get_iso_filter(pdu_types=IIH_PDU_TYPES)    # pylint: disable=C0103
+iso_non_iih_filter = get_iso_filter(pdu_types=NON_IIH_PDU_TYPES)  # pylint: disable=C0103
+drop_filter = bpf_stmt(BPF_RET, 0)                          # pylint: disable=C0103
 
 
 class BPFInterface (object):
@@ -207,6 +270,9 @@ class BPFInterface (object):
         assert rval is not None
         self.buflen = struct.unpack("I", rval)[0]
 
+    def close (self):
+        self.bpf.close()
+
     def set_filter (self, insns):
         bf_len = len(insns) // sizeof(BPFInsn)
         bf_insns = cast(insns, c_void_p)
@@ -228,6 +294,13 @@ class BPFInterface (object):
         # Pkt points to actual packet data.
         return pkt[hdrlen:caplen + hdrlen]
 
+    def recv_pkts (self):
+        pkt = self.recv_pkt()
+        return [ pkt ] if pkt else []
+
+    def release_pkts (self):
+        pass
+
     def fileno (self):
         return self.bpf.fileno()
 
@@ -237,6 +310,18 @@ class BPFInterface (object):
     def writev (self, buffers):
         return writev(self.bpf, buffers)
 
+    def sendmmsg (self, frames):
+        """Send a list of frames (each a list of buffers) returning the number sent"""
+        # BPF devices only take one frame per write.
+        for count, frame in enumerate(frames):
+            try:
+                writev(self.bpf, frame)
+            except (IOError, OSError) as ex:
+                if count and ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    return count
+                raise
+        return len(frames)
+
     def get_if_addrs (self):
         ifname = self.name
         # codes are different for mac and linux
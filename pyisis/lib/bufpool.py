@@ -0,0 +1,83 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""A pool of reusable receive buffers.
+
+Frames are received into buffers taken from the pool and the buffers are put
+back once the frame has been processed. A buffer the receiver keeps (e.g., the
+LSDB copy of an LSP) is marked retained and is not put back, the pool allocates
+a replacement when it next runs short.
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+import threading
+
+
+class PoolBuffer (bytearray):
+    """A bytearray from a BufferPool"""
+    __slots__ = ("retained", )
+
+
+def retain (buf):
+    """Mark buf (if from a pool) as kept by its receiver so it is never reused"""
+    if isinstance(buf, PoolBuffer):
+        buf.retained = True
+
+
+class BufferPool (object):
+    """A pool of size byte buffers keeping up to count free buffers"""
+
+    def __init__ (self, size, count):
+        self.size = size
+        self.count = count
+        self.lock = threading.Lock()
+        self.free = [ self.alloc() for unused in range(0, count) ]
+
+        # Statistics
+        self.allocated = count
+        self.reused = 0
+        self.retained = 0
+
+    def __str__ (self):
+        return "BufferPool(size:{} free:{} allocated:{} reused:{} retained:{})".format(
+            self.size, len(self.free), self.allocated, self.reused, self.retained)
+
+    def alloc (self):
+        buf = PoolBuffer(self.size)
+        buf.retained = False
+        return buf
+
+    def get (self):
+        """Get a buffer from the pool, allocating one if the pool is empty"""
+        with self.lock:
+            if self.free:
+                self.reused += 1
+                return self.free.pop()
+            self.allocated += 1
+        return self.alloc()
+
+    def put (self, buf):
+        """Return a buffer to the pool unless it has been retained"""
+        with self.lock:
+            if buf.retained:
+                self.retained += 1
+            elif len(self.free) < self.count:
+                self.free.append(buf)
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
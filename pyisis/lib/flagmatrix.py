@@ -0,0 +1,140 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""A matrix of per (slot, column) flags backed by bit arrays.
+
+Each slot holds an object (e.g., an LSP segment) and a row per flag, the
+object records its slot in a ``slot`` attribute. A row is
+an integer used as a bit array indexed by column (e.g., link index), so setting
+or clearing a flag for many columns at once is a single operation. Slots with
+any bit set are tracked per flag so scanning a column only visits pending work.
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+import threading
+
+
+class FlagMatrix (object):
+    """Flags indexed by slot and column"""
+
+    def __init__ (self, nflags=2):
+        self.lock = threading.Lock()
+        self.objs = []
+        self.free = []
+        self.rows = [ [] for unused in range(0, nflags) ]
+        self.pending = [ set() for unused in range(0, nflags) ]
+
+    def __len__ (self):
+        return len(self.objs) - len(self.free)
+
+    def alloc_slot (self, obj):
+        """Allocate a slot for obj setting obj.slot"""
+        with self.lock:
+            if self.free:
+                slot = self.free.pop()
+                self.objs[slot] = obj
+            else:
+                slot = len(self.objs)
+                self.objs.append(obj)
+                for rows in self.rows:
+                    rows.append(0)
+            obj.slot = slot
+
+    def free_slot (self, obj):
+        """Free the slot of obj clearing all of its flags"""
+        with self.lock:
+            slot = obj.slot
+            if self.objs[slot] is not obj:
+                return
+            self.objs[slot] = None
+            for flag, rows in enumerate(self.rows):
+                rows[slot] = 0
+                self.pending[flag].discard(slot)
+            self.free.append(slot)
+
+    def set (self, flag, obj, column):
+        """Set the flag in column returning True if it wasn't already set"""
+        return self.set_mask(flag, obj, 1 << column) != 0
+
+    def clear (self, flag, obj, column):
+        """Clear the flag in column returning True if it was set"""
+        return self.clear_mask(flag, obj, 1 << column) != 0
+
+    def set_mask (self, flag, obj, mask):
+        """Set the flag for all the columns in mask, return the bits newly set"""
+        with self.lock:
+            slot = obj.slot
+            if not mask or self.objs[slot] is not obj:
+                return 0
+            rows = self.rows[flag]
+            old = rows[slot]
+            rows[slot] = old | mask
+            self.pending[flag].add(slot)
+            return mask & ~old
+
+    def clear_mask (self, flag, obj, mask):
+        """Clear the flag for all columns in mask, return the bits that were set"""
+        with self.lock:
+            slot = obj.slot
+            if self.objs[slot] is not obj:
+                return 0
+            rows = self.rows[flag]
+            old = rows[slot]
+            rows[slot] = old & ~mask
+            if not rows[slot]:
+                self.pending[flag].discard(slot)
+            return old & mask
+
+    def is_set (self, flag, obj, column):
+        slot = obj.slot
+        return self.objs[slot] is obj and (self.rows[flag][slot] >> column) & 1 == 1
+
+    def get_column (self, flag, column):
+        """Return the list of objects with the flag set in column"""
+        bit = 1 << column
+        with self.lock:
+            rows = self.rows[flag]
+            objs = self.objs
+            return [ objs[slot] for slot in self.pending[flag] if rows[slot] & bit ]
+
+    def pop_column (self, flag, column):
+        """Return the list of objects with the flag set in column clearing the flags"""
+        bit = 1 << column
+        with self.lock:
+            rows = self.rows[flag]
+            pending = self.pending[flag]
+            objs = []
+            for slot in [ x for x in pending if rows[x] & bit ]:
+                rows[slot] &= ~bit
+                if not rows[slot]:
+                    pending.remove(slot)
+                objs.append(self.objs[slot])
+            return objs
+
+    def has_column (self, flag, column):
+        """Return True if the flag is set in column for any slot"""
+        bit = 1 << column
+        with self.lock:
+            rows = self.rows[flag]
+            for slot in self.pending[flag]:
+                if rows[slot] & bit:
+                    return True
+            return False
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,374 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Minimal rtnetlink support (Linux only)"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+import errno
+import ipaddress
+import logbook
+import socket
+import struct
+import threading
+
+logger = logbook.Logger(__name__)
+
+# From linux/netlink.h
+NETLINK_ROUTE = 0
+NLMSG_NOOP = 1
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_ROOT = 0x100
+NLM_F_MATCH = 0x200
+NLM_F_DUMP = NLM_F_ROOT | NLM_F_MATCH
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+# From linux/rtnetlink.h
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTM_DELROUTE = 25
+RT_TABLE_MAIN = 254
+RTPROT_ISIS = 187
+RT_SCOPE_UNIVERSE = 0
+RTN_UNICAST = 1
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_MULTIPATH = 9
+RTA_TABLE = 15
+
+# From linux/if_link.h and linux/if_addr.h
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+NLMsgHdrStruct = struct.Struct("=IHHII")
+NLMsgErrStruct = struct.Struct("=i")
+RTAttrStruct = struct.Struct("=HH")
+RTMsgStruct = struct.Struct("=BBBBBBBBI")
+RTNexthopStruct = struct.Struct("=HBBi")
+IfInfoMsgStruct = struct.Struct("=BxHiII")
+IfAddrMsgStruct = struct.Struct("=BBBBI")
+
+
+def nlmsg_align (length):
+    return (length + 3) & ~3
+
+
+def get_rtattr (rtype, data):
+    """Get an encoded (and padded) route attribute"""
+    length = RTAttrStruct.size + len(data)
+    return RTAttrStruct.pack(length, rtype) + data + b"\0" * (nlmsg_align(length) - length)
+
+
+def get_nlmsg (msgtype, flags, seq, payload):
+    """Get an encoded netlink message"""
+    length = NLMsgHdrStruct.size + len(payload)
+    return (NLMsgHdrStruct.pack(length, msgtype, flags, seq, 0) + payload +
+            b"\0" * (nlmsg_align(length) - length))
+
+
+def get_route_payload (family, dst, dstlen, nexthops, table=RT_TABLE_MAIN,
+                       protocol=RTPROT_ISIS, priority=None):
+    """Get an RTM_NEWROUTE/RTM_DELROUTE payload.
+
+    The nexthops are a sequence of (ifindex, packed-gateway-address). More than
+    one nexthop is encoded as RTA_MULTIPATH.
+    """
+    tableid = table if table < 256 else 0
+    payload = RTMsgStruct.pack(family, dstlen, 0, 0, tableid, protocol,
+                               RT_SCOPE_UNIVERSE, RTN_UNICAST, 0)
+    payload += get_rtattr(RTA_DST, dst)
+    if tableid != table:
+        payload += get_rtattr(RTA_TABLE, struct.pack("=I", table))
+    if priority is not None:
+        payload += get_rtattr(RTA_PRIORITY, struct.pack("=I", priority))
+    if len(nexthops) == 1:
+        ifindex, gateway = nexthops[0]
+        payload += get_rtattr(RTA_OIF, struct.pack("=i", ifindex))
+        payload += get_rtattr(RTA_GATEWAY, gateway)
+    elif nexthops:
+        mpath = b""
+        for ifindex, gateway in nexthops:
+            gwattr = get_rtattr(RTA_GATEWAY, gateway)
+            mpath += RTNexthopStruct.pack(RTNexthopStruct.size + len(gwattr), 0, 0, ifindex)
+            mpath += gwattr
+        payload += get_rtattr(RTA_MULTIPATH, mpath)
+    return payload
+
+
+def parse_nlmsgs (data):
+    """Parse a buffer of netlink messages returning a list of (type, flags, seq, payload)"""
+    msgs = []
+    offset = 0
+    while offset + NLMsgHdrStruct.size <= len(data):
+        length, msgtype, flags, seq, unused = NLMsgHdrStruct.unpack_from(data, offset)
+        if length < NLMsgHdrStruct.size or offset + length > len(data):
+            raise ValueError("Bad netlink message length {}".format(length))
+        msgs.append((msgtype, flags, seq, data[offset + NLMsgHdrStruct.size:offset + length]))
+        offset += nlmsg_align(length)
+    return msgs
+
+
+def parse_rtattrs (data, offset=0):
+    """Parse route attributes returning a dictionary of type: value"""
+    attrs = {}
+    while offset + RTAttrStruct.size <= len(data):
+        length, rtype = RTAttrStruct.unpack_from(data, offset)
+        if length < RTAttrStruct.size:
+            break
+        attrs[rtype] = data[offset + RTAttrStruct.size:offset + length]
+        offset += nlmsg_align(length)
+    return attrs
+
+
+def parse_link_payload (payload):
+    """Parse an RTM_NEWLINK/RTM_DELLINK payload returning (ifindex, ifname, flags, attrs)"""
+    unused, unused, ifindex, flags, unused = IfInfoMsgStruct.unpack_from(payload)
+    attrs = parse_rtattrs(payload, IfInfoMsgStruct.size)
+    ifname = attrs.get(IFLA_IFNAME, b"").rstrip(b"\0").decode("utf-8")
+    return ifindex, ifname, flags, attrs
+
+
+def parse_addr_payload (payload):
+    """Parse an RTM_NEWADDR/RTM_DELADDR payload returning an IPv4 interface or None"""
+    family, prefixlen, unused, unused, ifindex = IfAddrMsgStruct.unpack_from(payload)
+    if family != socket.AF_INET:
+        return ifindex, None
+    attrs = parse_rtattrs(payload, IfAddrMsgStruct.size)
+    # IFA_ADDRESS is the peer on point-to-point interfaces, IFA_LOCAL is ours.
+    addr = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+    if addr is None or len(addr) != 4:
+        return ifindex, None
+    addr = ipaddress.IPv4Address(bytes(addr))
+    return ifindex, ipaddress.ip_interface("{}/{}".format(addr, prefixlen))
+
+
+class NetlinkSocket (object):
+    """A netlink socket for sending batches of requests"""
+    def __init__ (self, protocol=NETLINK_ROUTE, groups=0, rcvbuf=2 ** 20):
+        self.socket = socket.socket(socket.AF_NETLINK,        # pylint: disable=E1101
+                                    socket.SOCK_RAW,
+                                    protocol)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.socket.bind((0, groups))
+        self.seq = 0
+        self.rcvbuf = rcvbuf
+
+    def close (self):
+        self.socket.close()
+
+    def fileno (self):
+        return self.socket.fileno()
+
+    def next_seq (self):
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return self.seq
+
+    def send_batch (self, requests):
+        """Send a batch of (msgtype, flags, payload) requests each with an ACK requested.
+
+        The requests are sent in as few sendto calls as possible. Returns a
+        list of (index, errno) for the requests that failed.
+        """
+        failed = []
+        chunk = []
+        chunklen = 0
+        for index, (msgtype, flags, payload) in enumerate(requests):
+            msg = get_nlmsg(msgtype, flags | NLM_F_REQUEST | NLM_F_ACK, self.next_seq(), payload)
+            # Keep each send well below the receive buffer so the ACKs fit.
+            if chunk and chunklen + len(msg) > self.rcvbuf // 4:
+                failed.extend(self._send_chunk(chunk))
+                chunk = []
+                chunklen = 0
+            chunk.append((index, self.seq, msg))
+            chunklen += len(msg)
+        if chunk:
+            failed.extend(self._send_chunk(chunk))
+        return failed
+
+    def dump (self, msgtype, payload, handler):
+        """Send a dump request calling handler(msgtype, payload) for each message.
+
+        Any other messages received meanwhile (e.g., subscribed events) are
+        passed to the handler too.
+        """
+        seq = self.next_seq()
+        self.socket.sendto(get_nlmsg(msgtype, NLM_F_REQUEST | NLM_F_DUMP, seq, payload), (0, 0))
+        while True:
+            try:
+                data = self.socket.recv(self.rcvbuf)
+            except socket.error as ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                raise
+            for rmsgtype, unused, rseq, rpayload in parse_nlmsgs(data):
+                if rseq == seq and rmsgtype == NLMSG_DONE:
+                    return
+                if rseq == seq and rmsgtype == NLMSG_ERROR:
+                    error = -NLMsgErrStruct.unpack_from(rpayload)[0]
+                    raise OSError(error, "netlink dump failed: {}".format(error))
+                handler(rmsgtype, rpayload)
+
+    def _send_chunk (self, chunk):
+        byseq = dict((seq, index) for index, seq, unused in chunk)
+        self.socket.sendto(b"".join(msg for unused, unused, msg in chunk), (0, 0))
+
+        failed = []
+        while byseq:
+            try:
+                data = self.socket.recv(self.rcvbuf)
+            except socket.error as ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                raise
+            for msgtype, unused, seq, payload in parse_nlmsgs(data):
+                if msgtype != NLMSG_ERROR or seq not in byseq:
+                    continue
+                index = byseq.pop(seq)
+                error = -NLMsgErrStruct.unpack_from(payload)[0]
+                if error:
+                    failed.append((index, error))
+        return failed
+
+
+class Interface (object):
+    """An interface as known by the kernel"""
+    def __init__ (self, ifindex, name):
+        self.ifindex = ifindex
+        self.name = name
+        self.flags = 0
+        self.mac_addr = None
+        self.mtu = None
+        self.ipv4_addrs = []
+
+    def __str__ (self):
+        return "Interface({} index:{} mtu:{} ipv4:{})".format(
+            self.name, self.ifindex, self.mtu, ", ".join(str(x) for x in self.ipv4_addrs))
+
+    def get_ipv4_prefix (self):
+        """The primary (first) IPv4 address or None"""
+        return self.ipv4_addrs[0] if self.ipv4_addrs else None
+
+
+class InterfaceTable (object):
+    """All interfaces and their IPv4 addresses, kept current by rtnetlink.
+
+    The table is loaded with one link and one address dump and then follows
+    the RTMGRP_LINK and RTMGRP_IPV4_IFADDR events as they are received (see
+    receive_events). changed(interface) is called for each interface that
+    changes after the initial load.
+    """
+    def __init__ (self, changed=None):
+        self.changed = changed
+        self.lock = threading.Lock()
+        self.byindex = {}
+        self.byname = {}
+        self.nlsock = NetlinkSocket(groups=RTMGRP_LINK | RTMGRP_IPV4_IFADDR)
+        self.loaded = False
+        self.nlsock.dump(RTM_GETLINK, IfInfoMsgStruct.pack(socket.AF_UNSPEC, 0, 0, 0, 0),
+                         self.handle_msg)
+        self.nlsock.dump(RTM_GETADDR, IfAddrMsgStruct.pack(socket.AF_INET, 0, 0, 0, 0),
+                         self.handle_msg)
+        self.loaded = True
+        self.nlsock.socket.setblocking(False)
+
+    def fileno (self):
+        return self.nlsock.fileno()
+
+    def close (self):
+        self.nlsock.close()
+
+    def get (self, name):
+        with self.lock:
+            return self.byname.get(name)
+
+    def receive_events (self):
+        """Process any waiting interface events"""
+        while True:
+            try:
+                data = self.nlsock.socket.recv(self.nlsock.rcvbuf)
+            except socket.error as ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                if ex.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    logger.error("Error receiving interface events: {}", ex)
+                return
+            for msgtype, unused, unused, payload in parse_nlmsgs(data):
+                self.handle_msg(msgtype, payload)
+
+    def handle_msg (self, msgtype, payload):
+        if msgtype in (RTM_NEWLINK, RTM_DELLINK):
+            ifindex, name, flags, attrs = parse_link_payload(payload)
+            with self.lock:
+                intf = self.byindex.get(ifindex)
+                if msgtype == RTM_DELLINK:
+                    if intf is not None:
+                        del self.byindex[ifindex]
+                        self.byname.pop(intf.name, None)
+                else:
+                    if intf is None:
+                        intf = Interface(ifindex, name)
+                        self.byindex[ifindex] = intf
+                    elif intf.name != name and name:
+                        self.byname.pop(intf.name, None)
+                        intf.name = name
+                    self.byname[intf.name] = intf
+                    intf.flags = flags
+                    if IFLA_ADDRESS in attrs:
+                        intf.mac_addr = bytes(attrs[IFLA_ADDRESS])
+                    if IFLA_MTU in attrs:
+                        intf.mtu = struct.unpack("=I", attrs[IFLA_MTU])[0]
+        elif msgtype in (RTM_NEWADDR, RTM_DELADDR):
+            ifindex, addr = parse_addr_payload(payload)
+            if addr is None:
+                return
+            with self.lock:
+                intf = self.byindex.get(ifindex)
+                if intf is None:
+                    return
+                if msgtype == RTM_NEWADDR:
+                    if addr in intf.ipv4_addrs:
+                        return
+                    intf.ipv4_addrs.append(addr)
+                elif addr in intf.ipv4_addrs:
+                    intf.ipv4_addrs.remove(addr)
+                else:
+                    return
+        else:
+            return
+        if self.loaded and self.changed is not None and intf is not None:
+            self.changed(intf)
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
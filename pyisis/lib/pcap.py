@@ -0,0 +1,307 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Packet capture in pcap-ng format.
+
+Frames are captured with nanosecond timestamps, an interface per link and the
+direction of each frame. Capturing only copies the frame and queues it, a
+writer thread does the file I/O so the receive and send paths never wait on
+the disk. Both pcap-ng and classic pcap files can be read back (e.g., for
+replay).
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from pyisis.lib.util import stringify3
+import logbook
+import struct
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue                                   # pylint: disable=F0401
+
+logger = logbook.Logger(__name__)
+
+LINKTYPE_ETHERNET = 1
+SNAPLEN = 0xffff
+
+# Directions (the pcap-ng epb_flags inbound/outbound bits).
+DIR_UNKNOWN = 0
+DIR_INBOUND = 1
+DIR_OUTBOUND = 2
+
+BT_IDB = 0x00000001
+BT_EPB = 0x00000006
+BT_SHB = 0x0A0D0D0A
+BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+OPT_ENDOFOPT = 0
+IF_NAME = 2
+IF_TSRESOL = 9
+EPB_FLAGS = 2
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+
+CAPTURE_QUEUE_MAX = 1 << 16
+"""Frames waiting for the writer thread before further frames are dropped"""
+CAPTURE_CLOSE_TIMEOUT = 10
+"""Seconds close waits for the writer thread to take and write the queued frames"""
+
+BlockHeaderStruct = struct.Struct("<II")
+SHBStruct = struct.Struct("<IHHq")
+IDBStruct = struct.Struct("<HHI")
+EPBStruct = struct.Struct("<IIIII")
+OptionStruct = struct.Struct("<HH")
+
+
+def get_time_ns ():
+    if hasattr(time, "time_ns"):
+        return time.time_ns()
+    return int(time.time() * 1000000000)
+
+
+def _pad4 (data):
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def _option (code, value):
+    return OptionStruct.pack(code, len(value)) + _pad4(value)
+
+
+def _block (btype, body):
+    body = _pad4(body)
+    total = BlockHeaderStruct.size + len(body) + 4
+    return BlockHeaderStruct.pack(btype, total) + body + struct.pack("<I", total)
+
+
+class PcapWriter (object):
+    """Write frames to a pcap-ng file with nanosecond timestamps"""
+
+    def __init__ (self, path):
+        self.file = open(path, "wb")
+        self.ifids = {}
+        self.file.write(_block(BT_SHB, SHBStruct.pack(BYTE_ORDER_MAGIC, 1, 0, -1)))
+
+    def get_ifid (self, ifname):
+        """Get the interface id for ifname writing its description block if new"""
+        ifid = self.ifids.get(ifname)
+        if ifid is None:
+            ifid = self.ifids[ifname] = len(self.ifids)
+            options = (_option(IF_NAME, ifname.encode("utf-8")) +
+                       _option(IF_TSRESOL, b"\x09") +
+                       _option(OPT_ENDOFOPT, b""))
+            self.file.write(_block(BT_IDB, IDBStruct.pack(LINKTYPE_ETHERNET, 0, SNAPLEN) +
+                                   options))
+        return ifid
+
+    def write (self, ifname, ts_ns, data, direction=DIR_UNKNOWN):
+        ifid = self.get_ifid(ifname)
+        caplen = min(len(data), SNAPLEN)
+        body = (EPBStruct.pack(ifid, ts_ns >> 32, ts_ns & 0xffffffff, caplen, len(data)) +
+                _pad4(data[:caplen]))
+        if direction:
+            body += _option(EPB_FLAGS, struct.pack("<I", direction)) + _option(OPT_ENDOFOPT, b"")
+        self.file.write(_block(BT_EPB, body))
+
+    def close (self):
+        self.file.close()
+
+
+class CaptureWriter (object):
+    """Capture frames to a pcap-ng file from a writer thread.
+
+    If the writer falls behind by more than maxqueue frames further frames
+    are dropped (and counted) rather than slowing the caller. If writing
+    fails the capture stops and any further frames are dropped.
+    """
+
+    def __init__ (self, path, maxqueue=CAPTURE_QUEUE_MAX):
+        self.path = path
+        self.writer = PcapWriter(path)
+        self.queue = queue.Queue(maxqueue)
+        self.stopped = False
+        self.lock = threading.Lock()
+
+        # Statistics, updated from the receive, send and writer threads. Frames
+        # captured are those written or queued to be.
+        self.captured = 0
+        self.dropped = 0
+
+        self.thread = threading.Thread(name="Capture", target=self.write_frames)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __str__ (self):
+        return "CaptureWriter({} captured:{} dropped:{})".format(self.path, self.captured,
+                                                                  self.dropped)
+
+    def capture (self, ifname, data, direction=DIR_UNKNOWN):
+        """Capture a frame (bytes-like or a list of them) copying it as it may be reused"""
+        ts_ns = get_time_ns()
+        if isinstance(data, list):
+            data = b"".join(stringify3(x) for x in data)
+        else:
+            data = stringify3(data)
+        try:
+            if self.stopped:
+                raise queue.Full()
+            self.queue.put_nowait((ifname, ts_ns, data, direction))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+        else:
+            with self.lock:
+                self.captured += 1
+
+    def write_frames (self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if not self.stopped:
+                try:
+                    self.writer.write(*item)
+                    continue
+                except (IOError, OSError) as ex:
+                    logger.error("{}: capture stopped: {}", self, ex)
+                    self.stopped = True
+            # Keep taking frames so the queue doesn't fill and block close.
+            with self.lock:
+                self.captured -= 1
+                self.dropped += 1
+
+    def close (self):
+        """Write any queued frames and close the file"""
+        if self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=CAPTURE_CLOSE_TIMEOUT)
+            except queue.Full:
+                logger.error("{}: timed out writing queued frames", self)
+            else:
+                self.thread.join(CAPTURE_CLOSE_TIMEOUT)
+        self.stopped = True
+        self.writer.close()
+
+
+def _read_pcapng (pfile, first):
+    """Read a pcap-ng file (after the first 4 bytes) yielding (ifname, ts_ns, direction, data)"""
+    interfaces = []
+    btype = struct.unpack("<I", first)[0]
+    while True:
+        if btype == BT_SHB:
+            header = pfile.read(8)
+            total, magic = struct.unpack("<II", header)
+            if magic == BYTE_ORDER_MAGIC:
+                order = "<"
+            else:
+                order = ">"
+                total = struct.unpack(">I", header[:4])[0]
+            body = header[4:] + pfile.read(total - 12)
+            interfaces = []
+        else:
+            header = pfile.read(4)
+            if len(header) < 4:
+                return
+            total = struct.unpack(order + "I", header)[0]
+            body = pfile.read(total - 8)
+            if len(body) < total - 8:
+                return
+        body = body[:-4]
+
+        if btype == BT_IDB:
+            ifname, tsresol = "if{}".format(len(interfaces)), 6
+            for code, value in _get_options(order, body[8:]):
+                if code == IF_NAME:
+                    ifname = value.rstrip(b"\x00").decode("utf-8")
+                elif code == IF_TSRESOL:
+                    tsresol = bytearray(value)[0]
+            interfaces.append((ifname, tsresol))
+        elif btype == BT_EPB:
+            ifid, tshigh, tslow, caplen, unused = struct.unpack_from(order + "IIIII", body)
+            ifname, tsresol = interfaces[ifid]
+            data = body[20:20 + caplen]
+            direction = DIR_UNKNOWN
+            for code, value in _get_options(order, body[20 + caplen + (-caplen % 4):]):
+                if code == EPB_FLAGS:
+                    direction = struct.unpack(order + "I", value)[0] & 3
+            yield ifname, _get_ts_ns((tshigh << 32) | tslow, tsresol), direction, data
+
+        first = pfile.read(4)
+        if len(first) < 4:
+            return
+        btype = struct.unpack(order + "I", first)[0]
+
+
+def _get_options (order, data):
+    off = 0
+    while off + 4 <= len(data):
+        code, length = struct.unpack_from(order + "HH", data, off)
+        if code == OPT_ENDOFOPT:
+            return
+        yield code, data[off + 4:off + 4 + length]
+        off += 4 + length + (-length % 4)
+
+
+def _get_ts_ns (ts, tsresol):
+    if tsresol & 0x80:
+        return (ts * 1000000000) >> (tsresol & 0x7f)
+    if tsresol <= 9:
+        return ts * 10 ** (9 - tsresol)
+    return ts // 10 ** (tsresol - 9)
+
+
+def _read_pcap (pfile, order, scale):
+    """Read a classic pcap file (after the magic) yielding (ifname, ts_ns, direction, data)"""
+    pfile.read(20)
+    record = struct.Struct(order + "IIII")
+    while True:
+        header = pfile.read(record.size)
+        if len(header) < record.size:
+            return
+        secs, frac, caplen, unused = record.unpack(header)
+        data = pfile.read(caplen)
+        if len(data) < caplen:
+            return
+        yield None, secs * 1000000000 + frac * scale, DIR_UNKNOWN, data
+
+
+def read_pcap (path):
+    """Read a pcap-ng or pcap file yielding (ifname, ts_ns, direction, data) for each frame.
+
+    Classic pcap files have no interface names (ifname is None) or directions.
+    """
+    with open(path, "rb") as pfile:
+        first = pfile.read(4)
+        if len(first) < 4:
+            return
+        for order in ("<", ">"):
+            magic = struct.unpack(order + "I", first)[0]
+            if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                scale = 1000 if magic == PCAP_MAGIC_USEC else 1
+                for frame in _read_pcap(pfile, order, scale):
+                    yield frame
+                return
+        if struct.unpack("<I", first)[0] != BT_SHB:
+            raise ValueError("{} is not a pcap or pcap-ng file".format(path))
+        for frame in _read_pcapng(pfile, first):
+            yield frame
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -18,9 +18,14 @@ from __future__ import absolute_import, division, nested_scopes, print_function,
 
 from fcntl import ioctl
 from ctypes import cast, c_void_p, c_uint16, Structure
+from pyisis.lib.util import xrange3
+import errno
 import pyisis.clns as clns
+import pyisis.lib.bufpool as bufpool
 import ipaddress
 import logbook
+import mmap
+import os
 import re
 import socket
 import struct
@@ -38,6 +43,7 @@ SIOCSIFLINK = 0x8911 # set iface channel
 SIOCGIFCONF = 0x8912 # get iface list
 SIOCGIFFLAGS = 0x8913 # get flags
 SIOCSIFFLAGS = 0x8914 # set flags
+SIOCGIFMTU = 0x8921 # get MTU size
 SIOCGIFINDEX = 0x8933 # name -> if_index mapping
 SIOCGIFCOUNT = 0x8938 # get number of devices
 SIOCGSTAMP = 0x8906 # get packet timestamp (as a timeval)
@@ -59,6 +65,13 @@ PACKET_DROP_MEMBERSHIP = 2
 PACKET_RECV_OUTPUT = 3
 PACKET_RX_RING = 5
 PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+PACKET_FANOUT = 18
+PACKET_IGNORE_OUTGOING = 23
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_LB = 1
+PACKET_FANOUT_CPU = 2
+FANOUT_MODES = { "hash": PACKET_FANOUT_HASH, "lb": PACKET_FANOUT_LB, "cpu": PACKET_FANOUT_CPU }
 PACKET_MR_MULTICAST = 0
 PACKET_MR_PROMISC = 1
 PACKET_MR_ALLMULTI = 2
@@ -69,6 +82,41 @@ SOL_PACKET = 263
 SO_ATTACH_FILTER = 26
 SOL_SOCKET = 1
 
+MAX_FRAME_LEN = 1518
+"""Largest frame received, an ethernet frame with room for a VLAN tag"""
+
+# An MTU sized payload plus the ethernet header and a VLAN tag.
+FRAME_OVERHEAD = 18
+
+# From linux/if_packet.h (TPACKET_V3 memory mapped receive ring)
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 0x1
+TPACKET_ALIGNMENT = 16
+TPacketReq3Struct = struct.Struct("=IIIIIII")
+# tpacket_block_desc: version, offset_to_priv then tpacket_hdr_v1 starting
+# block_status, num_pkts, offset_to_first_pkt
+TPACKET_BLOCK_STATUS_OFF = 8
+TPacketBlockStruct = struct.Struct("=III")
+# tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac, tp_net
+TPacket3HdrStruct = struct.Struct("=IIIIIIHH")
+TPACKET3_HDRLEN = 48
+# The sockaddr_ll follows the aligned header, sll_pkttype is at offset 10 in it.
+TPACKET3_PKTTYPE_OFF = ((TPACKET3_HDRLEN + TPACKET_ALIGNMENT - 1) & ~(TPACKET_ALIGNMENT - 1)) + 10
+PKTTYPEStruct = struct.Struct("=B")
+TPacketStatsV3Struct = struct.Struct("=III")
+
+RECV_BATCH = 32
+"""Frames received per recvmmsg call"""
+
+# sll_pkttype is at offset 10 in a sockaddr_ll
+SLL_PKTTYPE_OFF = 10
+
+RING_BLOCK_SIZE = 1 << 16
+RING_FRAME_SIZE = 1 << 11
+RING_BLOCK_TIMEOUT = 4
+"""Milliseconds before the kernel hands over a partially filled block"""
+
 
 def get_if(iff, cmd):
     s = socket.socket()
@@ -85,6 +133,23 @@ def get_if_index(iff):
     return int(struct.unpack("I", get_if(iff, SIOCGIFINDEX)[16:20])[0])
 
 
+def get_if_mtu(iff):
+    return int(struct.unpack("i", get_if(iff, SIOCGIFMTU)[16:20])[0])
+
+
+def get_if_framelen (iff):
+    """Get the largest frame that can be received on the interface"""
+    try:
+        return get_if_mtu(iff) + FRAME_OVERHEAD
+    except (IOError, OSError):
+        return MAX_FRAME_LEN
+
+
+def get_fanout_group (ifindex):
+    """Get a fanout group id for an interface unique to this process"""
+    return (os.getpid() * 251 + ifindex) & 0xFFFF
+
+
 def set_promisc(s, iff, val):
     mreq = struct.pack("IHH8s", get_if_index(iff), PACKET_MR_PROMISC, 0, "")
     if val:
@@ -95,7 +160,8 @@ def set_promisc(s, iff, val):
 
 
 class RawInterface (object):
-    def __init__ (self, ifname):
+    def __init__ (self, ifname, framelen=None, ring_blocks=0,
+                  ring_block_size=RING_BLOCK_SIZE, batch=RECV_BATCH):
         ETH_P_ALL = 3
         self.name = ifname
         self.ifindex = get_if_index(ifname)
@@ -107,7 +173,54 @@ class RawInterface (object):
         self.socket.bind((ifname, ETH_P_ALL))
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2 ** 30)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2 ** 30)
+        # Our own frames aren't looped back to us (Linux 4.20+), otherwise
+        # they're still discarded on receipt.
+        try:
+            self.socket.setsockopt(SOL_PACKET, PACKET_IGNORE_OUTGOING, 1)
+            self.ignore_outgoing = True
+        except socket.error:
+            self.ignore_outgoing = False
+        # A full device queue must not block the caller, sends return EAGAIN
+        # and the link keeps the frames until the socket is writable.
+        self.socket.setblocking(False)
         self.buflen = 65535
+        self.framelen = framelen if framelen else get_if_framelen(ifname)
+
+        # Buffers for recvmmsg come from a pool, those filled are replaced
+        # and go back to the pool when released (unless retained).
+        self.batch = max(1, batch)
+        self.pool = bufpool.BufferPool(self.framelen, 2 * self.batch)
+        self.rxbufs = [ self.pool.get() for unused in xrange3(0, self.batch) ]
+        self.rx_held = []
+
+        self.ring = None
+        self.ringview = None
+        self.ring_held = None
+        self.ring_index = 0
+        self.ring_blocks = ring_blocks
+        self.ring_block_size = ring_block_size
+        if ring_blocks:
+            self.setup_ring()
+
+        # Statistics
+        self.ring_frames = 0
+        self.ring_block_count = 0
+
+    def setup_ring (self):
+        """Map a TPACKET_V3 receive ring.
+
+        The kernel fills blocks of frames and hands each over whole, so an
+        LSP burst is received with a single wakeup rather than a syscall per
+        frame, and the ring (not the socket receive buffer) absorbs it.
+        """
+        self.socket.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        frame_nr = (self.ring_block_size // RING_FRAME_SIZE) * self.ring_blocks
+        req = TPacketReq3Struct.pack(self.ring_block_size, self.ring_blocks, RING_FRAME_SIZE,
+                                     frame_nr, RING_BLOCK_TIMEOUT, 0, 0)
+        self.socket.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        self.ring = mmap.mmap(self.socket.fileno(), self.ring_block_size * self.ring_blocks,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.ringview = memoryview(self.ring)
 
     def set_filter (self, insns):
         class BPFProgram (Structure):
@@ -122,6 +235,10 @@ class RawInterface (object):
         self.socket.setsockopt(SOL_SOCKET, SO_ATTACH_FILTER,
                                struct.pack("HP", program.bf_len, program.bf_insns))
 
+    def join_fanout (self, group, mode):
+        """Join a PACKET_FANOUT group, the kernel spreads frames over the group's sockets"""
+        self.socket.setsockopt(SOL_PACKET, PACKET_FANOUT, group | (FANOUT_MODES[mode] << 16))
+
     def add_drop_group (self, add, maddr):
         if sys.version_info >= (3, 0):
             mreq = struct.pack("IHH6s2s", self.ifindex, PACKET_MR_MULTICAST, 6, maddr, bytes())
@@ -134,16 +251,122 @@ class RawInterface (object):
         self.socket.setsockopt(SOL_PACKET, cmd, mreq)
 
     def recv_pkt (self):
-        pkt, sa_ll = self.socket.recvfrom(self.buflen)
-        if pkt is None:
-            return None
+        """Receive a frame into a new buffer returning a writable memoryview of it.
+
+        The buffer is not reused so the receiver may keep it (e.g., as the
+        LSDB copy of an LSP).
+        """
+        buf = bytearray(self.framelen)
+        try:
+            nbytes, sa_ll = self.socket.recvfrom_into(buf, self.framelen, socket.MSG_TRUNC)
+        except socket.error as ex:
+            if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return None
+            raise
         if sa_ll[2] == socket.PACKET_OUTGOING:
             return None
-        return pkt
+        if nbytes > self.framelen:
+            logger.warning("{}: dropping {} byte frame larger than {}", self.name, nbytes,
+                           self.framelen)
+            return None
+        return memoryview(buf)[:nbytes]
+
+    def recv_pkts (self):
+        """Receive a list of frames, call release_pkts when done with them.
+
+        With a receive ring the frames are views into the next filled ring
+        block, they must not be kept after release_pkts (the LSDB copies
+        them, see lsp.retain_pdu).
+        """
+        if self.ring is None:
+            return self.recv_batch()
+
+        block = self.ring_index * self.ring_block_size
+        ring = self.ring
+        status, npkts, offset = TPacketBlockStruct.unpack_from(ring,
+                                                               block + TPACKET_BLOCK_STATUS_OFF)
+        if not status & TP_STATUS_USER:
+            return []
+        self.ring_held = block
+        self.ring_block_count += 1
+
+        pkts = []
+        for unused in xrange3(0, npkts):
+            hdr = block + offset
+            (next_offset, unused, unused, snaplen, pktlen, unused, mac,
+             unused) = TPacket3HdrStruct.unpack_from(ring, hdr)
+            pkttype = PKTTYPEStruct.unpack_from(ring, hdr + TPACKET3_PKTTYPE_OFF)[0]
+            if pkttype == socket.PACKET_OUTGOING:
+                pass
+            elif snaplen < pktlen or pktlen > self.framelen:
+                logger.warning("{}: dropping {} byte frame larger than {}", self.name, pktlen,
+                               self.framelen)
+            else:
+                pkts.append(self.ringview[hdr + mac:hdr + mac + snaplen])
+            offset += next_offset
+        self.ring_frames += len(pkts)
+        return pkts
+
+    def recv_batch (self):
+        """Receive up to batch frames with a single recvmmsg call.
+
+        Each frame is a writable memoryview of a pool buffer of its own. The
+        buffer goes back to the pool on release_pkts unless the receiver kept
+        it (see bufpool.retain).
+        """
+        from pyisis.bstr import recvmmsg                    # pylint: disable=E0611
+        rxbufs = self.rxbufs
+        try:
+            msgs = recvmmsg(self.socket, rxbufs, socket.MSG_TRUNC)
+        except (IOError, OSError) as ex:
+            if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise
+        pkts = []
+        for index, (nbytes, unused, sa_ll) in enumerate(msgs):
+            if PKTTYPEStruct.unpack_from(sa_ll, SLL_PKTTYPE_OFF)[0] == socket.PACKET_OUTGOING:
+                continue
+            if nbytes > self.framelen:
+                logger.warning("{}: dropping {} byte frame larger than {}", self.name, nbytes,
+                               self.framelen)
+                continue
+            buf = rxbufs[index]
+            rxbufs[index] = self.pool.get()
+            self.rx_held.append(buf)
+            pkts.append(memoryview(buf)[:nbytes])
+        return pkts
+
+    def release_pkts (self):
+        """Release the frames returned by recv_pkts.
+
+        Their buffers go back to the pool or, with a receive ring, the block
+        goes back to the kernel.
+        """
+        if self.rx_held:
+            for buf in self.rx_held:
+                self.pool.put(buf)
+            self.rx_held = []
+        block = self.ring_held
+        if block is None:
+            return
+        self.ring_held = None
+        struct.pack_into("=I", self.ring, block + TPACKET_BLOCK_STATUS_OFF, TP_STATUS_KERNEL)
+        self.ring_index = (self.ring_index + 1) % self.ring_blocks
+
+    def get_stats (self):
+        """Return (packets, drops) counted by the kernel since the last call"""
+        size = TPacketStatsV3Struct.size if self.ring is not None else 8
+        stats = self.socket.getsockopt(SOL_PACKET, PACKET_STATISTICS, size)
+        return struct.unpack_from("=II", stats)
 
     def fileno (self):
         return self.socket.fileno()
 
+    def close (self):
+        # The ring is unmapped once no frames in it are referenced.
+        self.ring = self.ringview = None
+        self.socket.close()
+
     def write (self, pkt):
         return self.writev([pkt])
 
@@ -151,6 +374,11 @@ class RawInterface (object):
         from pyisis.bstr import sendv                       # pylint: disable=E0611
         return sendv(self.socket, buffers)
 
+    def sendmmsg (self, frames):
+        """Send a list of frames (each a list of buffers) returning the number sent"""
+        from pyisis.bstr import sendmmsg                    # pylint: disable=E0611
+        return sendmmsg(self.socket, frames)
+
     def get_if_addrs (self):
         ifname = self.name
         # codes are different for mac and linux
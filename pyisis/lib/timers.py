@@ -98,6 +98,7 @@ class TimerHeap (object):
         self.heap = []
         self.lock = threading.Lock()
         self.rtimer = None
+        self.rtimer_gen = 0
         self.expiring = False
 
     def add (self, timer):
@@ -125,20 +126,27 @@ class TimerHeap (object):
             # as appropriate otherwise let's start a timer if we don't have
             # one
             if self.rtimer is None and not self.expiring:
-                top = self.heap[0]
-                ival = top.expire - time.time()
-                if ival < 0:
-                    ival = 0
-                self.rtimer = ThreadTimer(self.desc, ival, self.expire)
-                self.rtimer.start()
+                self._start_rtimer()
+
+    def _start_rtimer (self):
+        """Start the real-time timer for the top of the heap, lock is assumed"""
+        ival = self.heap[0].expire - time.time()
+        if ival < 0:
+            ival = 0
+        self.rtimer_gen += 1
+        self.rtimer = ThreadTimer(self.desc, ival, self.expire, self.rtimer_gen)
+        self.rtimer.start()
+
+    def expire (self, gen):
+        # Set expiring variable and forget old timer. A timer cancelled too
+        # late (see add) still calls us, only the current one expires timers.
+        with self.lock:
+            if gen != self.rtimer_gen or self.rtimer is None:
+                return
+            self.expiring = True
+            self.rtimer = None
 
-    def expire (self):
         try:
-            # Set expiring variable and forget old timer.
-            with self.lock:
-                self.expiring = True
-                self.rtimer = None
-
             while True:
                 with self.lock:
                     if not self.heap:
@@ -160,18 +168,10 @@ class TimerHeap (object):
             logger.error("Unexpected Exception: {}", ex)
             debug_exception()
         finally:
-            # This is never set while expiring is True
-            assert self.rtimer is None
-
             with self.lock:
                 # Now grab the next timer and set our real-time timer and unset expiring
                 if self.heap:
-                    top = self.heap[0]
-                    ival = top.expire - time.time()
-                    if ival < 0:
-                        ival = 0
-                    self.rtimer = ThreadTimer(self.desc, ival, self.expire)
-                    self.rtimer.start()
+                    self._start_rtimer()
                 self.expiring = False
 
     def _remove (self, timer):
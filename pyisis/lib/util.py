@@ -187,6 +187,70 @@ class Lifetime (object):
             return int(left)
 
 
+class TokenBucket (object):
+    """A token bucket holding up to burst tokens refilled at rate tokens per second.
+
+    A rate of 0 (or None) is unlimited.
+    """
+    def __init__ (self, rate, burst, clock=None):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock or monotonic
+        self.tokens = float(self.burst)
+        self.timestamp = self.clock()
+
+    def refill (self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def consume (self, count=1):
+        """Take up to count tokens returning the number taken"""
+        if not self.rate:
+            return count
+        self.refill()
+        taken = min(count, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+    def delay (self, count=1):
+        """Return the seconds until count tokens are available"""
+        if not self.rate:
+            return 0
+        self.refill()
+        return max(0, (min(count, self.burst) - self.tokens) / self.rate)
+
+
+class Backoff (object):
+    """An exponential back-off throttle for events such as LSP generation.
+
+    The first event after a quiet period waits initial seconds. Each event
+    after that waits (from the previous event) secondary seconds doubling up to
+    maximum. Quiet for twice maximum resets the back-off.
+    """
+    def __init__ (self, initial, secondary, maximum, clock=None):
+        self.initial = initial
+        self.secondary = secondary
+        self.maximum = max(maximum, secondary)
+        self.clock = clock or monotonic
+        self.wait = secondary
+        self.last = None
+
+    def delay (self):
+        """Return the seconds to wait before the next event"""
+        now = self.clock()
+        if self.last is None or now - self.last >= 2 * self.maximum:
+            self.wait = self.secondary
+            return self.initial
+        delay = max(0, self.last + self.wait - now)
+        self.wait = min(self.wait * 2, self.maximum)
+        return delay
+
+    def fired (self):
+        """Record that the event happened"""
+        self.last = self.clock()
+
+
 class QueryLock (object):
     """A threading Lock that is queriable"""
     def __init__ (self):
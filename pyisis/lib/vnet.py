@@ -0,0 +1,255 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""An in-memory virtual network.
+
+A VirtualLAN is a broadcast bus, a frame sent by one of its interfaces is
+delivered to every other interface that has its destination MAC address or has
+joined the multicast group, after an optional delay and with an optional loss
+rate. A VirtualInterface stands in for a raw socket (see
+Link.open_rawintf), each has a socket pair used only to wake the link's
+selector when frames are waiting, so many instances can run in one process
+without real interfaces or root.
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from collections import deque
+from pyisis.lib.util import stringify3, tlvrdb, xrange3
+import errno
+import ipaddress
+import logbook
+import random
+import socket
+import struct
+import threading
+import pyisis.lib.timers as timers
+
+logger = logbook.Logger(__name__)
+
+BROADCAST_MAC = b"\xff" * 6
+RECV_BATCH = 32
+PDU_TYPE_OFF = 21
+
+
+class VirtualLAN (object):
+    """A broadcast bus connecting virtual interfaces.
+
+    Delayed frames are delivered from timerheap, shared by the LANs of a
+    network, otherwise the LAN gets one of its own.
+    """
+
+    def __init__ (self, name, delay=0, loss=0, seed=None, timerheap=None):
+        self.name = name
+        self.delay = delay
+        self.loss = loss
+        self.rand = random.Random(seed)
+        self.lock = threading.Lock()
+        self.intfs = []
+        if delay and timerheap is None:
+            timerheap = timers.TimerHeap("VirtualLAN({})".format(name))
+        self.timerheap = timerheap
+
+        # Statistics
+        self.frames = 0
+        self.bytes = 0
+        self.delivered = 0
+        self.lost = 0
+        self.pdu_types = {}
+
+    def __str__ (self):
+        return "VirtualLAN({} intfs:{} frames:{} delivered:{} lost:{})".format(
+            self.name, len(self.intfs), self.frames, self.delivered, self.lost)
+
+    def attach (self, intf):
+        with self.lock:
+            self.intfs.append(intf)
+
+    def detach (self, intf):
+        with self.lock:
+            if intf in self.intfs:
+                self.intfs.remove(intf)
+
+    def send (self, src, frame):
+        """Send frame (bytes) from the interface src to the other interfaces"""
+        dst = frame[:6]
+        with self.lock:
+            self.frames += 1
+            self.bytes += len(frame)
+            if len(frame) > PDU_TYPE_OFF:
+                pdu_type = tlvrdb(frame[PDU_TYPE_OFF]) & 0x1f
+                self.pdu_types[pdu_type] = self.pdu_types.get(pdu_type, 0) + 1
+            receivers = []
+            for intf in self.intfs:
+                if intf is src or not intf.accepts(dst):
+                    continue
+                if self.loss and self.rand.random() < self.loss:
+                    self.lost += 1
+                    continue
+                receivers.append(intf)
+            self.delivered += len(receivers)
+        for intf in receivers:
+            if self.delay:
+                timers.Timer(self.timerheap, 0, intf.deliver, frame).start(self.delay)
+            else:
+                intf.deliver(frame)
+
+
+class VirtualInterface (object):
+    """A raw interface on a virtual LAN"""
+
+    def __init__ (self, lan, ifname, mac_addr, ipv4_prefix=None, ifindex=0,
+                  batch=RECV_BATCH):
+        self.lan = lan
+        self.name = ifname
+        self.ifindex = ifindex
+        self.mac_addr = mac_addr
+        self.ipv4_prefix = ipv4_prefix
+        self.batch = max(1, batch)
+        self.groups = set([ BROADCAST_MAC ])
+        self.rxq = deque()
+        self.lock = threading.Lock()
+        self.rsock, self.wsock = socket.socketpair()
+        self.rsock.setblocking(False)
+        self.wsock.setblocking(False)
+        lan.attach(self)
+
+    def __str__ (self):
+        return "VirtualInterface({} on {})".format(self.name, self.lan.name)
+
+    def close (self):
+        self.lan.detach(self)
+        self.rsock.close()
+        self.wsock.close()
+
+    def accepts (self, dst):
+        return dst == self.mac_addr or dst in self.groups
+
+    def deliver (self, frame):
+        with self.lock:
+            if not self.rxq:
+                try:
+                    self.wsock.send(b"\x00")
+                except socket.error as ex:
+                    if ex.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        raise
+            self.rxq.append(frame)
+
+    def recv_pkts (self):
+        """Receive up to batch frames each in a writable buffer of its own"""
+        with self.lock:
+            rxq = self.rxq
+            frames = [ rxq.popleft() for unused in xrange3(0, min(self.batch, len(rxq))) ]
+            if not rxq:
+                try:
+                    while self.rsock.recv(64):
+                        pass
+                except socket.error as ex:
+                    if ex.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        raise
+        return [ memoryview(bytearray(x)) for x in frames ]
+
+    def release_pkts (self):
+        pass
+
+    def add_drop_group (self, add, maddr):
+        if add:
+            self.groups.add(maddr)
+        else:
+            self.groups.discard(maddr)
+
+    def set_filter (self, insns):
+        # Frames are checked by the link as they are received.
+        pass
+
+    def fileno (self):
+        return self.rsock.fileno()
+
+    def sendmmsg (self, frames):
+        """Send a list of frames (each a list of buffers) returning the number sent"""
+        for frame in frames:
+            self.lan.send(self, b"".join(stringify3(x) for x in frame))
+        return len(frames)
+
+    def writev (self, buffers):
+        return self.sendmmsg([ buffers ])
+
+    def write (self, pkt):
+        return self.sendmmsg([ [ pkt ] ])
+
+    def get_if_addrs (self):
+        return self.mac_addr, self.ipv4_prefix
+
+
+class VirtualNetwork (object):
+    """A set of virtual LANs with addresses allocated for the interfaces attached to them.
+
+    Each LAN is named, a link on it uses the LAN name as its interface name, so
+    a router attaches to a LAN with ``inst.linkdb.add_link(lan.name)`` given an
+    instance created with ``intf_factory=network.get_intf_factory()``.
+    """
+
+    def __init__ (self, seed=None):
+        self.rand = random.Random(seed)
+        self.lock = threading.Lock()
+        self.lans = {}
+        self.subnets = {}
+        self.intfs = []
+        # One timer thread delivers the delayed frames of all the LANs.
+        self.timerheap = timers.TimerHeap("VirtualNetwork")
+
+    def add_lan (self, name, delay=0, loss=0):
+        with self.lock:
+            assert name not in self.lans
+            lan = VirtualLAN(name, delay, loss, self.rand.random(), self.timerheap)
+            # Each LAN gets a /24 from 10/8.
+            self.subnets[name] = 0x0a000000 + (len(self.lans) << 8)
+            self.lans[name] = lan
+            return lan
+
+    def open_intf (self, ifname):
+        """Open an interface on the LAN named ifname"""
+        with self.lock:
+            lan = self.lans[ifname]
+            index = len(self.intfs) + 1
+            mac_addr = struct.pack(">HI", 0x0200, index)
+            addr = ipaddress.ip_address(self.subnets[ifname] + len(lan.intfs) + 1)
+            ipv4_prefix = ipaddress.ip_interface("{}/24".format(addr))
+            intf = VirtualInterface(lan, ifname, mac_addr, ipv4_prefix, index)
+            self.intfs.append(intf)
+            return intf
+
+    def get_intf_factory (self):
+        return self.open_intf
+
+    def get_stats (self):
+        """Get the total frames, delivered frames, lost frames and frames by PDU type"""
+        frames = delivered = lost = 0
+        pdu_types = {}
+        with self.lock:
+            lans = list(self.lans.values())
+        for lan in lans:
+            with lan.lock:
+                frames += lan.frames
+                delivered += lan.delivered
+                lost += lan.lost
+                for pdu_type, count in lan.pdu_types.items():
+                    pdu_types[pdu_type] = pdu_types.get(pdu_type, 0) + count
+        return frames, delivered, lost, pdu_types
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
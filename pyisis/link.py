@@ -16,30 +16,69 @@
 #
 from __future__ import absolute_import, division, print_function, nested_scopes
 
+from collections import deque
 from ctypes import create_string_buffer, sizeof
 from pyisis.bstr import memspan                             # pylint: disable=E0611
-from pyisis.lib.util import bchr, memcpy, buffer3, stringify3, tlvwrb
+from pyisis.lib.util import bchr, memcpy, buffer3, stringify3, tlvwrb, xrange3
 import errno
+import heapq
+import itertools
 import logbook
 import pyisis.adjacency as adjacency
 import pyisis.lib.bpf as bpf
 import pyisis.clns as clns
 import pyisis.lib.debug as debug
+import pyisis.lib.flagmatrix as flagmatrix
 import pyisis.lsp as lsp
+import pyisis.lib.netlink as netlink
+import pyisis.lib.pcap as pcap
 import pyisis.pdu as pdu
 import pyisis.lib.rawsock as rawsock
 import pyisis.lib.timers as timers
 import pyisis.tlv as tlv
 import pyisis.lib.util as util
 import select
+import socket
 import sys
+try:
+    import selectors
+except ImportError:
+    selectors = None
 import threading
+import time
 import traceback
 
 logger = logbook.Logger(__name__)
 
 SRM = 0
 SSN = 1
+FLAG_NAMES = [ "SRM", "SSN" ]
+
+# Ethernet requires a payload length of 46 bytes.
+ETHER_MIN_PAYLOAD = 46
+LLC_HEADER_LEN = sizeof(pdu.LLCHeader)
+ETHER_PADS = [ b"\x00" * x for x in xrange3(0, ETHER_MIN_PAYLOAD + 1) ]
+
+LSP_PDU_TYPES = (clns.PDU_TYPE_LSP_L1, clns.PDU_TYPE_LSP_L2)
+
+# Receive batches per read wakeup, so one busy link can't starve the others.
+RX_MAX_BATCHES = 8
+
+# Received batches a fanout receive worker queues before it waits for them to be processed.
+RX_WORKER_QUEUE_MAX = 64
+
+# Frames queued for transmit on a link before flooding waits for the queue to drain.
+TXQ_MAX = 128
+
+# Send errors that mean the device queue is full, the frames are kept and retried.
+TX_BLOCKED_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS)
+
+
+def get_selector ():
+    """Get an epoll selector if available, otherwise None to use select"""
+    if selectors is None or not hasattr(selectors, "EpollSelector"):
+        return None
+    return selectors.EpollSelector()
 
 
 class LinkDB (object):
@@ -51,26 +90,121 @@ class LinkDB (object):
         self.linkfds = set()
         self.wlinkfds = set()
         self.linkbyfd = {}
+        self.hellofds = set()
+        self.intftable = None
+        """Interfaces and addresses from rtnetlink (Linux), None if not available"""
+        self.rx_batch_hook = None
+        """If set called as hook(link, nframes, seconds) after each received batch"""
+        self.capture = None
+        """If set a pcap.CaptureWriter frames sent and received are captured with"""
         self.linkbyidx = {}
+        self.next_index = 0
+        """Link indices (circuit IDs and flag columns) aren't reused when links are removed"""
+        self.selector = get_selector()
+        """With epoll links stay registered, only write interest is changed"""
         self.timerheap = timers.TimerHeap("LinkDB")
         self.lock = threading.Lock()
 
+        # SRM and SSN flags for flooding indexed by lindex, then by LSP
+        # segment slot and link index. The level masks have a bit set for
+        # each link with the level enabled.
+        self.flags = [ flagmatrix.FlagMatrix(), flagmatrix.FlagMatrix() ]
+        self.level_masks = [ 0, 0 ]
+
     def __enter__ (self):
         return self.lock.__enter__()
 
     def __exit__ (self, *args):
         return self.lock.__exit__(*args)
 
+    def open_intftable (self):
+        """Load the interface table and follow its changes, called with the lock held"""
+        if self.intftable is not None or not sys.platform.startswith("linux"):
+            return
+        if self.inst.intf_factory is not None:
+            return
+        try:
+            self.intftable = netlink.InterfaceTable(self.intf_changed)
+        except (IOError, OSError) as ex:
+            logger.warning("Can't get interfaces from netlink: {}", ex)
+            return
+        self.linkfds.add(self.intftable)
+        if self.selector is not None:
+            self.selector.register(self.intftable, selectors.EVENT_READ, None)
+
+    def intf_changed (self, intf):
+        """An interface changed, regenerate our LSPs if a link's address changed"""
+        with self:
+            links = [ x for x in self.links if x.ifname == intf.name ]
+        for link in links:
+            if intf.mac_addr and intf.mac_addr != link.mac_addr:
+                logger.info("{}: MAC address changed", link)
+                link.mac_addr = intf.mac_addr
+                link.llc_headers = {}
+                link.set_filters()
+            ipv4_prefix = intf.get_ipv4_prefix()
+            if ipv4_prefix == link.ipv4_prefix:
+                continue
+            logger.info("{}: IPv4 address changed from {} to {}", link, link.ipv4_prefix,
+                        ipv4_prefix)
+            link.ipv4_prefix = ipv4_prefix
+            for uproc in self.inst.update:
+                if uproc is not None:
+                    uproc.our_lsp.sched_gen()
+            # The kernel flushes routes through a removed address.
+            self.nexthops_changed(None, True)
+
     def add_link (self, ifname):
         with self:
-            index = len(self.links)
+            self.open_intftable()
+            index = self.next_index
+            self.next_index += 1
             ctype = (clns.CTYPE_L12 & self.inst.is_type)
             link = LanLink(self, ifname, index, ctype)
-            fd = link.getfd()
             self.links.append(link)
-            self.linkfds.add(fd)
             self.linkbyidx[index] = link
-            self.linkbyfd[fd] = link
+            if link.hellointf is not None:
+                self.hellofds.add(link.hellointf)
+            for fd in link.rxintfs:
+                self.linkfds.add(fd)
+                self.linkbyfd[fd] = link
+                if self.selector is not None:
+                    events = selectors.EVENT_READ
+                    if fd in self.wlinkfds:
+                        events |= selectors.EVENT_WRITE
+                    self.selector.register(fd, events, link)
+            for lindex in link.enabled_lindex:
+                self.level_masks[lindex] |= 1 << index
+
+    def remove_link (self, link):
+        """Remove a link unregistering and closing its sockets.
+
+        This should be called in the thread processing packets so the link
+        isn't in use (see process_packets).
+        """
+        with self:
+            if self.linkbyidx.get(link.index) is not link:
+                return
+            self.links.remove(link)
+            del self.linkbyidx[link.index]
+            for lindex in link.enabled_lindex:
+                self.level_masks[lindex] &= ~(1 << link.index)
+                for flag in (SRM, SSN):
+                    self.flags[lindex].pop_column(flag, link.index)
+            self.link_send_unready(link, True)
+            self.hellofds.discard(link.hellointf)
+            for fd in link.rxintfs:
+                self.linkfds.discard(fd)
+                del self.linkbyfd[fd]
+                if self.selector is not None:
+                    self.selector.unregister(fd)
+        link.close()
+
+        # Its adjacencies are gone. XXX purge our pseudonode LSP if we were DIS.
+        for lindex in link.enabled_lindex:
+            self.flood_nbrs_changed(lindex)
+            self.inst.update[lindex].our_lsp.sched_gen()
+        self.nexthops_changed(None)
 
     def get_intf_ipv4_iter (self, unused_lindex):
         def intf_ipv4_iter ():
@@ -89,6 +223,27 @@ class LinkDB (object):
                         yield value
         return lsp_nbr_iter
 
+    def get_nexthop_addrs (self, lindex, sysid):
+        """Get the list of (ifindex, ipv4-address) for the adjacencies with a neighbor"""
+        with self:
+            links = list(self.links)
+        addrs = []
+        for link in links:
+            lxlink = link.lxlink[lindex]
+            if not lxlink:
+                continue
+            for adj in lxlink.adjdb.up_iter():
+                if adj.sysid == sysid and adj.ipv4_addrs:
+                    addrs.append((link.rawintf.ifindex, adj.ipv4_addrs[0]))
+        return addrs
+
+    def nexthops_changed (self, lindex, force=False):
+        """Adjacencies or addresses changed, have the RIB resolve its nexthops again.
+
+        This must not be called with an adjacency DB lock held.
+        """
+        self.inst.rib.nexthops_changed(lindex, force)
+
     def get_link_by_circuit_id (self, unused_lindex, circuit_id):
         return self.linkbyidx[circuit_id]
 
@@ -117,36 +272,89 @@ class LinkDB (object):
 
         return hdr, buf, tlvview
 
+    def _set_write_interest (self, link, want):
+        # Called with the lock held, only changes the selector registration
+        # when the interest changes.
+        fd = link.getfd()
+        if want == (fd in self.wlinkfds):
+            return
+        if want:
+            self.wlinkfds.add(fd)
+        else:
+            self.wlinkfds.remove(fd)
+        if self.selector is not None and fd in self.linkbyfd:
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE if want else selectors.EVENT_READ
+            self.selector.modify(fd, events, link)
+
     def link_send_ready (self, link, nolock=False):
+        # The link only goes unready under the lock after clearing want_write
+        # and then checking for work, so seeing it set here means we're done.
+        if link.want_write:
+            return
         if nolock:
-            self.wlinkfds.add(link.getfd())
+            link.want_write = True
+            self._set_write_interest(link, True)
         else:
             with self:
-                self.wlinkfds.add(link.getfd())
+                link.want_write = True
+                self._set_write_interest(link, True)
 
     def link_send_unready (self, link, nolock=False):
-        fd = link.getfd()
         if nolock:
-            if fd in self.wlinkfds:
-                self.wlinkfds.remove(fd)
+            link.want_write = False
+            self._set_write_interest(link, False)
         else:
             with self:
-                if fd in self.wlinkfds:
-                    self.wlinkfds.remove(fd)
+                link.want_write = False
+                self._set_write_interest(link, False)
+
+    def flood_nbrs_changed (self, lindex):
+        """An adjacency or DIS changed, the flood mask must be computed again"""
+        ftopo = self.inst.flooding[lindex]
+        if ftopo is not None:
+            ftopo.nbrs_changed()
+
+    def get_flood_mask (self, lindex):
+        """Get the mask of links to flood LSPs on for a level"""
+        ftopo = self.inst.flooding[lindex]
+        if ftopo is None:
+            return self.level_masks[lindex]
+        return ftopo.get_flood_mask(self.level_masks[lindex])
 
     def set_all_flag (self, flag, lspseg, butnot):
+        lindex = lspseg.lindex
+        if flag == SRM:
+            flood_mask = self.get_flood_mask(lindex)
         with self:
+            if flag == SRM:
+                mask = flood_mask & self.level_masks[lindex]
+            else:
+                mask = self.level_masks[lindex]
+            if butnot is not None:
+                mask &= ~(1 << butnot.index)
+            mask = self.flags[lindex].set_mask(flag, lspseg, mask)
             for link in self.links:
-                if link != butnot:
-                    link.set_flag_impl(flag, lspseg)
+                if not (mask >> link.index) & 1:
+                    continue
+                if flag != SSN or link.psnp_sched[lindex].ssn_added(1, True):
                     self.link_send_ready(link, True)
+        if debug.FLAGDBG:
+            logger.info("Set {} on all links {:#x} for {}", FLAG_NAMES[flag], mask, lspseg)
 
     def clear_all_flag (self, flag, lspseg, butnot):
+        lindex = lspseg.lindex
         with self:
-            for link in self.links:
-                if link != butnot:
-                    link.clear_flag_impl(flag, lspseg)
-                    link.check_send_unready(True)
+            mask = self.level_masks[lindex]
+            if butnot is not None:
+                mask &= ~(1 << butnot.index)
+            mask = self.flags[lindex].clear_mask(flag, lspseg, mask)
+            # Links left with nothing to send go unready when next writable.
+            if flag == SSN:
+                for link in self.links:
+                    if (mask >> link.index) & 1:
+                        link.psnp_sched[lindex].ssn_removed(1)
+        if debug.FLAGDBG and mask:
+            logger.info("Clear {} on all links {:#x} for {}", FLAG_NAMES[flag], mask, lspseg)
 
     def set_all_srm (self, lspseg, butnot=None):
         assert lspseg.lsphdr.seqno
@@ -162,21 +370,28 @@ class LinkDB (object):
         self.clear_all_flag(SSN, lspseg, butnot)
 
     def process_read_sockets (self, rfds):
-        # XXX need locking if intf remove
+        # Links removed (see remove_link) since the wait have no entry.
         try:
+            # Hellos first so adjacencies don't time out during LSP bursts.
+            if self.hellofds:
+                rfds = sorted(rfds, key=lambda x: x not in self.hellofds)
             for fd in rfds:
-                link = self.linkbyfd[fd]
-                link.receive_packets()
+                if fd is self.intftable:
+                    self.intftable.receive_events()
+                    continue
+                link = self.linkbyfd.get(fd)
+                if link is not None:
+                    link.receive_packets(fd)
         except Exception as ex:
             logger.warning("Unexpected exception in receiving packets: {}", ex)
             raise
 
     def process_write_sockets (self, wfds):
-        # XXX need locking if intf remove
         try:
             for fd in wfds:
-                link = self.linkbyfd[fd]
-                link.send_packets()
+                link = self.linkbyfd.get(fd)
+                if link is not None:
+                    link.send_packets()
         except Exception as ex:
             logger.warning("Unexpected exception in sending packets: {}", ex)
             raise
@@ -184,6 +399,8 @@ class LinkDB (object):
     def process_packets (self):
         # XXX to avoid the race of link going away, we want to process packets
         # in the same thread that we would remove links in.
+        if self.selector is not None:
+            return self.process_packets_selector()
         while True:
             with self:
                 rfds = list(self.linkfds)
@@ -199,6 +416,253 @@ class LinkDB (object):
                 if wfds:
                     self.process_write_sockets(wfds)
 
+    def process_packets_selector (self):
+        """Wait on the persistent selector registrations for links to read or write"""
+        selector = self.selector
+        while True:
+            try:
+                events = selector.select()
+            except (IOError, OSError) as error:
+                if error.errno != errno.EINTR:
+                    raise
+                continue
+            rfds = [ key.fileobj for key, mask in events if mask & selectors.EVENT_READ ]
+            wfds = [ key.fileobj for key, mask in events if mask & selectors.EVENT_WRITE ]
+            if rfds:
+                self.process_read_sockets(rfds)
+            if wfds:
+                self.process_write_sockets(wfds)
+
+
+class FloodScheduler (object):
+    """Pace LSP transmission on a link at a level.
+
+    A token bucket allows a burst of LSPs after which LSPs are sent no faster
+    than one per minimumBroadcastLSPTransmissionInterval. While throttled the
+    link doesn't ask to send LSPs, a timer reschedules it when tokens are
+    available again. LSPs held back by the transmit queue rather than the
+    bucket aren't throttled, the link stays ready to write and a device that
+    is really full (flush_frames blocked) waits for the socket to be writable.
+    """
+    def __init__ (self, link, lindex, interval, burst):
+        self.link = link
+        self.lindex = lindex
+        self.bucket = util.TokenBucket(1 / interval if interval else 0, burst)
+        self.timer = timers.Timer(link.linkdb.timerheap, 0, self.refill_expire)
+        self.throttled = False
+
+        # Statistics
+        self.depth = 0
+        self.max_depth = 0
+        self.sent = 0
+        self.throttle_count = 0
+        self.drain_start = None
+        self.drain_throttled = False
+        self.last_drain_time = None
+
+    def __str__ (self):
+        return "FloodScheduler(L{}: {}: depth {} max {} sent {} throttled {} drain {})".format(
+            self.lindex + 1, self.link, self.depth, self.max_depth, self.sent,
+            self.throttle_count, self.last_drain_time)
+
+    def get_send_count (self, depth):
+        """Return how many of the depth LSPs waiting to flood may be sent now"""
+        self.depth = depth
+        if not depth:
+            return 0
+        self.max_depth = max(self.max_depth, depth)
+        if self.drain_start is None:
+            self.drain_start = time.time()
+            self.drain_throttled = False
+        return self.bucket.consume(depth)
+
+    def lsps_sent (self, count, remaining):
+        self.sent += count
+        self.depth = remaining
+        if remaining and not self.bucket.delay():
+            # Only the transmit queue held these back, keep sending.
+            return
+        if remaining:
+            with self.link.linkdb:
+                if not self.throttled:
+                    self.throttled = True
+                    self.drain_throttled = True
+                    self.throttle_count += 1
+            if not self.timer.scheduled():
+                self.timer.start(self.bucket.delay())
+        elif self.drain_start is not None:
+            self.last_drain_time = time.time() - self.drain_start
+            self.drain_start = None
+            if self.drain_throttled:
+                logger.info("{}: paced flood queue drained in {:f} seconds", self,
+                            self.last_drain_time)
+
+    def refill_expire (self):
+        with self.link.linkdb:
+            self.throttled = False
+            self.link.schedule_send(True)
+
+
+class PSNPScheduler (object):
+    """Accumulate SSN flags on a link at a level into fully packed PSNPs.
+
+    The first SSN flag set opens a window of interval seconds, PSNPs are sent
+    when it closes or as soon as enough entries are waiting to fill a PSNP.
+    """
+    def __init__ (self, link, lindex, interval):
+        self.link = link
+        self.lindex = lindex
+        self.interval = interval
+        self.timer = timers.Timer(link.linkdb.timerheap, 0, self.window_expire)
+        self.ready = not interval
+        self.pending = 0
+        self.capacity = None
+
+        # Statistics
+        self.psnp_count = 0
+        self.entry_count = 0
+
+    def __str__ (self):
+        return "PSNPScheduler(L{}: {}: sent {} entries {})".format(
+            self.lindex + 1, self.link, self.psnp_count, self.entry_count)
+
+    def ssn_added (self, count, nolock=False):
+        """Count SSN flags set, return True if PSNPs should be sent now"""
+        if not nolock:
+            with self.link.linkdb:
+                return self.ssn_added(count, True)
+        self.pending += count
+        if not self.ready:
+            if self.capacity is None:
+                space = self.link.get_pdu_mtu() - sizeof(pdu.PSNPPDU)
+                self.capacity = tlv.get_snp_entry_capacity(space)
+            if self.pending >= self.capacity:
+                self.ready = True
+                self.timer.stop()
+            elif not self.timer.scheduled():
+                self.timer.start(self.interval)
+        return self.ready
+
+    def ssn_removed (self, count):
+        self.pending = max(0, self.pending - count)
+
+    def psnps_sent (self, psnps, entries):
+        with self.link.linkdb:
+            self.pending = 0
+            self.ready = not self.interval
+        self.psnp_count += psnps
+        self.entry_count += entries
+
+    def window_expire (self):
+        with self.link.linkdb:
+            self.ready = True
+            self.link.schedule_send(True)
+
+
+class ReceiveWorker (object):
+    """Receive frames on one socket of a PACKET_FANOUT group in a thread of its own.
+
+    The thread waits for the socket, receives batches of frames, copies them
+    out of the socket's buffers (or receive ring) and queues them for the
+    thread processing packets, which stays the only LSDB writer. That thread
+    is woken by a byte on a socket pair registered in place of the socket. A
+    worker has the receive methods of a socket (fileno, recv_pkts,
+    release_pkts, set_filter and close) so a link reads from it like any
+    other. If the queue is full the worker stops receiving and the socket's
+    buffer (or ring) fills instead.
+    """
+    def __init__ (self, rawintf, maxbatches=RX_WORKER_QUEUE_MAX):
+        self.rawintf = rawintf
+        self.name = rawintf.name
+        self.maxbatches = maxbatches
+        self.batches = deque()
+        self.lock = threading.Lock()
+        self.room = threading.Condition(self.lock)
+        self.stopped = False
+
+        # A byte is waiting on the wake socket while batches are queued.
+        self.wake_rsock, self.wake_wsock = socket.socketpair()
+        self.stop_rsock, self.stop_wsock = socket.socketpair()
+        for sock in (self.wake_rsock, self.wake_wsock, self.stop_rsock, self.stop_wsock):
+            sock.setblocking(False)
+
+        # Statistics
+        self.rx_batches = 0
+        self.rx_frames = 0
+        self.full_count = 0
+
+        self.thread = threading.Thread(name="Receive-{}".format(self.name),
+                                       target=self.receive_frames)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __str__ (self):
+        return "ReceiveWorker({} batches:{} frames:{} full:{})".format(
+            self.name, self.rx_batches, self.rx_frames, self.full_count)
+
+    def receive_frames (self):
+        rawintf = self.rawintf
+        try:
+            while not self.stopped:
+                rfds = select.select([ rawintf, self.stop_rsock ], [], [])[0]
+                if rawintf in rfds:
+                    self.receive_batches()
+        except Exception as ex:
+            if not self.stopped:
+                logger.error("{}: receive stopped: {}", self, ex)
+
+    def receive_batches (self):
+        """Receive and queue batches of frames until the socket is drained"""
+        rawintf = self.rawintf
+        while not self.stopped:
+            pkts = rawintf.recv_pkts()
+            if not pkts:
+                return
+            try:
+                batch = [ memoryview(bytearray(x)) for x in pkts ]
+            finally:
+                rawintf.release_pkts()
+            with self.lock:
+                if len(self.batches) >= self.maxbatches:
+                    self.full_count += 1
+                    while len(self.batches) >= self.maxbatches and not self.stopped:
+                        self.room.wait()
+                if not self.batches:
+                    self.wake_wsock.send(b"\x00")
+                self.batches.append(batch)
+                self.rx_batches += 1
+                self.rx_frames += len(batch)
+
+    def fileno (self):
+        return self.wake_rsock.fileno()
+
+    def recv_pkts (self):
+        """Return the next batch of frames queued by the worker, a list of private buffers"""
+        with self.lock:
+            if not self.batches:
+                return []
+            batch = self.batches.popleft()
+            if not self.batches:
+                self.wake_rsock.recv(1)
+            self.room.notify()
+        return batch
+
+    def release_pkts (self):
+        pass
+
+    def set_filter (self, insns):
+        self.rawintf.set_filter(insns)
+
+    def close (self):
+        with self.lock:
+            self.stopped = True
+            self.room.notify()
+        self.stop_wsock.send(b"\x00")
+        self.thread.join()
+        self.rawintf.close()
+        for sock in (self.wake_rsock, self.wake_wsock, self.stop_rsock, self.stop_wsock):
+            sock.close()
+
 
 class Link (object):
     """Generic Link object"""
@@ -224,27 +688,123 @@ class Link (object):
         # Get raw interface and addresses
         #---------------------------------
 
-        if sys.platform == "darwin":
+        self.hellointf = None
+        self.rxworkers = []
+        if sys.platform == "darwin" and linkdb.inst.intf_factory is None:
             self.rawintf = bpf.BPFInterface(ifname)
+            self.rxintfs = [ self.rawintf ]
         else:
-            self.rawintf = rawsock.RawInterface(ifname)
+            # With receive fanout the link's socket only sends.
+            self.rawintf = self.open_rawintf(ifname, linkdb.inst.rx_fanout <= 1)
             if circtype == clns.CTYPE_L12 or circtype == clns.CTYPE_L1:
                 self.rawintf.add_drop_group(True, clns.ALL_L1_IS)
             if circtype == clns.CTYPE_L12 or circtype == clns.CTYPE_L2:
                 self.rawintf.add_drop_group(True, clns.ALL_L2_IS)
-        self.rawintf.set_filter(bpf.iso_filter)
-        self.mac_addr, self.ipv4_prefix = self.rawintf.get_if_addrs()
-
-        #--------------------------------
-        # SRM and SSN flags for flooding
-        #--------------------------------
-
-        # Flags SRM = 0, SSN = 1
-        # Index by lindex, then by flag.
-        # Lock by lindex.
-        self.flags = [ [ set(), set() ],
-                       [ set(), set() ] ]
-        self.flag_locks = [ threading.Lock(), threading.Lock() ]
+            self.rxintfs = self.open_rx_sockets(ifname)
+        intf = linkdb.intftable.get(ifname) if linkdb.intftable is not None else None
+        if intf is not None and intf.mac_addr:
+            self.mac_addr, self.ipv4_prefix = intf.mac_addr, intf.get_ipv4_prefix()
+        else:
+            self.mac_addr, self.ipv4_prefix = self.rawintf.get_if_addrs()
+        self.set_filters()
+
+        #--------------------------------------------------------
+        # SRM and SSN flags for flooding (column in linkdb.flags)
+        #--------------------------------------------------------
+
+        self.flags = linkdb.flags
+
+        #-----------------------------------------------------------
+        # Frames are queued and sent in batches (sendmmsg) whenever
+        # the socket is writable, frames the device can't take yet
+        # stay queued (backpressure).
+        #-----------------------------------------------------------
+
+        self.txq = deque()
+        self.txq_lock = threading.Lock()
+        self.txq_max = TXQ_MAX
+        self.tx_blocked = False
+        self.want_write = False                             # In the linkdb write set
+
+        # Statistics
+        self.tx_blocked_count = 0
+        self.tx_dropped = 0
+        self.rx_batches = 0
+        self.rx_frames = 0
+        self.rx_max_batch = 0
+
+        inst = linkdb.inst
+        self.flood_sched = [ None, None ]
+        self.psnp_sched = [ None, None ]
+        for lindex in self.enabled_lindex:
+            self.flood_sched[lindex] = FloodScheduler(self, lindex, inst.lsp_tx_interval,
+                                                      inst.lsp_tx_burst)
+            self.psnp_sched[lindex] = PSNPScheduler(self, lindex, inst.psnp_interval)
+
+    def open_rawintf (self, ifname, ring=True):
+        """Open an interface frames are sent and received with.
+
+        This is a raw socket unless the instance has an interface factory
+        (e.g., for a virtual network), which returns an object with the
+        RawInterface methods a link uses: fileno, recv_pkts, release_pkts,
+        sendmmsg, add_drop_group, set_filter, get_if_addrs and close.
+        """
+        inst = self.linkdb.inst
+        if inst.intf_factory is not None:
+            return inst.intf_factory(ifname)
+        ring_blocks = inst.rx_ring_blocks if ring else 0
+        return rawsock.RawInterface(ifname, ring_blocks=ring_blocks, batch=inst.rx_batch)
+
+    def open_rx_sockets (self, ifname):
+        """Open any extra receive sockets returning the list of all of them.
+
+        Frames may be spread over the sockets of a PACKET_FANOUT group, each
+        with a receive worker, so kernel to user delivery is spread over
+        cores. Hellos may get a socket of their own so they're never stuck
+        behind an LSP burst.
+        """
+        rxintfs = [ self.rawintf ]
+        inst = self.linkdb.inst
+        if inst.rx_fanout > 1:
+            group = rawsock.get_fanout_group(self.rawintf.ifindex)
+            for unused in xrange3(0, inst.rx_fanout):
+                rawintf = self.open_rawintf(ifname)
+                rawintf.join_fanout(group, inst.rx_fanout_mode)
+                self.rxworkers.append(ReceiveWorker(rawintf))
+            rxintfs.extend(self.rxworkers)
+        if not inst.rx_hello_socket:
+            return rxintfs
+        # Hellos are few, they don't need a receive ring.
+        self.hellointf = self.open_rawintf(ifname, False)
+        return [ self.hellointf ] + rxintfs
+
+    def set_filters (self):
+        """Compile and attach the kernel filters of the receive sockets.
+
+        Only frames sent to the AllLxIS address of an enabled level, not sent
+        by us and with a PDU type of an enabled level are received, which
+        are the checks on the destination, source and PDU type otherwise
+        done after the frame is read.
+        """
+        dst_macs = [ clns.ALL_LX_IS[x] for x in self.enabled_lindex ]
+        iih_types = [ clns.PDU_TYPE_IIH_LAN_LX[x] for x in self.enabled_lindex ]
+        other_types = [ pdu_types[x]
+                        for pdu_types in (clns.PDU_TYPE_LSP_LX, clns.PDU_TYPE_CSNP_LX,
+                                          clns.PDU_TYPE_PSNP_LX)
+                        for x in self.enabled_lindex ]
+        if self.hellointf is None:
+            insns = bpf.get_iso_filter(dst_macs, self.mac_addr, iih_types + other_types)
+        else:
+            insns = bpf.get_iso_filter(dst_macs, self.mac_addr, other_types)
+            self.hellointf.set_filter(bpf.get_iso_filter(dst_macs, self.mac_addr, iih_types))
+        for rawintf in self.rxintfs:
+            if rawintf is self.hellointf:
+                continue
+            if rawintf is self.rawintf and self.rxworkers:
+                # The receive workers' sockets get the frames.
+                rawintf.set_filter(bpf.drop_filter)
+            else:
+                rawintf.set_filter(insns)
 
     def is_lindex_enabled (self, lindex):
         # is (lindex in self.enabled_lindex) faster?
@@ -259,6 +819,16 @@ class Link (object):
     def fileno (self):
         return self.rawintf.fileno()
 
+    def close (self):
+        """Stop the link's timers and close its sockets, the link is no longer in the linkdb"""
+        for lindex in self.enabled_lindex:
+            self.flood_sched[lindex].timer.stop()
+            self.psnp_sched[lindex].timer.stop()
+        with self.txq_lock:
+            self.txq.clear()
+        for rawintf in self.rxintfs:
+            rawintf.close()
+
     def iih_expire (self, lindex):
         pass
 
@@ -267,49 +837,71 @@ class Link (object):
 
     def schedule_send (self, nolock=False):
         # logger.info("Going SEND READY on {}", self)
-        self.linkdb.link_send_ready(self, nolock)
+        if not self.want_write:
+            self.linkdb.link_send_ready(self, nolock)
+
+    def is_flood_throttled (self, lindex):
+        sched = self.flood_sched[lindex]
+        return sched is not None and sched.throttled
 
     def check_send_unready (self, nolock=False):
         # logger.info("CHECK SEND UNREADY on {}", self)
 
-        # This is a bit ridiculous
-        with self.flag_locks[0]:
-            with self.flag_locks[1]:
-                if ( not self.flags[0][SRM] and not self.flags[0][SSN] and
-                     not self.flags[1][SRM] and not self.flags[1][SSN] ):
-                    # logger.info("GOING UNREADY on {}", self)
-                    self.linkdb.link_send_unready(self, nolock)
+        # Check under the linkdb lock so we can't race with going ready.
+        if not nolock:
+            with self.linkdb:
+                return self.check_send_unready(True)
+
+        # Clear want_write before looking for work so a flag set concurrently
+        # either is seen here or finds want_write clear and takes the lock.
+        self.want_write = False
+        if self.has_send_work():
+            self.want_write = True
+            return
+        # logger.info("GOING UNREADY on {}", self)
+        self.linkdb.link_send_unready(self, True)
+
+    def has_send_work (self):
+        if self.txq:
+            return True
+        # LSPs held back by a throttled flood scheduler and SSN flags waiting
+        # for the PSNP window to close don't count.
+        for lindex in self.enabled_lindex:
+            flags = self.flags[lindex]
+            if self.psnp_sched[lindex].ready and flags.has_column(SSN, self.index):
+                return True
+            if not self.is_flood_throttled(lindex) and flags.has_column(SRM, self.index):
+                return True
+        return False
 
     def set_flag_impl (self, flag, lspseg):
-        lindex = lspseg.lindex
-        with self.flag_locks[lindex]:
-            self.flags[lindex][flag].add(lspseg)
+        if not self.flags[lspseg.lindex].set(flag, lspseg, self.index):
+            return False
         if debug.FLAGDBG:
-            fdesc = [ "SRM", "SSN" ]
-            logger.info("Set {} on {} for {}", fdesc[flag], self, lspseg)
+            logger.info("Set {} on {} for {}", FLAG_NAMES[flag], self, lspseg)
+        return True
 
-    def clear_flag_impl (self, flag, lspseg, nolock=False):
-        lindex = lspseg.lindex
-        if nolock:
-            withobj = util.NoLock()
-        else:
-            withobj = self.flag_locks[lindex]
-        with withobj:
-            try:
-                self.flags[lindex][flag].remove(lspseg)
-            except KeyError:
-                return
+    def clear_flag_impl (self, flag, lspseg):
+        if not self.flags[lspseg.lindex].clear(flag, lspseg, self.index):
+            return
+        if flag == SSN:
+            self.psnp_sched[lspseg.lindex].ssn_removed(1)
         if debug.FLAGDBG:
-            fdesc = [ "SRM", "SSN" ]
-            logger.info("Clear {} on {} for {}", fdesc[flag], self, lspseg)
+            logger.info("Clear {} on {} for {}", FLAG_NAMES[flag], self, lspseg)
 
     def set_flag (self, flag, lspseg):
-        self.set_flag_impl(flag, lspseg)
-        self.schedule_send()
+        if not self.set_flag_impl(flag, lspseg):
+            return
+        if flag != SSN:
+            self.schedule_send()
+            return
+        with self.linkdb:
+            if self.psnp_sched[lspseg.lindex].ssn_added(1, True):
+                self.schedule_send(True)
 
     def clear_flag (self, flag, lspseg):
+        # The link goes unready the next time it's writable with nothing to send.
         self.clear_flag_impl(flag, lspseg)
-        self.check_send_unready()
 
     def set_srm_flag (self, lspseg):
         assert lspseg.lsphdr.seqno
@@ -324,6 +916,53 @@ class Link (object):
     def clear_ssn_flag (self, lspseg):
         self.clear_flag(SSN, lspseg)
 
+    def queue_frame (self, vec):
+        """Queue a frame (a list of buffers) to be sent by flush_frames.
+
+        Control frames (hellos, SNPs) are always queued, LSP flooding only
+        fills the queue up to txq_max (see get_txq_space).
+        """
+        with self.txq_lock:
+            self.txq.append(vec)
+
+    def get_txq_space (self):
+        return max(0, self.txq_max - len(self.txq))
+
+    def flush_frames (self):
+        """Send the queued frames using as few system calls as possible.
+
+        If the device queue is full the unsent frames are kept and the link
+        stays ready to write so they're sent when the socket is writable.
+        """
+        capture = self.linkdb.capture
+        # Hold the lock while sending so frames from different threads stay in order.
+        with self.txq_lock:
+            txq = self.txq
+            while txq:
+                try:
+                    count = self.rawintf.sendmmsg(list(txq))
+                except (IOError, OSError) as ex:
+                    if ex.errno in TX_BLOCKED_ERRNOS:
+                        if not self.tx_blocked:
+                            self.tx_blocked = True
+                            self.tx_blocked_count += 1
+                        break
+                    # Don't let one bad frame hold up the rest.
+                    logger.error("{}: dropping frame: {}", self, ex)
+                    txq.popleft()
+                    self.tx_dropped += 1
+                    continue
+                for unused in xrange3(0, count):
+                    # Capture frames once they're sent, not while they may still be dropped.
+                    vec = txq.popleft()
+                    if capture is not None:
+                        capture.capture(self.ifname, vec, pcap.DIR_OUTBOUND)
+            else:
+                self.tx_blocked = False
+            blocked = self.tx_blocked
+        if blocked:
+            self.schedule_send()
+
     def check_pdu (self, hdr, unused_pdubuf, unused_tlvs):
         # If this wasn't sent to proper mcast addr drop it.
         dst = stringify3(hdr.ether_dst)
@@ -358,13 +997,46 @@ class Link (object):
         # XXX check authentication password
         return True
 
-    def receive_packets (self):
-        pkt = self.rawintf.recv_pkt()
-        if pkt:
-            self.receive_packet(pkt)
-
-    def receive_packet (self, pkt):
+    def receive_packets (self, rawintf=None):
+        """Socket is ready to read so receive batches of frames until it's drained"""
+        if rawintf is None:
+            rawintf = self.rawintf
+        hook = self.linkdb.rx_batch_hook
+        pipeline = self.linkdb.inst.rx_pipeline
+        for unused in xrange3(0, RX_MAX_BATCHES):
+            pkts = rawintf.recv_pkts()
+            if not pkts:
+                return
+            start = time.time()
+            try:
+                decoded = pipeline.decode(pkts)
+                if decoded is None:
+                    for pkt in pkts:
+                        self.receive_packet(pkt)
+                else:
+                    for pkt, tlvs in zip(pkts, decoded):
+                        self.receive_packet(pkt, tlvs)
+            finally:
+                rawintf.release_pkts()
+            count = len(pkts)
+            self.rx_batches += 1
+            self.rx_frames += count
+            if count > self.rx_max_batch:
+                self.rx_max_batch = count
+            if hook is not None:
+                hook(self, count, time.time() - start)
+
+    def receive_packet (self, pkt, tlvs=None):
+        """Receive a frame, tlvs are given for an LSP the pipeline verified and decoded"""
+        capture = self.linkdb.capture
+        if capture is not None:
+            capture.capture(self.ifname, pkt, pcap.DIR_INBOUND)
         frame = pdu.get_frame(pkt)
+        # The LSDB keeps LSPs and their parsed TLVs, so an LSP in a buffer
+        # the kernel will reuse (a receive ring) gets one of its own first.
+        if frame and frame.clns_pdu_type in LSP_PDU_TYPES and not lsp.is_private_buffer(pkt):
+            pkt = memoryview(bytearray(pkt))
+            frame = pdu.get_frame(pkt)
         self.last_frame = frame
         if not frame:
             util.debug_after(1)
@@ -424,13 +1096,20 @@ class Link (object):
         # Parse the TLVs
         #----------------
 
-        try:
-            tlvs = tlv.parse_tlvs(tlvptr, debug.is_dbg(frame))
-        except Exception as ex:
-            traceback.print_exc()
-            logger.error("Unexpected exception on {} while parsing TLVs in PDU {}: {}",
-                         self, frame, ex)
-            return
+        # The receive pipeline may have already decoded them.
+        cksum_verified = tlvs is not None
+        if cksum_verified:
+            if debug.is_dbg(frame):
+                for value in itertools.chain(*tlvs.values()):
+                    logger.info("." * 5 + "{}", value)
+        else:
+            try:
+                tlvs = tlv.parse_tlvs(tlvptr, debug.is_dbg(frame))
+            except Exception as ex:
+                traceback.print_exc()
+                logger.error("Unexpected exception on {} while parsing TLVs in PDU {}: {}",
+                             self, frame, ex)
+                return
 
         #-----------------------------------------
         # Dispatch the PDU to the correct handler
@@ -438,7 +1117,10 @@ class Link (object):
 
         try:
             pdu_method = self.receive_pdu_method[pdu_type]
-            pdu_method(self, pkt, pdubuf, frame, tlvs)
+            if cksum_verified:
+                pdu_method(self, pkt, pdubuf, frame, tlvs, cksum_verified)
+            else:
+                pdu_method(self, pkt, pdubuf, frame, tlvs)
         except Exception as ex:
             traceback.print_exc()
             logger.error("Unexpected exception on {} handling PDU {}: {}",
@@ -468,9 +1150,27 @@ class LanLink (Link):                                       # pylint: disable=R0
         for lindex in self.enabled_lindex:
             self.lxlink[lindex] = LxLanLink(self, lindex)
 
+        # Immutable frame headers keyed by (lindex, 802.3 length)
+        self.llc_headers = {}
+
+    def close (self):
+        for lxlink in self.lxlink:
+            if lxlink is not None:
+                lxlink.close()
+        super(LanLink, self).close()
+
     def get_pdu_mtu (self):
         return self.mtu - sizeof(pdu.LLCFrame)
 
+    def get_flood_nbrs (self, lindex):
+        """Get the set of node-ids LSPs flooded on this link reach"""
+        lxlink = self.lxlink[lindex]
+        if not lxlink:
+            return set()
+        if lxlink.dis is not None:
+            return set([ lxlink.lanid ])
+        return set(adj.sysid + bchr(0) for adj in lxlink.adjdb.up_iter())
+
     def get_lsp_nbr_iter (self, lindex, for_dis):
         def _lsp_nbr_dis_iter ():
             dis = self.get_dis(lindex)
@@ -521,6 +1221,26 @@ class LanLink (Link):                                       # pylint: disable=R0
         hdr.llc_control = 0x03
         return hdr
 
+    def get_llc_header (self, lindex, payload_len):
+        """Get the (cached) immutable frame header and padding for a payload length.
+
+        The payload length includes the LLC header.
+        """
+        key = (lindex, payload_len)
+        try:
+            return self.llc_headers[key]
+        except KeyError:
+            pass
+        if payload_len >= ETHER_MIN_PAYLOAD:
+            pad = None
+        else:
+            pad = ETHER_PADS[ETHER_MIN_PAYLOAD - payload_len]
+        hdr = self.get_llc_frame(lindex)
+        hdr.ether_type = max(payload_len, ETHER_MIN_PAYLOAD)
+        value = (bytes(bytearray(hdr)), pad)
+        self.llc_headers[key] = value
+        return value
+
     def get_iih_buffer (self, lindex):
         maxsize = max(self.get_pdu_mtu(), clns.originatingLxLSPBufferSize(lindex))
 
@@ -600,8 +1320,12 @@ class LanLink (Link):                                       # pylint: disable=R0
 
         # All checks have passed simply process the hello.
         lxlink = self.lxlink[lindex]
-        if lxlink.adjdb.update_adjacency(iih, tlvs):
+        dis_info_changed, nexthops_changed = lxlink.adjdb.update_adjacency(iih, tlvs)
+        if dis_info_changed:
             lxlink.dis_election_info_changed()
+            self.linkdb.flood_nbrs_changed(lindex)
+        if nexthops_changed:
+            self.linkdb.nexthops_changed(lindex)
 
     def dis_election_info_changed(self, lindex):
         """This method is called by AdjDB if DIS election information has changed"""
@@ -647,7 +1371,7 @@ class LanLink (Link):                                       # pylint: disable=R0
 
         return True
 
-    def receive_lsp (self, pkt, pdubuf, lsphdr, tlvs):
+    def receive_lsp (self, pkt, pdubuf, lsphdr, tlvs, cksum_verified=False):
         inst = self.linkdb.inst
         try:
             lindex = pdu.PDU_FRAME_TYPE_LINDEX[lsphdr.clns_pdu_type]
@@ -661,7 +1385,7 @@ class LanLink (Link):                                       # pylint: disable=R0
         if not self.check_update_pdu(lsphdr, pdubuf, tlvs):
             return
 
-        uproc.receive_lsp(self, pkt, pdubuf, lsphdr, tlvs)
+        uproc.receive_lsp(self, pkt, pdubuf, lsphdr, tlvs, cksum_verified)
 
     def receive_snp (self, unused_pkt, pdubuf, snphdr, tlvs):
         inst = self.linkdb.inst
@@ -678,24 +1402,17 @@ class LanLink (Link):                                       # pylint: disable=R0
 
     def send_pdu (self, pduframe, pdubuf, extra):
         pdulen = sizeof(pduframe) + extra
-        # Ethernet requires payload length of 46 bytes.
-        pktlen = pdulen + sizeof(pdu.LLCHeader)
-        if pktlen >= 46:
-            extra = 0
-        else:
-            extra = 46 - pktlen
-            pktlen = 46
+        pktlen = pdulen + LLC_HEADER_LEN
 
         lindex = pdu.PDU_FRAME_TYPE_LINDEX[pduframe.clns_pdu_type]
-        llcframe = self.get_llc_frame(lindex)
-        llcframe.ether_type = pktlen
+        llchdr, pad = self.get_llc_header(lindex, pktlen)
         pduframe.pdu_len = pdulen
-        vec = [llcframe, pdubuf[:pdulen]]
-        if extra:
-            vec.append(b"\x00" * extra)
-        count = self.rawintf.writev(vec)
+        if pad:
+            self.queue_frame([llchdr, pdubuf[:pdulen], pad])
+        else:
+            self.queue_frame([llchdr, pdubuf[:pdulen]])
         if debug.is_dbg(pduframe):
-            logger.info("{} wrote: {} bytes".format(self, count))
+            logger.info("{} queued: {} bytes".format(self, len(llchdr) + pdulen + len(pad or b"")))
 
     def fill_snp_packet (self, ssnflags, tlvview):
         """Fill an SNP packet with SNP entries"""
@@ -713,7 +1430,6 @@ class LanLink (Link):                                       # pylint: disable=R0
                 # XXX don't we need to lock the DB here while we look at this data?
                 lspseg = ssnflags.pop()
                 lsphdr = lspseg.lsphdr
-                self.clear_flag_impl(SSN, lspseg)
 
                 tlvp[0:sz] = snpstruct.pack(lsphdr.lifetime,
                                             stringify3(lsphdr.lspid),
@@ -729,12 +1445,17 @@ class LanLink (Link):                                       # pylint: disable=R0
         return ssnflags, tlvview
 
     def send_packets_psnp (self, lindex):
+        # Wait for the accumulation window to close (or a full PSNP).
+        sched = self.psnp_sched[lindex]
+        if not sched.ready:
+            return
+
         # Get the set of SSN flags and clear
-        with self.flag_locks[lindex]:
-            ssnflags = list(self.flags[lindex][SSN])
-            self.flags[lindex][SSN] = set()
+        ssnflags = self.flags[lindex].pop_column(SSN, self.index)
+        entries = len(ssnflags)
 
         if not ssnflags:
+            sched.psnps_sent(0, 0)
             return
 
         if debug.is_dbg_type(clns.PDU_TYPE_PSNP_LX[lindex]):
@@ -742,31 +1463,15 @@ class LanLink (Link):                                       # pylint: disable=R0
 
         psnp, pdubuf, orig_tlvview = self.get_psnp_buffer(lindex)
 
-        # snpstruct = tlv.SNPEntryStruct
-        # sz = snpstruct.size
-        #
-        # # Determine the total number of entries that fit in a PSNP
-        # tlv_space = len(orig_tlvview)
-        # full_entry_count = 255 // sz
-        # full_tlv_count = tlv_space // 257
-        # short_entry_count = ((tlv_space % 257) - 2) // sz
-        # psnp_tlv_count = full_tlv_count + (1 if short_entry_count else 0)
-        # psnp_entry_count = full_tlv_count * full_entry_count + short_entry_count
-        #
-        # # Determine the number of PSNP we need
-        # count = len(ssnflags)
-        # pktcount = count // psnp_entry_count
-        # if count % psnp_entry_count:
-        #     pktcount += 1
-        # for pi in xrange(0, pktcount):
-        #     ...
-
+        count = 0
         while ssnflags:
             ssnflags, tlvview = self.fill_snp_packet(ssnflags, orig_tlvview)
             extra = len(orig_tlvview) - len(tlvview)
             if debug.is_dbg(psnp):
                 logger.info("Sending 1 PSNP packet")
             self.send_pdu(psnp, pdubuf, extra)
+            count += 1
+        sched.psnps_sent(count, entries)
 
         if debug.is_dbg(psnp):
             logger.debug("DONE SENDING PSNP")
@@ -780,23 +1485,32 @@ class LanLink (Link):                                       # pylint: disable=R0
         # Flood LSP
         #-----------
 
-        # XXX we really want to send no more than 10 at a time, and then wait.
-        # XXX implement with sending timers eventually.
-        with self.flag_locks[lindex]:
-            lsplist = list(self.flags[lindex][SRM])
+        # The flood scheduler paces how many we may send now, no more than
+        # fit in the transmit queue.
+        lsplist = self.flags[lindex].get_column(SRM, self.index)
+        sched = self.flood_sched[lindex]
+        depth = len(lsplist)
+        space = self.get_txq_space()
+        count = sched.get_send_count(min(depth, space))
+
+        # Send our own LSPs and purges first, then topology changes, then the
+        # rest, each in LSP-ID order.
+        if count < depth:
+            lsplist = heapq.nsmallest(count, lsplist, key=lsp.LSPSegment.get_flood_key)
+        else:
+            lsplist.sort(key=lsp.LSPSegment.get_flood_key)
 
         # if debug.is_dbg_type(clns.PDU_TYPE_LSP_LX[lindex]):
         #     logger.info("  LSP {} ", lsplist)
         for lspseg in lsplist:
             # if debug.is_dbg_type(clns.PDU_TYPE_LSP_LX[lindex]):
             #     logger.info("Sending 1 LSP {} on {}", lspseg, self)
-            lspseg.update_lifetime()
-            self.send_lsp(lspseg)
+            if lspseg.update_lifetime():
+                self.send_lsp(lspseg)
             # if debug.is_dbg_type(clns.PDU_TYPE_LSP_LX[lindex]):
             #     logger.info("Sent 1 LSP {} on {}", lspseg, self)
-            with self.flag_locks[lindex]:
-                self.flags[lspseg.lindex][SRM].remove(lspseg)
-                self.clear_flag_impl(SRM, lspseg, nolock=True)
+            self.clear_flag_impl(SRM, lspseg)
+        sched.lsps_sent(count, depth - count)
 
         # if debug.is_dbg_type(clns.PDU_TYPE_LSP_LX[lindex]):
         #     logger.info("DONE SENDING LSP")
@@ -806,28 +1520,23 @@ class LanLink (Link):                                       # pylint: disable=R0
         #-----------
         self.send_packets_psnp(lindex)
 
-        self.check_send_unready()
-
     def send_packets (self):
         """Socket is ready to write so send some packets"""
-        for lindex in self.enabled_lindex:
-            self.send_packets_lindex(lindex)
+        # Frames left from last time go first, while the device is still
+        # full don't build more.
+        self.flush_frames()
+        if not self.tx_blocked:
+            for lindex in self.enabled_lindex:
+                self.send_packets_lindex(lindex)
+            self.flush_frames()
+        self.check_send_unready()
 
     def send_lsp(self, lspseg):
-        llcframe = self.get_llc_frame(lspseg.lindex)
-        payload_len = len(lspseg.pdubuf) + sizeof(pdu.LLCHeader)
-        if payload_len >= 46:
-            extra = None
+        llchdr, pad = self.get_llc_header(lspseg.lindex, len(lspseg.pdubuf) + LLC_HEADER_LEN)
+        if pad:
+            self.queue_frame([llchdr, lspseg.pdubuf, pad])
         else:
-            extra = 46 - payload_len
-            # extra = b"\xFF" * extra -- 0xff easier to see the pad in dumps.
-            extra = b"\x00" * extra
-            payload_len = 46
-        llcframe.ether_type = payload_len
-        if extra:
-            self.rawintf.writev([llcframe, lspseg.pdubuf, extra])
-        else:
-            self.rawintf.writev([llcframe, lspseg.pdubuf])
+            self.queue_frame([llchdr, lspseg.pdubuf])
 
 
 LanLink.receive_pdu_method = {
@@ -885,6 +1594,16 @@ class LxLanLink (object):
     def __str__ (self):
         return "LxLanLink(L{}: {})".format(self.lindex + 1, self.link.ifname)
 
+    def close (self):
+        self.iih_timer.stop()
+        self.dis_timer.stop()
+        self.csnp_timer.stop()
+        if self.pn_lsp is not None:
+            self.pn_lsp.gen_timer.stop()
+        with self.adjdb:
+            for adj in self.adjdb.adjlist:
+                adj.hold_timer.stop()
+
     def dis_find_best (self):
 
         #-----------------
@@ -951,6 +1670,7 @@ class LxLanLink (object):
             logger.info("DIS Change: Old: {} New: {}", old_dis, elect)
 
             self.dis = elect
+            self.link.linkdb.flood_nbrs_changed(self.lindex)
             if elect is None:
                 # No DIS no PN LSP, set LAN ID to us.
                 # Purge if we didn't just do it above the TRAP.
@@ -1012,6 +1732,7 @@ class LxLanLink (object):
         # TLV space is original space minus what we have leftover.
         extra = tlvspace - len(tlvview)
         self.link.send_pdu(iih, pdubuf, extra)
+        self.link.flush_frames()
         self.iih_timer.start(self.hello_interval)
 
         # XXX test.
@@ -1067,6 +1788,7 @@ class LxLanLink (object):
                                                   None)
         csnp, buf, unused = buflist[-1]
         self.close_and_send_csnp(csnp, buf, tlvview, True)
+        self.link.flush_frames()
 
 __author__ = 'Christian Hopps'
 __date__ = 'November 1 2014'
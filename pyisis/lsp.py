@@ -17,10 +17,11 @@
 from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
 from ctypes import sizeof
 from pyisis.bstr import bchr, memspan                       # pylint: disable=E0611
-from pyisis.lib.util import stringify3, tlvrdb, xrange3
+from pyisis.lib.util import stringify3, xrange3
 
 import logbook
 import pyisis.clns as clns
+import pyisis.lib.bufpool as bufpool
 import pyisis.lib.debug as debug
 import pyisis.pdu as pdu
 import pyisis.lib.timers as timers
@@ -32,11 +33,38 @@ logger = logbook.Logger(__name__)
 ZERO_MAX_AGE = 60
 MAX_AGE = 1200
 
+# Flooding priorities, lower is sent first.
+FLOOD_PRIO_URGENT = 0                                       # Our own LSPs and purges
+FLOOD_PRIO_TOPOLOGY = 1                                     # LSPs changing the topology
+FLOOD_PRIO_NORMAL = 2
+
 
 def get_lsp_number (lsphdr):
     return int(lsphdr.lspid[clns.CLNS_LSP_SEGMENT_OFF])
 
 
+def is_private_buffer (buf):
+    """Return True if buf is a view of a bytearray of its own.
+
+    Frames received into a buffer (e.g., from a receive pool) are, frames in
+    a receive ring are views of memory the kernel reuses.
+    """
+    return isinstance(buf, memoryview) and isinstance(getattr(buf, "obj", None), bytearray)
+
+
+def retain_pdu (pdubuf):
+    """Get a PDU buffer the LSDB may keep and patch (e.g., the remaining lifetime).
+
+    Received frames in a buffer of their own are kept as is, avoiding a copy
+    per received LSP, and the buffer is taken out of its receive pool.
+    Anything else is copied.
+    """
+    if is_private_buffer(pdubuf):
+        bufpool.retain(pdubuf.obj)
+        return pdubuf
+    return bytearray(pdubuf)
+
+
 def lsp_id_str (lsp):
     return clns.iso_decode(lsp.lspid)
 
@@ -46,11 +74,16 @@ class LSPSegment (object):
         self.inst = inst
         self.uproc = inst.update[lindex]
         self.lindex = lindex
-        self.pdubuf = bytearray(pdubuf)
+        self.pdubuf = retain_pdu(pdubuf)
         self.lsphdr = util.cast_as(self.pdubuf, pdu.LSPPDU)
         self.tlvview = memoryview(self.pdubuf)[self.lsphdr.clns_len:]
         self.tlvs = tlvs
         self.is_lsp_ack = False                             # Used to indicate only an ack skeleton
+        self.topo_change = False                            # Last update changed the topology
+
+        # Our row in the SRM/SSN flag matrix
+        self.slot = None
+        inst.linkdb.flags[lindex].alloc_slot(self)
 
         self.purge_lock = util.QueryLock()
 
@@ -82,10 +115,21 @@ class LSPSegment (object):
     def get_lspid (self):
         return stringify3(self.lsphdr.lspid)
 
+    def get_flood_key (self):
+        """Get the key to order flooding by: priority then LSP-ID"""
+        lsphdr = self.lsphdr
+        if lsphdr.lifetime == 0 or self.is_ours():
+            prio = FLOOD_PRIO_URGENT
+        elif self.topo_change:
+            prio = FLOOD_PRIO_TOPOLOGY
+        else:
+            prio = FLOOD_PRIO_NORMAL
+        return prio, stringify3(lsphdr.lspid)
+
     def update (self, pdubuf, tlvs):
         """Update the segment based on received packet"""
         with self.purge_lock:
-            self.pdubuf = bytearray(pdubuf)
+            self.pdubuf = retain_pdu(pdubuf)
             self.lsphdr = util.cast_as(self.pdubuf, pdu.LSPPDU)
             self.tlvs = tlvs
 
@@ -136,9 +180,12 @@ class LSPSegment (object):
         self.inst.linkdb.set_all_srm(self)
 
         # b) Retain only LSP header. XXX we need more space for auth and purge tlv
-        self.pdubuf = self.pdubuf[:sizeof(pdu.LSPPDU)]
-        frame = util.cast_as(self.pdubuf, pdu.LSPPDU)
+        # A copy, the received buffer may still be queued to send on a link.
+        self.pdubuf = bytearray(self.pdubuf[:sizeof(pdu.LSPPDU)])
+        self.lsphdr = frame = util.cast_as(self.pdubuf, pdu.LSPPDU)
+        self.tlvview = memoryview(self.pdubuf)[frame.clns_len:]
 
+        frame.lifetime = 0
         frame.checksum = 0
         frame.pdu_len = len(self.pdubuf)
 
@@ -149,6 +196,7 @@ class LSPSegment (object):
 
         # Add in purge TLVs
 
+        self.uproc.lsdb_changed(self)
         logger.info("Adding LSP to DB: {}", self)
 
     def get_segment_number (self):
@@ -167,20 +215,21 @@ class LSPSegment (object):
             if self.lsphdr.lifetime == 0:
                 assert self.zero_lifetime is not None
                 return
-            frame = util.cast_as(self.pdubuf, pdu.LSPPDU)
-            frame.lifetime = 0
             self.hold_timer.stop()
             self.refresh_timer.stop()
             # Since we are "originating" this I suppose we use MAX_AGE
             self._purge_expired(MAX_AGE)
 
     def update_lifetime (self):
-        """Update the lifetime field in the LSP header, may initiate purge"""
+        """Update the lifetime field in the LSP header, may initiate purge.
+
+        Returns False if the LSP has been removed from the LSDB (e.g., its
+        zero age expired after it was picked to be sent).
+        """
         with self.purge_lock:
             # If the lifetime is already zero nothing to update.
             if self.lsphdr.lifetime == 0:
-                assert self.zero_lifetime is not None
-                return
+                return self.zero_lifetime is not None
 
             timeleft = self.lifetime.timeleft()
             self.lsphdr.lifetime = timeleft
@@ -188,9 +237,14 @@ class LSPSegment (object):
                 # We have expired, stop the normal timer, and purge
                 self.hold_timer.stop()
                 self._purge_expired()
+            return True
 
     def expire (self):
         with self.purge_lock:
+            # The LSP was updated, restarting the timer, after it fired.
+            if self.hold_timer.scheduled():
+                return
+
             # Check to see if we have already purged.
             if self.zero_lifetime is not None:
                 # Zero age timer has expired, remove the LSP segment
@@ -202,11 +256,13 @@ class LSPSegment (object):
                 return
 
             if self.lsphdr.seqno == 0:
-                util.debug_after(1)
+                # Only a placeholder for an LSP we requested that never came,
+                # there is nothing to purge.
+                logger.info("Removing unfilled LSP {}", self)
+                self.uproc.remove_lsp(self)
+                return
 
-            # Lifetime timer has expired, set lifetime to 0 and purge.
-            frame = util.cast_as(self.pdubuf, pdu.LSPPDU)
-            frame.lifetime = 0
+            # Lifetime timer has expired, purge.
             self._purge_expired()
 
 
@@ -218,6 +274,9 @@ class OwnLSP (object):
         self.link = link
         self.gen_lock = util.QueryLock()
         self.gen_timer = timers.Timer(inst.timerheap, 0, self.gen_expire)
+        self.gen_backoff = util.Backoff(*inst.lsp_gen_wait)
+        self.gen_count = 0
+        self.gen_suppressed = 0
         self.segments = {}
 
         self.tlv_producers = {}
@@ -228,14 +287,19 @@ class OwnLSP (object):
         else:
             self.nodeid = inst.sysid + bchr(0)
 
-    def sched_gen (self, delay):
+    def sched_gen (self, delay=0):
+        """Schedule regeneration in at least delay seconds subject to the back-off"""
         with self.gen_lock:
             if self.gen_timer.scheduled():
+                # Folded into the pending regeneration.
+                self.gen_suppressed += 1
                 return
-            self.gen_timer.start(delay)
+            self.gen_timer.start(max(delay, self.gen_backoff.delay()))
 
     def gen_expire (self):
         with self.gen_lock:
+            self.gen_backoff.fired()
+            self.gen_count += 1
             self.regenerate()
 
     def get_segment (self, index):
@@ -313,7 +377,7 @@ class OwnLSP (object):
         else:
             lsp, buf, unused = buflist[-1]
             self.update_lsp_db(lsp, buf, tlvview)
-            segment = tlvrdb(lsp.lsphdr.lspid[clns.CLNS_LSP_SEGMENT_OFF]) + 1
+            segment = get_lsp_number(lsp) + 1
             if segment == 256:
                 raise tlv.NoSpaceErorr()
 
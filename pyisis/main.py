@@ -18,6 +18,9 @@ from __future__ import absolute_import, division, nested_scopes, print_function,
 import argparse
 from pyisis.instance import Instance
 import pyisis.clns as clns
+import pyisis.lib.pcap as pcap
+import pyisis.lib.rawsock as rawsock
+import pyisis.rib as rib
 import logbook
 import pdb
 import signal
@@ -49,6 +52,38 @@ def main ():
     parser.add_argument('-a', '--areaid', default='00', help='The Area id')
     parser.add_argument('-p', '--priority', type=int, default=64, help='Priority to run links at')
     parser.add_argument('-s', '--sysid', default="1111.1111.1111", help='The system id')
+    parser.add_argument('--spf-workers', type=int, default=2,
+                        help='Worker processes for SPF (0 runs SPF inline)')
+    parser.add_argument('--fib-jsonl', metavar='FILE', help='Append route updates to FILE')
+    parser.add_argument('--fib-netlink', action="store_true",
+                        help='Install routes in the kernel using netlink')
+    parser.add_argument('--lsp-interval', type=float,
+                        default=clns.MIN_BCAST_LSP_TX_INTERVAL * 1000,
+                        help='Minimum LSP transmission interval in milliseconds (0 is unpaced)')
+    parser.add_argument('--lsp-burst', type=int, default=clns.LSP_TX_BURST,
+                        help='LSPs that may be sent back-to-back before pacing')
+    parser.add_argument('--lsp-gen-wait', type=float, nargs=3,
+                        metavar=('INITIAL', 'SECONDARY', 'MAX'),
+                        default=[ x * 1000 for x in clns.LSP_GEN_WAIT ],
+                        help='LSP generation throttle waits in milliseconds')
+    parser.add_argument('--psnp-interval', type=float, default=clns.PSNP_INTERVAL * 1000,
+                        help='Milliseconds to accumulate PSNP entries (0 sends immediately)')
+    parser.add_argument('--rx-ring-blocks', type=int, default=0,
+                        help='Receive into a memory mapped ring of this many 64KiB blocks (Linux)')
+    parser.add_argument('--rx-batch', type=int, default=rawsock.RECV_BATCH,
+                        help='Frames to receive per system call')
+    parser.add_argument('--rx-workers', type=int, default=0,
+                        help='Worker processes decoding received LSPs in batches (0 is inline)')
+    parser.add_argument('--rx-fanout', type=int, default=1,
+                        help='Receive sockets per interface in a PACKET_FANOUT group (Linux)')
+    parser.add_argument('--rx-fanout-mode', default="hash", choices=sorted(rawsock.FANOUT_MODES),
+                        help='How the kernel spreads frames over the fanout sockets')
+    parser.add_argument('--hello-socket', action="store_true",
+                        help='Receive hellos on a socket of their own (Linux)')
+    parser.add_argument('--pcap', metavar='FILE',
+                        help='Capture the frames sent and received to FILE (pcap-ng)')
+    parser.add_argument('--dynamic-flooding', action="store_true",
+                        help='Flood LSPs only on a computed flooding topology (RFC 9667)')
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbose logging")
     parser.add_argument('--is-type', default='l1', choices=["l1", "l2", "l12"],
                         help='the is-type [l1, l2, l12]')
@@ -90,8 +125,29 @@ def main ():
         print("SysID must be 6 bytes")
         sys.exit(1)
 
-    inst = Instance(is_type, clns.iso_encode(args.areaid), sysid, args.priority)
+    inst = Instance(is_type,
+                    clns.iso_encode(args.areaid),
+                    sysid,
+                    args.priority,
+                    spf_workers=args.spf_workers,
+                    lsp_tx_interval=args.lsp_interval / 1000,
+                    lsp_tx_burst=args.lsp_burst,
+                    dynamic_flooding=args.dynamic_flooding,
+                    lsp_gen_wait=[ x / 1000 for x in args.lsp_gen_wait ],
+                    psnp_interval=args.psnp_interval / 1000,
+                    rx_ring_blocks=args.rx_ring_blocks,
+                    rx_batch=args.rx_batch,
+                    rx_workers=args.rx_workers,
+                    rx_fanout=args.rx_fanout,
+                    rx_fanout_mode=args.rx_fanout_mode,
+                    rx_hello_socket=args.hello_socket)
     debug_inst = inst
+    if args.fib_jsonl:
+        inst.rib.add_sink(rib.JSONLinesSink(args.fib_jsonl))
+    if args.fib_netlink:
+        inst.rib.add_sink(rib.NetlinkSink(inst.linkdb.get_nexthop_addrs))
+    if args.pcap:
+        inst.linkdb.capture = pcap.CaptureWriter(args.pcap)
     for ifname in args.interfaces:
         inst.linkdb.add_link(ifname)
 
@@ -102,6 +158,10 @@ def main ():
         logger.error("UNEXPECTED EXCEPTION: %s", str(ex))
     except:                                                 # pylint: disable=W0702
         logger.error("UNEXPECTED EXCEPTION")
+    finally:
+        if inst.linkdb.capture is not None:
+            inst.linkdb.capture.close()
+        inst.close()
 
 if __name__ == "__main__":
     main()
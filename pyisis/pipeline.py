@@ -0,0 +1,161 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""A staged receive pipeline.
+
+Verifying the checksum of a received LSP and decoding its TLVs are the most
+expensive parts of receiving it. For a batch of received frames with enough
+LSP data (e.g., during an LSDB resync) the LSPs are validated, their checksums
+verified and their TLVs decoded in a pool of worker processes. The decoded
+TLVs come back pickled and are applied in receive order by the single thread
+that updates the LSDB, which then skips the checksum and the decoding.
+Unpickling the TLVs costs that thread about half as much as verifying and
+decoding them, so with a core for each worker a batch is received up to twice
+as fast.
+
+A round trip to the workers costs a few hundred microseconds, about a
+quarter of decoding a full size LSP, so batches with less LSP data than
+PIPELINE_MIN_BYTES are done inline. See benchmarks/bench_pipeline.py for the
+costs and break-even on a given machine.
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from ctypes import sizeof
+from pyisis.lib.cksum import iso_cksum
+from pyisis.lib.util import tlvrdb
+import logbook
+import pyisis.clns as clns
+import pyisis.pdu as pdu
+import pyisis.spf as spf
+import pyisis.tlv as tlv
+
+logger = logbook.Logger(__name__)
+
+# Batches with fewer bytes of LSPs than this are decoded inline.
+PIPELINE_MIN_BYTES = 4096
+
+LSP_PDU_TYPES = (clns.PDU_TYPE_LSP_L1, clns.PDU_TYPE_LSP_L2)
+PDU_TYPE_OFF = pdu.CLNSEtherFrame.clns_pdu_type.offset     # pylint: disable=E1101
+PDU_OFF = sizeof(pdu.EtherHeader) + sizeof(pdu.LLCHeader)
+CKSUM_START = sizeof(pdu.CLNSHeader) + pdu.LSPHeader.lifetime.offset + 2  # pylint: disable=E1101
+
+
+def is_lsp_frame (pkt):
+    return len(pkt) > PDU_TYPE_OFF and (tlvrdb(pkt[PDU_TYPE_OFF]) & 0x1F) in LSP_PDU_TYPES
+
+
+def verify_lsp_frame (pkt):
+    """Return True if pkt is a valid LSP frame whose checksum is correct.
+
+    A purge (zero lifetime) is never verified as its checksum isn't checked.
+    """
+    if len(pkt) < sizeof(pdu.LSPFrame):
+        return False
+    frame = pdu.LSPFrame.from_buffer_copy(pkt[:sizeof(pdu.LSPFrame)])
+    if frame.clns_pdu_type not in LSP_PDU_TYPES or not frame.lifetime:
+        return False
+    pdulen = frame.pdu_len
+    if pdulen < sizeof(pdu.LSPPDU) or PDU_OFF + pdulen > len(pkt):
+        return False
+    if pdulen > clns.receiveLSPBufferSize():
+        return False
+    return iso_cksum(memoryview(pkt)[PDU_OFF + CKSUM_START:PDU_OFF + pdulen]) == 0
+
+
+def decode_lsp_frame (pkt):
+    """Return the TLVs of pkt if it is a valid LSP frame whose checksum is correct or None.
+
+    None is also returned if the TLVs can't be decoded, the receive thread
+    then decodes them again and reports the error.
+    """
+    if not verify_lsp_frame(pkt):
+        return None
+    frame = pdu.LSPFrame.from_buffer_copy(pkt[:sizeof(pdu.LSPFrame)])
+    try:
+        return tlv.parse_tlvs(memoryview(pkt)[PDU_OFF + frame.clns_len:PDU_OFF + frame.pdu_len],
+                              False)
+    except Exception:
+        return None
+
+
+def decode_lsp_frames (pkts):
+    """Decode a list of LSP frames (run in a worker) returning a list of results"""
+    return [ decode_lsp_frame(pkt) for pkt in pkts ]
+
+
+class ReceivePipeline (object):
+    """Verify and decode the LSPs in batches of received frames using worker processes.
+
+    With workers == 0 nothing is done here and LSPs are verified and decoded
+    as they are received.
+    """
+    def __init__ (self, workers=0, min_bytes=PIPELINE_MIN_BYTES):
+        self.workers = workers
+        self.min_bytes = max(1, min_bytes)
+        self.executor = spf.SPFExecutor(workers) if workers else None
+
+        # Statistics
+        self.batches = 0
+        self.decoded = 0
+        self.failed = 0
+
+    def __str__ (self):
+        return "ReceivePipeline(workers:{} batches:{} decoded:{} failed:{})".format(
+            self.workers, self.batches, self.decoded, self.failed)
+
+    def decode (self, pkts):
+        """Return a list with the TLVs of each frame that is an LSP with a verified checksum.
+
+        Other frames have None. Returns None if the batch wasn't worth sending
+        to the workers.
+        """
+        if self.executor is None:
+            return None
+        lspidx = [ index for index, pkt in enumerate(pkts) if is_lsp_frame(pkt) ]
+        if sum(len(pkts[x]) for x in lspidx) < self.min_bytes:
+            return None
+
+        # The workers and this thread each get a chunk, so it isn't idle while
+        # they're busy. Workers get copies, frames may be in buffers that will
+        # be reused.
+        nchunks = self.workers + 1
+        chunk = (len(lspidx) + nchunks - 1) // nchunks
+        jobs = []
+        for start in range(chunk, len(lspidx), chunk):
+            frames = [ bytes(pkts[x]) for x in lspidx[start:start + chunk] ]
+            jobs.append((start, self.executor.submit(decode_lsp_frames, frames)))
+
+        decoded = [ None ] * len(pkts)
+        for index in lspidx[:chunk]:
+            decoded[index] = decode_lsp_frame(pkts[index])
+        for start, future in jobs:
+            for offset, result in enumerate(future.result()):
+                decoded[lspidx[start + offset]] = result
+        self.batches += 1
+        count = sum(1 for x in decoded if x is not None)
+        self.decoded += count
+        self.failed += len(lspidx) - count
+        return decoded
+
+    def shutdown (self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,525 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Routing Information Base.
+
+The RIB holds the routes computed by the decision processes of both levels in
+a Patricia trie. Each decision process hands the RIB only the deltas from its
+previous run; the RIB selects the best route per prefix (Level-1 is preferred
+over Level-2) and publishes only the resulting changes, in batches, to any
+number of sinks (e.g., the kernel FIB).
+"""
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+import binascii
+import ipaddress
+import json
+import logbook
+import socket
+import threading
+import pyisis.clns as clns
+import pyisis.lib.netlink as netlink
+
+logger = logbook.Logger(__name__)
+
+ROUTE_ADD = "add"
+ROUTE_CHANGE = "change"
+ROUTE_DELETE = "delete"
+
+RIB_BATCH_SIZE = 1000
+"""Maximum number of route updates published to a sink at once"""
+
+KERNEL_ROUTE_PRIORITY = 115
+"""Kernel priority of installed routes, the IS-IS metric isn't a kernel preference"""
+
+
+#==============
+# Patricia Trie
+#==============
+
+
+class _TrieNode (object):
+    __slots__ = [ "bits", "plen", "value", "has_value", "child" ]
+
+    def __init__ (self, bits, plen):
+        self.bits = bits
+        self.plen = plen
+        self.value = None
+        self.has_value = False
+        self.child = [ None, None ]
+
+
+class PatriciaTrie (object):
+    """A path compressed binary trie keyed by (packed-address, prefix-length)"""
+    def __init__ (self, width=32):
+        self.width = width
+        self.root = None
+        self.count = 0
+
+    def __len__ (self):
+        return self.count
+
+    def __contains__ (self, prefix):
+        return self._find(*self._key(prefix)) is not None
+
+    def __iter__ (self):
+        for prefix, unused in self.items():
+            yield prefix
+
+    def _key (self, prefix):
+        addr, plen = prefix
+        if len(addr) * 8 != self.width or not 0 <= plen <= self.width:
+            raise ValueError("Bad prefix {}/{} for {} bit trie".format(addr, plen, self.width))
+        bits = int(binascii.hexlify(addr), 16)
+        # Clear any host bits.
+        return (bits >> (self.width - plen)) << (self.width - plen) if plen else 0, plen
+
+    def _prefix (self, node):
+        addr = binascii.unhexlify("{:0{}x}".format(node.bits, self.width // 4))
+        return addr, node.plen
+
+    def _bit (self, bits, index):
+        return (bits >> (self.width - 1 - index)) & 1
+
+    def _common (self, abits, alen, bbits, blen):
+        """Return the length of the common leading bits of 2 prefixes"""
+        plen = min(alen, blen)
+        if not plen:
+            return 0
+        diff = (abits ^ bbits) >> (self.width - plen)
+        return plen - diff.bit_length()
+
+    def _find (self, bits, plen):
+        node = self.root
+        while node and node.plen <= plen:
+            if self._common(bits, plen, node.bits, node.plen) < node.plen:
+                return None
+            if node.plen == plen:
+                return node if node.has_value else None
+            node = node.child[self._bit(bits, node.plen)]
+        return None
+
+    def get (self, prefix, default=None):
+        node = self._find(*self._key(prefix))
+        return node.value if node else default
+
+    def __getitem__ (self, prefix):
+        node = self._find(*self._key(prefix))
+        if not node:
+            raise KeyError(prefix)
+        return node.value
+
+    def __setitem__ (self, prefix, value):
+        bits, plen = self._key(prefix)
+        parent = None
+        node = self.root
+        while node:
+            common = self._common(bits, plen, node.bits, node.plen)
+            if common < node.plen:
+                break
+            if node.plen == plen:
+                if not node.has_value:
+                    self.count += 1
+                node.value = value
+                node.has_value = True
+                return
+            parent = node
+            node = node.child[self._bit(bits, node.plen)]
+
+        new = _TrieNode(bits, plen)
+        new.value = value
+        new.has_value = True
+        self.count += 1
+
+        if node:
+            if common == plen:
+                # The new prefix covers the existing node.
+                new.child[self._bit(node.bits, plen)] = node
+            else:
+                # Both hang off a new internal node for the common bits.
+                glue = _TrieNode((bits >> (self.width - common)) << (self.width - common)
+                                 if common else 0,
+                                 common)
+                glue.child[self._bit(node.bits, common)] = node
+                glue.child[self._bit(bits, common)] = new
+                new = glue
+        self._replace(parent, bits, new)
+
+    def _replace (self, parent, bits, node):
+        if parent is None:
+            self.root = node
+        else:
+            parent.child[self._bit(bits, parent.plen)] = node
+
+    def __delitem__ (self, prefix):
+        bits, plen = self._key(prefix)
+        path = []
+        node = self.root
+        while node and node.plen < plen:
+            path.append(node)
+            node = node.child[self._bit(bits, node.plen)]
+        if (not node or node.plen != plen or not node.has_value or
+                self._common(bits, plen, node.bits, node.plen) < plen):
+            raise KeyError(prefix)
+
+        node.value = None
+        node.has_value = False
+        self.count -= 1
+
+        # Remove the node or any internal node left with a single child.
+        while node and not node.has_value:
+            children = [ x for x in node.child if x ]
+            if len(children) == 2:
+                break
+            parent = path.pop() if path else None
+            self._replace(parent, node.bits, children[0] if children else None)
+            node = parent
+
+    def pop (self, prefix, *default):
+        try:
+            value = self[prefix]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[prefix]
+        return value
+
+    def longest_match (self, addr):
+        """Return the (prefix, value) of the longest prefix containing addr or None"""
+        bits, unused = self._key((addr, self.width))
+        match = None
+        node = self.root
+        while node:
+            if self._common(bits, self.width, node.bits, node.plen) < node.plen:
+                break
+            if node.has_value:
+                match = node
+            if node.plen == self.width:
+                break
+            node = node.child[self._bit(bits, node.plen)]
+        return (self._prefix(match), match.value) if match else None
+
+    def items (self):
+        """Iterate (prefix, value) in address then prefix length order"""
+        stack = [ self.root ] if self.root else []
+        while stack:
+            node = stack.pop()
+            if node.has_value:
+                yield self._prefix(node), node.value
+            for child in reversed(node.child):
+                if child:
+                    stack.append(child)
+
+
+#=====
+# RIB
+#=====
+
+
+class RouteEntry (object):
+    """A selected route, the version is the RIB version at which it last changed"""
+    __slots__ = [ "prefix", "metric", "nexthops", "lindex", "version" ]
+
+    def __init__ (self, prefix, metric, nexthops, lindex, version):
+        self.prefix = prefix
+        self.metric = metric
+        self.nexthops = nexthops
+        self.lindex = lindex
+        self.version = version
+
+    def __str__ (self):
+        return "RouteEntry({} metric {} L{} via {} v{})".format(
+            prefix_str(self.prefix), self.metric, self.lindex + 1,
+            ", ".join(clns.iso_decode(x) for x in sorted(self.nexthops)), self.version)
+
+    def same_route (self, other):
+        return (self.metric == other.metric and self.nexthops == other.nexthops and
+                self.lindex == other.lindex)
+
+
+class _RIBPrefix (object):
+    __slots__ = [ "levels", "entry" ]
+
+    def __init__ (self):
+        self.levels = [ None, None ]
+        self.entry = None
+
+
+class RIB (object):
+    def __init__ (self, sinks=None, batch_size=RIB_BATCH_SIZE):
+        self.trie = PatriciaTrie(32)
+        self.sinks = list(sinks) if sinks else []
+        self.batch_size = batch_size
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def __len__ (self):
+        return len(self.trie)
+
+    def __str__ (self):
+        return "RIB({} prefixes v{})".format(len(self.trie), self.version)
+
+    def add_sink (self, sink):
+        with self.lock:
+            self.sinks.append(sink)
+            # Bring the new sink up-to-date.
+            updates = [ (ROUTE_ADD, rp.entry) for unused, rp in self.trie.items() if rp.entry ]
+            self._publish([ sink ], updates)
+
+    def get (self, prefix):
+        """Get the selected route entry for a prefix"""
+        with self.lock:
+            rp = self.trie.get(prefix)
+            return rp.entry if rp else None
+
+    def lookup (self, addr):
+        """Get the selected route entry for the longest match of a packed address"""
+        with self.lock:
+            match = self.trie.longest_match(addr)
+            return match[1].entry if match else None
+
+    def entries (self):
+        with self.lock:
+            return [ rp.entry for unused, rp in self.trie.items() if rp.entry ]
+
+    def update (self, lindex, adds, changes, deletes):
+        """Apply a decision process route delta and publish the changes.
+
+        The delta lists are of (prefix, (metric, nexthops)) as returned by
+        spf.route_delta. Returns the number of selected route changes.
+        """
+        with self.lock:
+            self.version += 1
+            updates = []
+            for prefix, route in adds + changes:
+                rp = self.trie.get(prefix)
+                if rp is None:
+                    rp = self.trie[prefix] = _RIBPrefix()
+                rp.levels[lindex] = route
+                self._select(prefix, rp, updates)
+            for prefix, unused in deletes:
+                rp = self.trie.get(prefix)
+                if rp is None:
+                    continue
+                rp.levels[lindex] = None
+                self._select(prefix, rp, updates)
+                if not rp.entry:
+                    del self.trie[prefix]
+            self._publish(self.sinks, updates)
+        return len(updates)
+
+    def _select (self, prefix, rp, updates):
+        old = rp.entry
+        new = None
+        # ISO10589 7.2.12.1 Level-1 routes are preferred over Level-2.
+        for lindex, route in enumerate(rp.levels):
+            if route:
+                metric, nexthops = route
+                new = RouteEntry(prefix, metric, nexthops, lindex, self.version)
+                break
+
+        if not new:
+            if old:
+                rp.entry = None
+                updates.append((ROUTE_DELETE, old))
+        elif not old:
+            rp.entry = new
+            updates.append((ROUTE_ADD, new))
+        elif not old.same_route(new):
+            rp.entry = new
+            updates.append((ROUTE_CHANGE, new))
+
+    def _publish (self, sinks, updates):
+        for i in range(0, len(updates), self.batch_size):
+            batch = updates[i:i + self.batch_size]
+            for sink in sinks:
+                try:
+                    sink.publish(self.version, batch)
+                except Exception as ex:                     # pylint: disable=W0703
+                    logger.error("{}: publish to {} failed: {}", self, sink, ex)
+
+    def nexthops_changed (self, lindex=None, force=False):
+        """The adjacencies or addresses used to resolve nexthops changed.
+
+        The selected routes of the level (or all routes if lindex is None) are
+        handed to the sinks to be resolved again. With force they are reinstalled
+        even if they resolve as before (e.g., the kernel may have flushed them).
+        """
+        with self.lock:
+            entries = [ rp.entry for unused, rp in self.trie.items()
+                        if rp.entry and (lindex is None or rp.entry.lindex == lindex) ]
+            for i in range(0, len(entries), self.batch_size):
+                batch = entries[i:i + self.batch_size]
+                for sink in self.sinks:
+                    try:
+                        sink.republish(self.version, batch, force)
+                    except Exception as ex:                 # pylint: disable=W0703
+                        logger.error("{}: republish to {} failed: {}", self, sink, ex)
+
+    def close (self):
+        with self.lock:
+            for sink in self.sinks:
+                sink.close()
+
+
+#=======
+# Sinks
+#=======
+
+
+class RIBSink (object):
+    """A consumer of RIB route updates"""
+    def publish (self, version, updates):
+        """Publish a batch of (op, RouteEntry) updates for the given RIB version"""
+        raise NotImplementedError()
+
+    def republish (self, version, entries, force=False):
+        """Resolve the nexthops of a batch of RouteEntry again, if the sink resolves them"""
+        pass
+
+    def close (self):
+        pass
+
+
+class MemorySink (RIBSink):
+    """Maintain a copy of the selected routes in a dictionary"""
+    def __init__ (self):
+        self.table = {}
+        self.version = 0
+        self.batches = 0
+
+    def __str__ (self):
+        return "MemorySink"
+
+    def publish (self, version, updates):
+        for op, entry in updates:
+            if op == ROUTE_DELETE:
+                del self.table[entry.prefix]
+            else:
+                self.table[entry.prefix] = entry
+        self.version = version
+        self.batches += 1
+
+
+class JSONLinesSink (RIBSink):
+    """Append route updates to a file one JSON object per line"""
+    def __init__ (self, path):
+        self.path = path
+        self.file = open(path, "a")
+
+    def __str__ (self):
+        return "JSONLinesSink({})".format(self.path)
+
+    def publish (self, version, updates):
+        lines = []
+        for op, entry in updates:
+            obj = { "version": version,
+                    "op": op,
+                    "prefix": prefix_str(entry.prefix),
+                    "level": entry.lindex + 1,
+                    "metric": entry.metric,
+                    "nexthops": [ clns.iso_decode(x) for x in sorted(entry.nexthops) ] }
+            lines.append(json.dumps(obj, sort_keys=True) + "\n")
+        self.file.write("".join(lines))
+        self.file.flush()
+
+    def close (self):
+        self.file.close()
+
+
+class NetlinkSink (RIBSink):
+    """Program routes into the kernel with one netlink send per batch.
+
+    The resolve function is called with (lindex, nexthop-system-id) and should
+    return a list of (ifindex, packed-ipv4-gateway) for the nexthop. All routes
+    are installed with the same kernel priority, it is part of the kernel's
+    route key so a metric change must not add a second route.
+    """
+    def __init__ (self, resolve, table=netlink.RT_TABLE_MAIN, priority=KERNEL_ROUTE_PRIORITY):
+        self.resolve = resolve
+        self.table = table
+        self.priority = priority
+        self.nlsock = netlink.NetlinkSocket()
+        # The resolved nexthops of the installed routes by prefix.
+        self.installed = {}
+
+    def __str__ (self):
+        return "NetlinkSink(table {})".format(self.table)
+
+    def publish (self, version, updates):
+        requests = []
+        for op, entry in updates:
+            if op == ROUTE_DELETE:
+                self._remove(entry, requests)
+            else:
+                self._install(entry, requests, False)
+        self._send(requests)
+
+    def republish (self, version, entries, force=False):
+        requests = []
+        for entry in entries:
+            self._install(entry, requests, force)
+        self._send(requests)
+
+    def _install (self, entry, requests, force):
+        nexthops = []
+        for nexthop in sorted(entry.nexthops):
+            nexthops.extend(self.resolve(entry.lindex, nexthop))
+        if not nexthops:
+            # Unresolvable, remove anything previously installed.
+            self._remove(entry, requests)
+            return
+        nexthops = tuple(nexthops)
+        if not force and self.installed.get(entry.prefix) == nexthops:
+            return
+        self.installed[entry.prefix] = nexthops
+        addr, plen = entry.prefix
+        payload = netlink.get_route_payload(socket.AF_INET, addr, plen, nexthops,
+                                            self.table, priority=self.priority)
+        requests.append((netlink.RTM_NEWROUTE,
+                         netlink.NLM_F_CREATE | netlink.NLM_F_REPLACE,
+                         payload,
+                         entry))
+
+    def _remove (self, entry, requests):
+        if self.installed.pop(entry.prefix, None) is None:
+            return
+        addr, plen = entry.prefix
+        payload = netlink.get_route_payload(socket.AF_INET, addr, plen, (), self.table,
+                                            priority=self.priority)
+        requests.append((netlink.RTM_DELROUTE, 0, payload, entry))
+
+    def _send (self, requests):
+        if not requests:
+            return
+        failed = self.nlsock.send_batch([ x[:3] for x in requests ])
+        for index, error in failed:
+            logger.error("{}: {} {} failed: errno {}", self, requests[index][0],
+                         requests[index][3], error)
+
+    def close (self):
+        self.nlsock.close()
+
+
+def prefix_str (prefix):
+    addr, pfxlen = prefix
+    return "{}/{}".format(ipaddress.ip_address(addr), pfxlen)
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,717 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from pyisis.bstr import bchr                                # pylint: disable=E0611
+from pyisis.lib.util import tlvrdb
+from pyisis.rib import prefix_str
+
+import collections
+import heapq
+import logbook
+import threading
+import time
+import pyisis.clns as clns
+import pyisis.lib.timers as timers
+import pyisis.tlv as tlv
+
+try:
+    import concurrent.futures as futures
+    import multiprocessing
+except ImportError:
+    futures = None
+
+logger = logbook.Logger(__name__)
+
+SPF_DELAY = .5
+"""Seconds to wait after an LSDB change before running SPF"""
+
+SPT_CACHE_SIZE = 64
+"""Default number of SPT results to cache"""
+
+#===========================================================================
+# Topology snapshot
+#
+# The snapshot is what is shipped to a worker process so it is kept to plain
+# builtin types. It is a dictionary keyed by node-id (system-id + pseudonode
+# id) with values of (overload, { neighbor-node-id: metric }, prefixes). The
+# prefixes are a tuple of ((packed-address, prefix-length), metric).
+#===========================================================================
+
+
+def lsp_nbrs_iter (tlvs):
+    for ntlv in tlvs[tlv.TLV_EXT_IS_REACH]:
+        for entry in ntlv.values:
+            yield bytes(entry.neighbor), entry.metric
+
+
+def lsp_prefixes_iter (tlvs):
+    for ptlv in tlvs[tlv.TLV_EXT_IPV4_PREFIX]:
+        for entry in ptlv.values:
+            if entry.updown:
+                continue
+            yield (entry.addr.packed, entry.pfxlen), entry.metric
+
+
+def get_lsp_topology (lspseg):
+    """Get the part of an LSP segment that affects the SPT or None if not used by SPF"""
+    lsphdr = lspseg.lsphdr
+    if not lsphdr.seqno or not lsphdr.lifetime or not lspseg.tlvs:
+        return None
+    lspid = lspseg.get_lspid()
+    # Overload is only looked at in segment 0
+    overload = bool(lsphdr.overload) if tlvrdb(lspid[clns.CLNS_LSP_SEGMENT_OFF]) == 0 else None
+    return overload, tuple(sorted(lsp_nbrs_iter(lspseg.tlvs)))
+
+
+def get_snapshot (uproc):
+    """Get a compact topology snapshot of the LSDB of an update process"""
+    return get_versioned_snapshot(uproc)[1]
+
+
+def get_versioned_snapshot (uproc):
+    """Get the topology version and a snapshot of the LSDB of an update process"""
+    nodes = {}
+    overload = {}
+    with uproc.dblock:
+        version = uproc.topology_version
+        for lspid, lspseg in uproc.dbhash.items():
+            lsphdr = lspseg.lsphdr
+            if not lsphdr.seqno or not lsphdr.lifetime or not lspseg.tlvs:
+                continue
+
+            nodeid = lspid[:clns.CLNS_NODEID_LEN]
+            if tlvrdb(lspid[clns.CLNS_LSP_SEGMENT_OFF]) == 0:
+                overload[nodeid] = bool(lsphdr.overload)
+
+            try:
+                nbrs, prefixes = nodes[nodeid]
+            except KeyError:
+                nbrs, prefixes = nodes[nodeid] = ({}, [])
+
+            for nbr, metric in lsp_nbrs_iter(lspseg.tlvs):
+                if nbr not in nbrs or metric < nbrs[nbr]:
+                    nbrs[nbr] = metric
+            prefixes.extend(lsp_prefixes_iter(lspseg.tlvs))
+
+    # ISO10589: 7.2.5 ignore a node whose LSP number zero isn't present.
+    return version, dict((nodeid, (overload[nodeid], nbrs, tuple(prefixes)))
+                         for nodeid, (nbrs, prefixes) in nodes.items()
+                         if nodeid in overload)
+
+
+def is_pnode (nodeid):
+    return tlvrdb(nodeid[clns.CLNS_LSP_PNID_OFF]) != 0
+
+
+#============================================================
+# SPF and route computation, these run in a worker process.
+#============================================================
+
+
+def compute_spt (snapshot, root):
+    """Compute the shortest path tree rooted at root.
+
+    Returns a dictionary keyed by reachable node-id of (distance, nexthops) where
+    nexthops is a frozenset of the system-ids of the adjacent systems used to
+    reach the node. Nodes directly attached to the root through a LAN have
+    themselves as nexthop, the LAN pseudonode itself has no nexthops.
+    """
+    spt = {}
+    dist = { root: 0 }
+    nexthops = { root: frozenset() }
+    # Pseudonodes are popped before other nodes at the same distance so that
+    # equal cost paths through their zero cost edges are found.
+    heap = [ (0, False, root) ]
+    while heap:
+        d, unused, node = heapq.heappop(heap)
+        if node in spt:
+            continue
+        spt[node] = (d, nexthops[node])
+
+        try:
+            overload, nbrs, unused = snapshot[node]
+        except KeyError:
+            continue
+        if overload and node != root:
+            continue
+
+        for nbr, metric in nbrs.items():
+            if nbr in spt:
+                continue
+            # Two-way connectivity check
+            try:
+                if node not in snapshot[nbr][1]:
+                    continue
+            except KeyError:
+                continue
+
+            if node == root or (is_pnode(node) and not nexthops[node]):
+                if is_pnode(nbr):
+                    nbrhops = frozenset()
+                else:
+                    nbrhops = frozenset((nbr[:clns.CLNS_SYSID_LEN],))
+            else:
+                nbrhops = nexthops[node]
+
+            nd = d + metric
+            if nbr not in dist or nd < dist[nbr]:
+                dist[nbr] = nd
+                nexthops[nbr] = nbrhops
+                heapq.heappush(heap, (nd, not is_pnode(nbr), nbr))
+            elif nd == dist[nbr]:
+                nexthops[nbr] = nexthops[nbr] | nbrhops
+    return spt
+
+
+def compute_routes (snapshot, spt):
+    """Compute the IPv4 routes given a topology snapshot and its SPT.
+
+    Returns a dictionary keyed by (packed-address, prefix-length) of (metric, nexthops).
+    Prefixes advertised by the root itself are not included.
+    """
+    routes = {}
+    for node, (d, nexthops) in spt.items():
+        if not nexthops:
+            continue
+        for prefix, metric in snapshot[node][2]:
+            metric += d
+            try:
+                rmetric, rhops = routes[prefix]
+            except KeyError:
+                routes[prefix] = (metric, nexthops)
+                continue
+            if metric < rmetric:
+                routes[prefix] = (metric, nexthops)
+            elif metric == rmetric:
+                routes[prefix] = (metric, rhops | nexthops)
+    return routes
+
+
+def run_spf (snapshot, root):
+    """Run SPF and route computation returning the SPT and routes"""
+    spt = compute_spt(snapshot, root)
+    return spt, compute_routes(snapshot, spt)
+
+
+def run_prc (snapshot, spt):
+    """Run only the route computation (partial route calculation) using an existing SPT"""
+    return spt, compute_routes(snapshot, spt)
+
+
+def route_delta (old, new):
+    """Return the lists of (prefix, route) added, changed and deleted going from old to new"""
+    adds = []
+    changes = []
+    for prefix, route in new.items():
+        try:
+            oroute = old[prefix]
+        except KeyError:
+            adds.append((prefix, route))
+            continue
+        if oroute != route:
+            changes.append((prefix, route))
+    deletes = [ (prefix, route) for prefix, route in old.items() if prefix not in new ]
+    return adds, changes, deletes
+
+
+def compute_distances (snapshot, root):
+    """Compute just the distances of the shortest path tree rooted at root"""
+    return dict((node, d) for node, (d, unused) in compute_spt(snapshot, root).items())
+
+
+def get_prefix_advertisers (snapshot, root):
+    advertisers = {}
+    for node, (unused, unused_nbrs, prefixes) in snapshot.items():
+        if node == root:
+            continue
+        for prefix, metric in prefixes:
+            advertisers.setdefault(prefix, []).append((node, metric))
+    return advertisers
+
+
+def prefix_distance (dist, advertisers):
+    """Return the distance to the closest advertiser of a prefix or None if unreachable"""
+    best = None
+    for node, metric in advertisers:
+        if node in dist:
+            d = dist[node] + metric
+            if best is None or d < best:
+                best = d
+    return best
+
+
+def compute_pq_nodes (root, enode, sdist, edist):
+    """Compute the PQ nodes for protecting the link from root to neighbor enode (RFC 7490).
+
+    sdist and edist are the distances from the root and from enode. Metrics are
+    assumed to be symmetric so that enode rooted distances may stand in for the
+    reverse SPF used to compute Q-space.
+    """
+    try:
+        link_metric = sdist[enode]
+    except KeyError:
+        return ()
+    pq = []
+    for node, d_sp in sdist.items():
+        if node == root or node == enode or is_pnode(node):
+            continue
+        try:
+            d_ep = edist[node]
+        except KeyError:
+            continue
+        # P-space: root reaches node without using the link to E
+        # Q-space: node reaches E without using the link from the root
+        if d_sp < link_metric + d_ep and d_ep < d_sp + link_metric:
+            pq.append((d_sp, node[:clns.CLNS_SYSID_LEN]))
+    return tuple(sysid for unused, sysid in sorted(pq))
+
+
+def compute_backups (snapshot, root, sdist, nbrdists, routes):
+    """Compute LFA (RFC 5286) and remote-LFA (RFC 7490) candidates.
+
+    nbrdists is a dictionary of neighbor node-id to the distances computed from
+    that neighbor. Returns a dictionary keyed by prefix of (lfas, rlfas) where
+    lfas is a tuple of (neighbor-sysid, node-protecting) and rlfas is a tuple of
+    PQ node system-ids, only computed for prefixes without an LFA. ECMP prefixes
+    are skipped as they are already protected.
+    """
+    advertisers = get_prefix_advertisers(snapshot, root)
+    pqnodes = {}
+    backups = {}
+    for prefix, (metric, nexthops) in routes.items():
+        if len(nexthops) != 1:
+            continue
+        primary = next(iter(nexthops))
+        pnode = primary + bchr(0)
+        try:
+            pdist = nbrdists[pnode]
+        except KeyError:
+            pdist = None
+        d_ep = prefix_distance(pdist, advertisers[prefix]) if pdist else None
+
+        lfas = []
+        for nnode, ndist in nbrdists.items():
+            nsysid = nnode[:clns.CLNS_SYSID_LEN]
+            if nsysid == primary or root not in ndist:
+                continue
+            d_np = prefix_distance(ndist, advertisers[prefix])
+            if d_np is None:
+                continue
+            # Loop-free: D(N,D) < D(N,S) + D(S,D)
+            if d_np < ndist[root] + metric:
+                # Node-protecting: D(N,D) < D(N,E) + D(E,D)
+                protecting = bool(d_ep is not None and pnode in ndist and
+                                  d_np < ndist[pnode] + d_ep)
+                lfas.append((nsysid, protecting))
+
+        if lfas or pdist is None:
+            rlfas = ()
+        else:
+            try:
+                rlfas = pqnodes[primary]
+            except KeyError:
+                rlfas = pqnodes[primary] = compute_pq_nodes(root, pnode, sdist, pdist)
+        backups[prefix] = (tuple(sorted(lfas)), rlfas)
+    return backups
+
+
+#===========
+# Executors
+#===========
+
+
+class _InlineFuture (object):
+    """A completed future for work run in the calling thread"""
+    def __init__ (self, func, *args):
+        self._result = None
+        self._exception = None
+        try:
+            self._result = func(*args)
+        except Exception as ex:
+            self._exception = ex
+
+    def cancel (self):
+        return False
+
+    def cancelled (self):
+        return False
+
+    def result (self):
+        if self._exception:
+            raise self._exception               # pylint: disable=E0702
+        return self._result
+
+    def add_done_callback (self, callback):
+        callback(self)
+
+
+class SPFExecutor (object):
+    """Run decision process computations in a pool of worker processes.
+
+    With workers == 0 (or when concurrent.futures is unavailable) the work is run
+    inline in the calling thread.
+    """
+    def __init__ (self, workers=2):
+        self.workers = workers if futures else 0
+        self.pool = None
+        if self.workers:
+            try:
+                # Don't fork a process full of timer threads.
+                ctx = multiprocessing.get_context("forkserver")
+                self.pool = futures.ProcessPoolExecutor(self.workers, mp_context=ctx)
+            except (AttributeError, TypeError, ValueError):
+                self.pool = futures.ProcessPoolExecutor(self.workers)
+
+    def __str__ (self):
+        return "SPFExecutor(workers:{})".format(self.workers)
+
+    def submit (self, func, *args):
+        if not self.pool:
+            return _InlineFuture(func, *args)
+        return self.pool.submit(func, *args)
+
+    def shutdown (self):
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+
+#===========
+# SPT Cache
+#===========
+
+
+class SPTCache (object):
+    """An LRU cache of SPT results keyed by (level-index, root, topology-version).
+
+    An entry is only ever looked up with the current topology version so stale
+    entries are never returned, they simply age out.
+    """
+    def __init__ (self, size=SPT_CACHE_SIZE):
+        self.size = size
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__ (self):
+        return len(self.cache)
+
+    def __str__ (self):
+        return "SPTCache({}/{} hits:{} misses:{})".format(len(self.cache), self.size,
+                                                         self.hits, self.misses)
+
+    def get (self, key):
+        with self.lock:
+            try:
+                spt = self.cache.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.cache[key] = spt
+            self.hits += 1
+            return spt
+
+    def put (self, key, spt):
+        if not self.size:
+            return
+        with self.lock:
+            self.cache.pop(key, None)
+            self.cache[key] = spt
+            while len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+
+#===================
+# Decision Process
+#===================
+
+
+class DecisionProcess (object):
+    def __init__ (self, inst, lindex):
+        self.inst = inst
+        self.lindex = lindex
+        self.timerheap = timers.TimerHeap("Level-{} DecisionProcess".format(lindex + 1))
+        self.spf_timer = timers.Timer(self.timerheap, 0, self.spf_expire)
+        self.lock = threading.Lock()
+
+        self.running = None
+        self.pending = False
+        self.spt = {}
+        self.routes = {}
+        self.spf_count = 0
+        self.spf_start = None
+        self.snapshot = {}
+        self.snapshot_version = None
+        self.run_snapshot = None
+        self.run_version = None
+        self.run_prc = False
+        self.prc_count = 0
+
+        # Backup (LFA) path computation state.
+        self.backups = {}
+        self.backup_gen = 0
+        self.backup_futures = []
+        self.backup_nbrdists = {}
+        self.backup_count = 0
+
+    def __str__ (self):
+        return "DecisionProcess(L{})".format(self.lindex + 1)
+
+    def get_root (self):
+        return self.inst.sysid + bchr(0)
+
+    def sched_spf (self, delay=SPF_DELAY):
+        with self.lock:
+            if self.spf_timer.scheduled():
+                return
+            self.spf_timer.start(delay)
+            # Backups are now stale and would only delay the primary SPF.
+            cancel = self.backup_stop()
+        for future in cancel:
+            future.cancel()
+
+    def spf_expire (self):
+        with self.lock:
+            # If a run is outstanding, run again when it completes.
+            if self.running:
+                self.pending = True
+                return
+            self.running = True
+            self.spf_start = time.time()
+
+        # The snapshot is taken outside our lock as the update process calls us
+        # with its DB lock held.
+        try:
+            version, snapshot = get_versioned_snapshot(self.inst.update[self.lindex])
+            spt = self.inst.spt_cache.get((self.lindex, self.get_root(), version))
+            if spt is not None:
+                # The topology hasn't changed only the routes need recomputing,
+                # this is cheap enough to do here.
+                future = _InlineFuture(run_prc, snapshot, spt)
+            else:
+                future = self.inst.spf_executor.submit(run_spf, snapshot, self.get_root())
+        except Exception:
+            with self.lock:
+                self.running = None
+            raise
+        with self.lock:
+            self.running = future
+            self.run_snapshot = snapshot
+            self.run_version = version
+            self.run_prc = spt is not None
+        future.add_done_callback(self.spf_done)
+
+    def spf_done (self, future):
+        try:
+            spt, routes = future.result()
+        except Exception as ex:
+            logger.error("{}: SPF failed: {}", self, ex)
+            spt = routes = None
+
+        with self.lock:
+            self.running = None
+            pending, self.pending = self.pending, False
+            if routes is not None:
+                adds, changes, deletes = route_delta(self.routes, routes)
+                self.spt = spt
+                self.routes = routes
+                self.snapshot = self.run_snapshot
+                self.snapshot_version = self.run_version
+                if self.run_prc:
+                    self.prc_count += 1
+                    count = self.prc_count
+                else:
+                    self.spf_count += 1
+                    count = self.spf_count
+            run_prc = self.run_prc
+            self.run_snapshot = None
+
+        if routes is not None:
+            if not run_prc:
+                self.inst.spt_cache.put((self.lindex, self.get_root(), self.snapshot_version), spt)
+            logger.info("{}: {} {} completes: {} nodes {} routes (+{} ~{} -{}) in {:f} seconds",
+                        self, "PRC" if run_prc else "SPF", count, len(spt), len(routes),
+                        len(adds), len(changes), len(deletes), time.time() - self.spf_start)
+            self.routes_changed(adds, changes, deletes)
+
+        if pending:
+            self.sched_spf()
+        elif routes is not None:
+            self.backup_start()
+
+    def spf_from (self, root):
+        """Get the SPT rooted at root (a node-id) for the current topology.
+
+        Returns (topology-version, spt). The result is cached so repeated
+        queries while the topology is unchanged don't rerun SPF. This waits for
+        the SPF to complete so it must not be called with the DB lock held.
+        """
+        uproc = self.inst.update[self.lindex]
+        cache = self.inst.spt_cache
+        version = uproc.topology_version
+        spt = cache.get((self.lindex, root, version))
+        if spt is not None:
+            return version, spt
+
+        version, snapshot = get_versioned_snapshot(uproc)
+        spt = self.inst.spf_executor.submit(compute_spt, snapshot, root).result()
+        cache.put((self.lindex, root, version), spt)
+        return version, spt
+
+    #------------------------------------------------------------------
+    # Backup path (LFA/remote-LFA) precomputation. This is run at low
+    # priority after each primary SPF: each neighbor rooted SPF is a
+    # separate job so that scheduling a primary SPF can cancel the
+    # remaining work and get the next free worker.
+    #------------------------------------------------------------------
+
+    def get_neighbor_nodeids (self):
+        nodeids = set()
+        linkdb = self.inst.linkdb
+        with linkdb:
+            links = list(linkdb.links)
+        for link in links:
+            lxlink = link.lxlink[self.lindex]
+            if not lxlink:
+                continue
+            for adj in lxlink.adjdb.up_iter():
+                nodeids.add(adj.sysid + bchr(0))
+        return nodeids
+
+    def backup_stop (self):
+        """Invalidate outstanding backup work, lock must be held"""
+        self.backup_gen += 1
+        cancel, self.backup_futures = self.backup_futures, []
+        self.backup_nbrdists = {}
+        return cancel
+
+    def backup_start (self):
+        nodeids = self.get_neighbor_nodeids()
+        with self.lock:
+            if self.running or self.spf_timer.scheduled():
+                return
+            cancel = self.backup_stop()
+            gen = self.backup_gen
+            snapshot = self.snapshot
+            version = self.snapshot_version
+            root = self.get_root()
+            nodeids = [ x for x in nodeids if x in snapshot and x != root ]
+        for future in cancel:
+            future.cancel()
+
+        if not nodeids:
+            with self.lock:
+                if gen == self.backup_gen:
+                    self.backups = {}
+            return
+
+        # Neighbor rooted SPTs are cached so a prefix only change reuses them.
+        executor = self.inst.spf_executor
+        cache = self.inst.spt_cache
+        for nodeid in nodeids:
+            key = (self.lindex, nodeid, version)
+            spt = cache.get(key)
+            if spt is not None:
+                self.backup_nbr_result(gen, nodeid, len(nodeids), spt)
+                continue
+            with self.lock:
+                if gen != self.backup_gen:
+                    return
+                future = executor.submit(compute_spt, snapshot, nodeid)
+                self.backup_futures.append(future)
+            future.add_done_callback(self.get_backup_nbr_done(gen, key, len(nodeids)))
+
+    def get_backup_nbr_done (self, gen, key, count):
+        def backup_nbr_done (future):
+            try:
+                if future.cancelled():
+                    return
+                spt = future.result()
+            except Exception as ex:
+                # Still counted so the backups are computed without this neighbor.
+                logger.error("{}: Neighbor SPF failed: {}", self, ex)
+                spt = None
+            else:
+                self.inst.spt_cache.put(key, spt)
+            self.backup_nbr_result(gen, key[1], count, spt)
+        return backup_nbr_done
+
+    def backup_nbr_result (self, gen, nodeid, count, spt):
+        """Record a neighbor rooted SPT (None if it failed) and compute backups once all are in"""
+        with self.lock:
+            if gen != self.backup_gen:
+                return
+            if spt is None:
+                self.backup_nbrdists[nodeid] = None
+            else:
+                self.backup_nbrdists[nodeid] = dict((node, d)
+                                                    for node, (d, unused) in spt.items())
+            if len(self.backup_nbrdists) != count:
+                return
+            nbrdists = dict((x, y) for x, y in self.backup_nbrdists.items() if y is not None)
+            root = self.get_root()
+            sdist = dict((node, d) for node, (d, unused) in self.spt.items())
+            bfuture = self.inst.spf_executor.submit(compute_backups,
+                                                    self.snapshot,
+                                                    root,
+                                                    sdist,
+                                                    nbrdists,
+                                                    self.routes)
+            self.backup_futures.append(bfuture)
+        bfuture.add_done_callback(self.get_backup_done(gen))
+
+    def get_backup_done (self, gen):
+        def backup_done (future):
+            try:
+                if future.cancelled():
+                    return
+                backups = future.result()
+            except Exception as ex:
+                logger.error("{}: Backup path computation failed: {}", self, ex)
+                # Don't keep serving backups computed for an older topology.
+                with self.lock:
+                    if gen == self.backup_gen:
+                        self.backups = {}
+                        self.backup_futures = []
+                return
+
+            with self.lock:
+                if gen != self.backup_gen:
+                    return
+                self.backups = backups
+                self.backup_futures = []
+                self.backup_count += 1
+            lfacount = len([ x for x in backups.values() if x[0] ])
+            rlfacount = len([ x for x in backups.values() if x[1] ])
+            logger.info("{}: Backup computation {} completes: {} of {} prefixes LFA {} remote-LFA",
+                        self, self.backup_count, lfacount, len(backups), rlfacount)
+        return backup_done
+
+    def routes_changed (self, adds, changes, deletes):
+        self.inst.rib.update(self.lindex, adds, changes, deletes)
+        for prefix, (metric, nexthops) in adds + changes:
+            logger.debug("{}: route {} metric {} via {}", self, prefix_str(prefix), metric,
+                         ", ".join(clns.iso_decode(x) for x in sorted(nexthops)))
+        for prefix, unused in deletes:
+            logger.debug("{}: route {} deleted", self, prefix_str(prefix))
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
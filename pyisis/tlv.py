@@ -353,6 +353,14 @@ class _ExtIPV4Prefix (BigEndianStructure):
 def pfxlen2bytes (pfxlen):
     return (pfxlen + 7) // 8
 
+ExtIPV4PrefixStruct = struct.Struct(">IB")
+
+
+def get_ext_ipv4_prefix_value (addr, pfxlen, metric, updown=False):
+    """Get an extended IPv4 prefix entry value for a packed address (without sub-TLVs)"""
+    flags = (0x80 if updown else 0) | pfxlen
+    return ExtIPV4PrefixStruct.pack(metric, flags) + addr[:pfxlen2bytes(pfxlen)]
+
 
 class ExtIPV4PrefixEntry (object):
     def __init__ (self, value):
@@ -670,6 +678,16 @@ class _SNPEntry (BigEndianStructure):
 SNPEntryStruct = struct.Struct(">H8sIH")
 
 
+def get_snp_entry_capacity (space):
+    """Return the number of SNP entries that fit in space bytes of TLVs"""
+    count = 0
+    while space - 2 >= SNPEntryStruct.size:
+        entries = min(255, space - 2) // SNPEntryStruct.size
+        count += entries
+        space -= 2 + entries * SNPEntryStruct.size
+    return count
+
+
 class SNPEntry (object):
     def __init__ (self, bufdata):
         blen = len(bufdata)
@@ -897,7 +915,8 @@ def _tlv_insert_init (code, tlvbuf):
 
 def _tlv_insert_value (code, tlvbuf, tlvdata, value, new_buf_func=None, new_buf_args=None):
     vlen = len(value)
-    if tlvdata and len(tlvdata) < vlen:
+    # Start a new TLV if the value doesn't fit in the buffer or the TLV length.
+    if tlvdata and (len(tlvdata) < vlen or memspan(tlvbuf, tlvdata) - 2 + vlen > 255):
         tlvbuf = tlv_close_entries(tlvbuf, tlvdata)
         if len(tlvbuf) >= vlen + 2:
             tlvdata = basic_tlv_init(code, tlvbuf)
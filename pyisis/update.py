@@ -26,6 +26,7 @@ import pyisis.clns as clns
 # import pyisis.lib.debug as debug
 import pyisis.lsp as lsp
 import pyisis.pdu as pdu
+import pyisis.spf as spf
 import pyisis.lib.timers as timers
 import pyisis.tlv as tlv
 import pyisis.lib.util as util
@@ -47,6 +48,12 @@ class UpdateProcess (object):
 
         self.dblock = threading.Lock()
         self.dbhash = {}
+
+        # The topology version is bumped whenever an LSP change could change
+        # the SPT (IS reachability or overload), prefix changes do not.
+        self.topo_lock = threading.Lock()
+        self.topology = {}
+        self.topology_version = 0
         # self.dbtree = rbtree.rbtree()
 
         self.our_lsp = lsp.OwnLSP(inst, lindex)
@@ -98,6 +105,7 @@ class UpdateProcess (object):
         # 1) newer
         if frame.seqno > dbhdr.seqno or (frame.seqno == dbhdr.seqno and dbhdr.lifetime):
             dblsp.update(pdubuf, tlvs)
+            self.lsdb_changed(dblsp)
 
             linkdb = link.linkdb
             linkdb.set_all_srm(dblsp, link)
@@ -116,6 +124,23 @@ class UpdateProcess (object):
             link.set_srm_flag(dblsp)
             link.clear_ssn_flag(dblsp)
 
+    def lsdb_changed (self, lspseg, removed=False):
+        """Called when an LSP segment is added, changed or removed"""
+        lspid = lspseg.get_lspid()
+        topo = None if removed else spf.get_lsp_topology(lspseg)
+        with self.topo_lock:
+            lspseg.topo_change = self.topology.get(lspid) != topo
+            if lspseg.topo_change:
+                if topo is None:
+                    del self.topology[lspid]
+                else:
+                    self.topology[lspid] = topo
+                self.topology_version += 1
+
+        decision = self.inst.decision[self.lindex]
+        if decision:
+            decision.sched_spf()
+
     def get_lsp_segment (self, lspid):
         with self.dblock:
             try:
@@ -132,6 +157,8 @@ class UpdateProcess (object):
         with self.dblock:
             if lspid in self.dbhash:
                 del self.dbhash[lspid]
+            self.lsdb_changed(lspseg, True)
+        self.inst.linkdb.flags[self.lindex].free_slot(lspseg)
 
     def csnp_iter (self):
         with self.dblock:
@@ -172,7 +199,7 @@ class UpdateProcess (object):
         frame.checksum = 0
         # XXX what if we are purging our own?
         if not force or frame.lifetime != 0:
-            frame.lifetime = 30 # lsp.MAX_AGE
+            frame.lifetime = lsp.MAX_AGE
         frame.checksum = iso_cksum(pdubuf[ckoff:], 12)
 
         if dblsp:
@@ -189,15 +216,18 @@ class UpdateProcess (object):
             dblsp = lsp.LSPSegment(self.inst, self.lindex, pdubuf, tlvs)
             self.dbhash[lspid] = dblsp
         self.inst.linkdb.set_all_srm(dblsp)
+        self.lsdb_changed(dblsp)
 
-    def receive_lsp (self, link, unused_pkt, pdubuf, frame, tlvs):        # pylint: disable=R0912,R0914,R0915
+    def receive_lsp (self, link, unused_pkt, pdubuf, frame, tlvs,
+                     cksum_verified=False):                 # pylint: disable=R0912,R0914,R0915
         if len(pdubuf) > clns.receiveLSPBufferSize():
             # ISO 7.3.14.2 - Treat as invalid checksum
             logger.info("TRAP corruptedLSPReceived: {} dropping", link)
             return
 
+        # The receive pipeline may have already verified the checksum.
         lspbuf = pdubuf[sizeof(pdu.CLNSHeader):]
-        if frame.lifetime:
+        if frame.lifetime and not cksum_verified:
             cksum = iso_cksum(lspbuf[4:])
             if cksum:
                 import pdb
@@ -284,6 +314,7 @@ class UpdateProcess (object):
                         return
                     dblsp = lsp.LSPSegment(self.inst, self.lindex, pdubuf, tlvs)
                     self.dbhash[lspid] = dblsp
+                self.lsdb_changed(dblsp)
 
                 linkdb.set_all_srm(dblsp, link)
                 link.clear_srm_flag(dblsp)
@@ -18,6 +18,18 @@
 #include <sys/uio.h>
 #include <sys/socket.h>
 
+#if defined(__linux__)
+#define HAVE_SENDMMSG 1
+#else
+struct mmsghdr {
+    struct msghdr msg_hdr;
+    unsigned int msg_len;
+};
+#endif
+
+/* The kernel limits the number of messages per sendmmsg/recvmmsg call to UIO_MAXIOV */
+#define SENDMMSG_MAX 1024
+
 static char module_docstring[] =
     "This module provides python2 and python3 compatible efficient bytestring functions.";
 
@@ -260,6 +272,243 @@ out:
 }
 
 
+static char bstr_sendmmsg_docstring[] =
+    "Send a sequence of messages, each a sequence of buffers, to a socket.\n"
+    "Returns the number of messages sent which may be less than given.";
+
+static PyObject *
+bstr_sendmmsg (PyObject *self, PyObject *args)
+{
+    struct mmsghdr *msgs = NULL;
+    struct iovec *iov = NULL;
+    Py_buffer *iovbuf = NULL;
+    PyObject **bufseqs = NULL;
+    PyObject *fdobj, *seq, *msgseq, *rv;
+    Py_ssize_t nmsg, niov, nfilled, i, j, n;
+    int fd, flags, sent;
+
+    rv = NULL;
+    msgseq = NULL;
+    nmsg = 0;
+    nfilled = 0;
+    flags = 0;
+
+    /* Parse the input tuple */
+    if (!PyArg_ParseTuple(args, "OO|i:sendmmsg", &fdobj, &seq, &flags))
+        return NULL;
+    if ((fd = PyObject_AsFileDescriptor(fdobj)) == -1)
+        return NULL;
+    if ((msgseq = PySequence_Fast(seq, "sendmmsg requires a sequence of messages")) == NULL)
+        return NULL;
+
+    nmsg = PySequence_Fast_GET_SIZE(msgseq);
+    if (nmsg > SENDMMSG_MAX)
+        nmsg = SENDMMSG_MAX;
+    if (nmsg == 0) {
+        sent = 0;
+        goto done;
+    }
+
+    if ((bufseqs = PyMem_Malloc(sizeof(*bufseqs) * nmsg)) == NULL) {
+        PyErr_NoMemory();
+        goto out;
+    }
+    memset(bufseqs, 0, sizeof(*bufseqs) * nmsg);
+
+    /* Count the buffers so we can allocate all the iovecs at once */
+    niov = 0;
+    for (i = 0; i < nmsg; i++) {
+        bufseqs[i] = PySequence_Fast(PySequence_Fast_GET_ITEM(msgseq, i),
+                                     "sendmmsg message must be a sequence of buffers");
+        if (bufseqs[i] == NULL)
+            goto out;
+        n = PySequence_Fast_GET_SIZE(bufseqs[i]);
+        if (n > IOV_MAX) {
+            PyErr_SetString(PyExc_IndexError,
+                            "Number of message buffers exceeds IOV_MAX");
+            goto out;
+        }
+        niov += n;
+    }
+
+    msgs = PyMem_Malloc(sizeof(*msgs) * nmsg);
+    iov = PyMem_Malloc(sizeof(*iov) * (niov + 1));
+    iovbuf = PyMem_Malloc(sizeof(*iovbuf) * (niov + 1));
+    if (msgs == NULL || iov == NULL || iovbuf == NULL) {
+        PyErr_NoMemory();
+        goto out;
+    }
+    memset(msgs, 0, sizeof(*msgs) * nmsg);
+
+    for (i = 0; i < nmsg; i++) {
+        n = PySequence_Fast_GET_SIZE(bufseqs[i]);
+        msgs[i].msg_hdr.msg_iov = &iov[nfilled];
+        msgs[i].msg_hdr.msg_iovlen = n;
+        for (j = 0; j < n; j++) {
+            if (PyObject_GetBuffer(PySequence_Fast_GET_ITEM(bufseqs[i], j),
+                                   &iovbuf[nfilled], PyBUF_SIMPLE) != 0)
+                goto out;
+            iov[nfilled].iov_base = iovbuf[nfilled].buf;
+            iov[nfilled].iov_len = iovbuf[nfilled].len;
+            nfilled += 1;
+        }
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+#ifdef HAVE_SENDMMSG
+    sent = sendmmsg(fd, msgs, nmsg, flags);
+#else
+    for (sent = 0; sent < nmsg; sent++) {
+        if (sendmsg(fd, &msgs[sent].msg_hdr, flags) == -1)
+            break;
+    }
+    if (sent == 0)
+        sent = -1;
+#endif
+    Py_END_ALLOW_THREADS
+
+    if (sent == -1) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        goto out;
+    }
+
+done:
+#if PY_MAJOR_VERSION >= 3
+    rv = PyLong_FromLong(sent);
+#else
+    rv = PyInt_FromLong(sent);
+#endif
+out:
+    for (i = 0; i < nfilled; i++) {
+        PyBuffer_Release(&iovbuf[i]);
+    }
+    if (bufseqs) {
+        for (i = 0; i < nmsg; i++) {
+            if (bufseqs[i])
+                Py_DECREF(bufseqs[i]);
+        }
+    }
+    PyMem_Free(bufseqs);
+    PyMem_Free(msgs);
+    PyMem_Free(iov);
+    PyMem_Free(iovbuf);
+    Py_DECREF(msgseq);
+    return rv;
+}
+
+
+static char bstr_recvmmsg_docstring[] =
+    "Receive messages from a socket into a sequence of writable buffers, one message\n"
+    "per buffer. Returns a list of (nbytes, msg_flags, address) for the buffers filled.";
+
+static PyObject *
+bstr_recvmmsg (PyObject *self, PyObject *args)
+{
+    struct mmsghdr *msgs = NULL;
+    struct sockaddr_storage *addrs = NULL;
+    struct iovec *iov = NULL;
+    Py_buffer *iovbuf = NULL;
+    PyObject *fdobj, *seq, *bufseq, *rv, *item, *addr;
+    Py_ssize_t nmsg, nfilled, i;
+    int fd, flags, received;
+
+    rv = NULL;
+    nmsg = 0;
+    nfilled = 0;
+    flags = 0;
+
+    /* Parse the input tuple */
+    if (!PyArg_ParseTuple(args, "OO|i:recvmmsg", &fdobj, &seq, &flags))
+        return NULL;
+    if ((fd = PyObject_AsFileDescriptor(fdobj)) == -1)
+        return NULL;
+    if ((bufseq = PySequence_Fast(seq, "recvmmsg requires a sequence of buffers")) == NULL)
+        return NULL;
+
+    nmsg = PySequence_Fast_GET_SIZE(bufseq);
+    if (nmsg > SENDMMSG_MAX)
+        nmsg = SENDMMSG_MAX;
+    if (nmsg == 0) {
+        received = 0;
+        goto done;
+    }
+
+    msgs = PyMem_Malloc(sizeof(*msgs) * nmsg);
+    addrs = PyMem_Malloc(sizeof(*addrs) * nmsg);
+    iov = PyMem_Malloc(sizeof(*iov) * nmsg);
+    iovbuf = PyMem_Malloc(sizeof(*iovbuf) * nmsg);
+    if (msgs == NULL || addrs == NULL || iov == NULL || iovbuf == NULL) {
+        PyErr_NoMemory();
+        goto out;
+    }
+    memset(msgs, 0, sizeof(*msgs) * nmsg);
+
+    for (i = 0; i < nmsg; i++) {
+        if (PyObject_GetBuffer(PySequence_Fast_GET_ITEM(bufseq, i),
+                               &iovbuf[i], PyBUF_WRITABLE) != 0)
+            goto out;
+        nfilled += 1;
+        iov[i].iov_base = iovbuf[i].buf;
+        iov[i].iov_len = iovbuf[i].len;
+        msgs[i].msg_hdr.msg_iov = &iov[i];
+        msgs[i].msg_hdr.msg_iovlen = 1;
+        msgs[i].msg_hdr.msg_name = &addrs[i];
+        msgs[i].msg_hdr.msg_namelen = sizeof(addrs[i]);
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+#ifdef HAVE_SENDMMSG
+    received = recvmmsg(fd, msgs, nmsg, flags, NULL);
+#else
+    /* Only wait (if blocking) for the first message */
+    for (received = 0; received < nmsg; received++) {
+        ssize_t len = recvmsg(fd, &msgs[received].msg_hdr,
+                              received ? flags | MSG_DONTWAIT : flags);
+        if (len == -1)
+            break;
+        msgs[received].msg_len = len;
+    }
+    if (received == 0)
+        received = -1;
+#endif
+    Py_END_ALLOW_THREADS
+
+    if (received == -1) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        goto out;
+    }
+
+done:
+    if ((rv = PyList_New(received)) == NULL)
+        goto out;
+    for (i = 0; i < received; i++) {
+        addr = PyBytes_FromStringAndSize((char *)&addrs[i], msgs[i].msg_hdr.msg_namelen);
+        if (addr == NULL) {
+            Py_DECREF(rv);
+            rv = NULL;
+            goto out;
+        }
+        item = Py_BuildValue("(IiN)", msgs[i].msg_len, msgs[i].msg_hdr.msg_flags, addr);
+        if (item == NULL) {
+            Py_DECREF(rv);
+            rv = NULL;
+            goto out;
+        }
+        PyList_SET_ITEM(rv, i, item);
+    }
+out:
+    for (i = 0; i < nfilled; i++) {
+        PyBuffer_Release(&iovbuf[i]);
+    }
+    PyMem_Free(msgs);
+    PyMem_Free(addrs);
+    PyMem_Free(iov);
+    PyMem_Free(iovbuf);
+    Py_DECREF(bufseq);
+    return rv;
+}
+
+
 /*
  * Initialize the module
  */
@@ -267,6 +516,8 @@ out:
 static PyMethodDef module_methods[] = {
     { "bchr", bstr_bchr, METH_VARARGS, bstr_bchr_docstring },
     { "memspan", bstr_memspan, METH_VARARGS, bstr_memspan_docstring },
+    { "recvmmsg", bstr_recvmmsg, METH_VARARGS, bstr_recvmmsg_docstring },
+    { "sendmmsg", bstr_sendmmsg, METH_VARARGS, bstr_sendmmsg_docstring },
     { "sendv", bstr_sendv, METH_VARARGS, bstr_sendv_docstring },
     { "writev", bstr_writev, METH_VARARGS, bstr_writev_docstring },
     { NULL, NULL, 0, NULL },
@@ -282,6 +533,7 @@ PyInit_bstr(void)
 
     if ((m = PyModule_Create(&moduledef))) {
         PyModule_AddIntConstant(m, "IOV_MAX", IOV_MAX);
+        PyModule_AddIntConstant(m, "SENDMMSG_MAX", SENDMMSG_MAX);
     }
     return m;
 }
@@ -292,6 +544,7 @@ initbstr(void)
     PyObject *m;
     if ((m = Py_InitModule3("bstr", module_methods, module_docstring))) {
         PyModule_AddIntConstant(m, "IOV_MAX", IOV_MAX);
+        PyModule_AddIntConstant(m, "SENDMMSG_MAX", SENDMMSG_MAX);
     }
 }
 #endif
@@ -0,0 +1,85 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import struct
+import pyisis.clns as clns
+import pyisis.lib.bpf as bpf
+
+OUR_MAC = clns.mac_encode("02:00:00:00:00:01")
+NBR_MAC = clns.mac_encode("02:00:00:00:00:02")
+
+
+def run_filter (program, frame):
+    """Run the subset of classic BPF the ISO filters use over frame"""
+    insns = [ struct.unpack("HBBI", program[x:x + 8]) for x in range(0, len(program), 8) ]
+    acc = 0
+    pc = 0
+    while True:
+        code, jt, jf, k = insns[pc]
+        pc += 1
+        if code == bpf.BPF_RET:
+            return k
+        elif code == bpf.BPF_LD | bpf.BPF_W | bpf.BPF_ABS:
+            acc = struct.unpack_from(">I", frame, k)[0]
+        elif code == bpf.BPF_LD | bpf.BPF_H | bpf.BPF_ABS:
+            acc = struct.unpack_from(">H", frame, k)[0]
+        elif code == bpf.BPF_LD | bpf.BPF_B | bpf.BPF_ABS:
+            acc = struct.unpack_from(">B", frame, k)[0]
+        elif code == bpf.BPF_ALU | bpf.BPF_AND | bpf.BPF_K:
+            acc &= k
+        elif code == bpf.BPF_JMP | bpf.BPF_JEQ:
+            pc += jt if acc == k else jf
+        elif code == bpf.BPF_JMP | bpf.BPF_JGT:
+            pc += jt if acc > k else jf
+        else:
+            assert False, "unexpected instruction {:x}".format(code)
+
+
+def get_frame (dst, src, pdu_type, ethertype=64):
+    return (dst + src + struct.pack(">HHB", ethertype, 0xfefe, 3) +
+            struct.pack("BBBBB", 0x83, 27, 1, 0, pdu_type) + b"\x00" * 32)
+
+
+def test_iso_filter ():
+    assert run_filter(bpf.iso_filter, get_frame(clns.ALL_L1_IS, NBR_MAC, 18))
+    assert run_filter(bpf.iso_filter, get_frame(NBR_MAC, NBR_MAC, 99))
+    assert not run_filter(bpf.iso_filter, get_frame(clns.ALL_L1_IS, NBR_MAC, 18, 0x0800))
+
+    assert run_filter(bpf.iso_iih_filter, get_frame(clns.ALL_L2_IS, NBR_MAC, 16))
+    assert not run_filter(bpf.iso_iih_filter, get_frame(clns.ALL_L2_IS, NBR_MAC, 20))
+    assert run_filter(bpf.iso_non_iih_filter, get_frame(clns.ALL_L2_IS, NBR_MAC, 20))
+    assert not run_filter(bpf.iso_non_iih_filter, get_frame(clns.ALL_L2_IS, NBR_MAC, 16))
+
+
+def test_link_filter ():
+    # An L1 only link.
+    program = bpf.get_iso_filter([ clns.ALL_L1_IS ], OUR_MAC, [ 15, 18, 24, 26 ])
+    for pdu_type in (15, 18, 24, 26):
+        assert run_filter(program, get_frame(clns.ALL_L1_IS, NBR_MAC, pdu_type))
+        # Reserved bits are ignored.
+        assert run_filter(program, get_frame(clns.ALL_L1_IS, NBR_MAC, 0xe0 | pdu_type))
+    assert not run_filter(program, get_frame(clns.ALL_L1_IS, NBR_MAC, 20))
+    assert not run_filter(program, get_frame(clns.ALL_L2_IS, NBR_MAC, 18))
+    assert not run_filter(program, get_frame(clns.ALL_IS, NBR_MAC, 18))
+    assert not run_filter(program, get_frame(clns.ALL_L1_IS, OUR_MAC, 18))
+
+    # Both levels, MACs differing only in the low bytes or the high ones.
+    program = bpf.get_iso_filter(clns.ALL_LX_IS + [ clns.ALL_IS ], OUR_MAC)
+    for dst in clns.ALL_LX_IS + [ clns.ALL_IS ]:
+        assert run_filter(program, get_frame(dst, NBR_MAC, 20))
+        assert not run_filter(program, get_frame(dst, OUR_MAC, 20))
+    assert not run_filter(program, get_frame(clns.ALL_ES, NBR_MAC, 20))
+    assert not run_filter(program, get_frame(NBR_MAC, NBR_MAC, 20))
@@ -15,6 +15,9 @@
 # limitations under the License.
 #
 from pyisis.bstr import bchr, memspan, writev, IOV_MAX               # pylint: disable=W0611
+from pyisis.bstr import recvmmsg, sendmmsg                           # pylint: disable=E0611
+import errno
+import socket
 
 
 def test_writev ():
@@ -56,6 +59,63 @@ def test_writev_error ():
         assert False
 
 
+def test_sendmmsg ():
+    frames = [ [ b"frame", ("{}".format(x)).encode('ascii'), bytearray(b"-end") ]
+               for x in range(0, 10) ]
+    frames.append([ memoryview(b"view") ])
+
+    sa, sb = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        assert sendmmsg(sa, []) == 0
+        assert sendmmsg(sa, frames) == len(frames)
+        for frame in frames:
+            assert sb.recv(128) == b"".join(bytes(x) for x in frame)
+    finally:
+        sa.close()
+        sb.close()
+
+
+def test_sendmmsg_error ():
+    frames = [ [ b"x" ] * (IOV_MAX + 1) ]
+    sa, sb = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sendmmsg(sa, frames)
+    except IndexError as error:
+        print(error)
+    else:
+        assert False
+    finally:
+        sa.close()
+        sb.close()
+
+
+def test_recvmmsg ():
+    sa, sb = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sb.setblocking(False)
+    try:
+        for x in range(0, 3):
+            sa.send(("frame-{}".format(x)).encode('ascii') * (x + 1))
+        bufs = [ bytearray(16) for x in range(0, 4) ]
+        msgs = recvmmsg(sb, bufs, socket.MSG_TRUNC)
+        assert len(msgs) == 3
+        assert msgs[0][0] == 7 and bufs[0][:7] == b"frame-0"
+        assert msgs[1][0] == 14 and bufs[1][:14] == b"frame-1frame-1"
+        # The real length of a truncated message is returned.
+        assert msgs[2][0] == 21 and msgs[2][1] & socket.MSG_TRUNC
+        assert recvmmsg(sb, []) == []
+
+        # Nothing waiting on a non-blocking socket
+        try:
+            recvmmsg(sb, bufs)
+        except OSError as error:
+            assert error.errno in (errno.EAGAIN, errno.EWOULDBLOCK)
+        else:
+            assert False
+    finally:
+        sa.close()
+        sb.close()
+
+
 def test_memspan ():
     """
     >>> a = bytearray(b'12345')
@@ -0,0 +1,52 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from pyisis.lib.bufpool import BufferPool, retain
+from pyisis.lsp import retain_pdu
+
+
+def test_reuse ():
+    pool = BufferPool(64, 2)
+    a = pool.get()
+    b = pool.get()
+    assert len(a) == 64 and a is not b
+    pool.put(a)
+    assert pool.get() is a
+
+    # Allocates when empty, only keeps count free buffers.
+    c = pool.get()
+    assert pool.allocated == 3
+    for buf in (a, b, c):
+        pool.put(buf)
+    assert len(pool.free) == 2
+
+
+def test_retain ():
+    pool = BufferPool(64, 2)
+    a = pool.get()
+    retain(a)
+    pool.put(a)
+    assert pool.retained == 1
+    assert all(x is not a for x in pool.free)
+
+    # Keeping a received LSP takes its buffer out of the pool.
+    b = pool.get()
+    view = memoryview(b)[14:]
+    assert retain_pdu(view) is view
+    pool.put(b)
+    assert all(x is not b for x in pool.free)
+
+    retain(bytearray(4))
@@ -0,0 +1,83 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from pyisis.lib.flagmatrix import FlagMatrix
+
+SRM = 0
+SSN = 1
+
+
+class Obj (object):
+    def __init__ (self, name):
+        self.name = name
+        self.slot = None
+
+
+def test_set_clear_mask ():
+    flags = FlagMatrix()
+    objs = [ Obj(x) for x in range(0, 4) ]
+    for obj in objs:
+        flags.alloc_slot(obj)
+    assert [ x.slot for x in objs ] == [ 0, 1, 2, 3 ]
+
+    # Set on all 8 links but link 3
+    assert flags.set(SRM, objs[1], 0)
+    assert flags.set_mask(SRM, objs[1], 0xFF & ~(1 << 3)) == 0xF6
+    assert not flags.set(SRM, objs[1], 0)
+    assert flags.is_set(SRM, objs[1], 0)
+    assert not flags.is_set(SRM, objs[1], 3)
+    assert not flags.is_set(SSN, objs[1], 0)
+    assert flags.get_column(SRM, 0) == [ objs[1] ]
+    assert flags.get_column(SRM, 3) == []
+    assert not flags.has_column(SRM, 3)
+
+    assert flags.clear(SRM, objs[1], 0)
+    assert not flags.clear(SRM, objs[1], 0)
+    assert flags.clear_mask(SRM, objs[1], 0x0F) == 0x06
+    assert flags.clear_mask(SRM, objs[1], 0xF0) == 0xF0
+    assert not flags.pending[SRM]
+
+
+def test_pop_column ():
+    flags = FlagMatrix()
+    objs = [ Obj(x) for x in range(0, 10) ]
+    for obj in objs:
+        flags.alloc_slot(obj)
+        flags.set(SSN, obj, obj.name % 2)
+    odd = flags.pop_column(SSN, 1)
+    assert sorted(x.name for x in odd) == [ 1, 3, 5, 7, 9 ]
+    assert not flags.has_column(SSN, 1)
+    assert flags.has_column(SSN, 0)
+    assert len(flags.pending[SSN]) == 5
+
+
+def test_free_slot ():
+    flags = FlagMatrix()
+    a, b = Obj("a"), Obj("b")
+    flags.alloc_slot(a)
+    flags.set(SRM, a, 2)
+    flags.free_slot(a)
+    assert len(flags) == 0
+    assert not flags.has_column(SRM, 2)
+
+    # The slot is reused, the stale object must not touch the new one's flags.
+    flags.alloc_slot(b)
+    assert b.slot == a.slot
+    flags.set(SRM, a, 2)
+    assert not flags.has_column(SRM, 2)
+    flags.set(SRM, b, 2)
+    assert not flags.clear(SRM, a, 2)
+    assert flags.get_column(SRM, 2) == [ b ]
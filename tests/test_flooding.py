@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+import struct
+import threading
+from pyisis.flooding import FloodingTopology, get_graph, compute_flooding_topology
+
+
+def nodeid (index, pnid=0):
+    return struct.pack(">HIB", 0x1000, index, pnid)
+
+
+def get_topology (links):
+    """Get an update process style topology from a list of node pairs"""
+    nbrs = {}
+    for a, b in links:
+        nbrs.setdefault(a, []).append((b, 10))
+        nbrs.setdefault(b, []).append((a, 10))
+    return dict((x + b"\x00", (False, tuple(sorted(y)))) for x, y in nbrs.items())
+
+
+def is_connected (ft):
+    nodes = sorted(ft)
+    seen = set([ nodes[0] ])
+    stack = [ nodes[0] ]
+    while stack:
+        for nbr in ft[stack.pop()]:
+            if nbr not in seen:
+                seen.add(nbr)
+                stack.append(nbr)
+    return len(seen) == len(nodes)
+
+
+def test_get_graph_two_way ():
+    topo = get_topology([ (nodeid(1), nodeid(2)), (nodeid(2), nodeid(3)) ])
+    # 3 no longer reports 2
+    topo[nodeid(3) + b"\x00"] = (False, ())
+    graph = get_graph(topo)
+    assert graph[nodeid(1)] == set([ nodeid(2) ])
+    assert graph[nodeid(2)] == set([ nodeid(1) ])
+    assert graph[nodeid(3)] == set()
+
+
+def test_leaf_spine ():
+    spines = [ nodeid(x) for x in range(0, 8) ]
+    leaves = [ nodeid(x) for x in range(100, 164) ]
+    graph = get_graph(get_topology([ (s, l) for s in spines for l in leaves ]))
+    ft = compute_flooding_topology(graph)
+    assert is_connected(ft)
+    # Every leaf has a redundant FT neighbor, but gets at most 4 copies not 8.
+    for leaf in leaves:
+        assert 2 <= len(ft[leaf]) <= 4
+    # Leaves take about 2 copies, spines share the rest.
+    assert sum(len(ft[x]) for x in leaves) < 2.1 * len(leaves)
+    assert max(len(ft[x]) for x in spines) <= 2 * len(leaves) // len(spines) + 1
+
+    # Deterministic
+    assert compute_flooding_topology(graph) == ft
+
+
+def test_lan_pseudonodes ():
+    # Routers 1 and 2 share a LAN (pseudonode 1.1) and are also directly connected.
+    pnode = nodeid(1, 1)
+    links = [ (nodeid(1), pnode), (nodeid(2), pnode), (nodeid(3), pnode),
+              (nodeid(1), nodeid(2)), (nodeid(2), nodeid(4)) ]
+    ft = compute_flooding_topology(get_graph(get_topology(links)))
+    assert is_connected(ft)
+    assert nodeid(3) in ft[pnode]
+
+    # A pseudonode only connecting one router is pruned.
+    links = [ (nodeid(1), nodeid(2)), (nodeid(2), pnode) ]
+    ft = compute_flooding_topology(get_graph(get_topology(links)))
+    assert not ft[pnode]
+
+
+class FakeUpdate (object):
+    def __init__ (self, topology):
+        self.topo_lock = threading.Lock()
+        self.topology = topology
+        self.topology_version = 1
+
+
+class FakeLinkDB (object):
+    def __init__ (self, links):
+        self.links = links
+        self.lock = threading.Lock()
+
+    def __enter__ (self):
+        return self.lock.__enter__()
+
+    def __exit__ (self, *args):
+        return self.lock.__exit__(*args)
+
+
+class FakeLink (object):
+    def __init__ (self, index, nbr):
+        self.index = index
+        self.nbrs = set([ nbr ])
+        self.calls = 0
+
+    def get_flood_nbrs (self, unused_lindex):
+        self.calls += 1
+        return self.nbrs
+
+
+class FakeInstance (object):
+    def __init__ (self, sysid, topology, links):
+        self.sysid = sysid
+        self.update = [ FakeUpdate(topology) ]
+        self.linkdb = FakeLinkDB(links)
+
+
+def test_flood_mask_cached ():
+    us = nodeid(1)
+    nbrs = [ nodeid(x) for x in range(2, 8) ]
+    pairs = [ (us, x) for x in nbrs ] + [ (nbrs[0], x) for x in nbrs[1:] ]
+    links = [ FakeLink(i, x) for i, x in enumerate(nbrs) ]
+    inst = FakeInstance(us[:6], get_topology(pairs), links)
+    ftopo = FloodingTopology(inst, 0)
+    level_mask = (1 << len(links)) - 1
+
+    ft = compute_flooding_topology(get_graph(get_topology(pairs)))
+    expect = sum(1 << x.index for x in links if x.nbrs & ft[us])
+    assert expect
+    assert ftopo.get_flood_mask(level_mask) == expect
+
+    # Computed once however many LSPs are flooded.
+    for unused in range(0, 100):
+        assert ftopo.get_flood_mask(level_mask) == expect
+    assert [ x.calls for x in links ] == [ 1 ] * len(links)
+
+    # A neighbor change, a topology change or a new link recomputes it.
+    ftopo.nbrs_changed()
+    ftopo.get_flood_mask(level_mask)
+    assert [ x.calls for x in links ] == [ 2 ] * len(links)
+    inst.update[0].topology_version += 1
+    ftopo.get_flood_mask(level_mask)
+    assert ftopo.computations == 2
+    assert [ x.calls for x in links ] == [ 3 ] * len(links)
+    ftopo.get_flood_mask(level_mask >> 1)
+    assert links[0].calls == 4
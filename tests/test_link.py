@@ -0,0 +1,601 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+from ctypes import sizeof
+from pyisis.lib.util import bchr, memcpy
+import errno
+import ipaddress
+import random
+import select
+import socket
+import struct
+import time
+import pyisis.clns as clns
+import pyisis.instance as instance
+import pyisis.link as link
+import pyisis.lsp as lsp
+import pyisis.lib.bpf as bpf
+import pyisis.lib.pcap as pcap
+import pyisis.pdu as pdu
+import pyisis.tlv as tlv
+import pyisis.lib.util as util
+
+MAC_ADDR = b"\x02\x00\x00\x00\x00\x01"
+SYSID = b"\x00\x00\x00\x00\x00\x01"
+
+
+class FakeInterface (object):
+    """A raw interface that records the frames sent"""
+    def __init__ (self, ifname):
+        self.name = ifname
+        self.ifindex = 1
+        self.mac_addr = MAC_ADDR
+        self.rsock, self.wsock = socket.socketpair()
+        self.sent = []
+        self.filter = None
+
+    def fileno (self):
+        return self.rsock.fileno()
+
+    def close (self):
+        self.rsock.close()
+        self.wsock.close()
+
+    def add_drop_group (self, add, maddr):
+        pass
+
+    def set_filter (self, insns):
+        self.filter = insns
+
+    def recv_pkts (self):
+        return []
+
+    def release_pkts (self):
+        pass
+
+    def sendmmsg (self, frames):
+        self.sent.extend(b"".join(bytes(x) for x in frame) for frame in frames)
+        return len(frames)
+
+    def get_if_addrs (self):
+        return self.mac_addr, None
+
+
+class BlockingInterface (FakeInterface):
+    """A fake interface whose device queue takes only budget more frames"""
+    def __init__ (self, ifname):
+        super(BlockingInterface, self).__init__(ifname)
+        self.budget = 0
+
+    def sendmmsg (self, frames):
+        if not self.budget:
+            raise IOError(errno.EAGAIN, "Resource temporarily unavailable")
+        frames = frames[:self.budget]
+        self.budget -= len(frames)
+        return super(BlockingInterface, self).sendmmsg(frames)
+
+
+class DatagramInterface (FakeInterface):
+    """A fake interface receiving the frames written to its socket pair, one per batch"""
+    def __init__ (self, ifname):
+        super(DatagramInterface, self).__init__(ifname)
+        self.rsock, self.wsock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.rsock.setblocking(False)
+        self.fanout = None
+
+    def join_fanout (self, group, mode):
+        self.fanout = (group, mode)
+
+    def recv_pkts (self):
+        try:
+            return [ memoryview(bytearray(self.rsock.recv(2048))) ]
+        except (IOError, OSError):
+            return []
+
+
+class FakeIntf (object):
+    """An interface table entry"""
+    def __init__ (self, name, mac_addr, ipv4_prefix):
+        self.name = name
+        self.mac_addr = mac_addr
+        self.ipv4_prefix = ipv4_prefix
+
+    def get_ipv4_prefix (self):
+        return self.ipv4_prefix
+
+
+def get_link (is_type=clns.CTYPE_L1, intf_class=FakeInterface, **kwargs):
+    """Get a LAN link on a fake interface with the timer driven machinery stopped"""
+    inst = instance.Instance(is_type, clns.iso_encode("49.0001"), SYSID, 64, spf_workers=0,
+                             intf_factory=intf_class, **kwargs)
+    inst.decision = [ None, None ]
+    for uproc in inst.update:
+        if uproc is not None:
+            uproc.our_lsp.gen_timer.stop()
+    inst.linkdb.add_link("fake0")
+    lanlink = inst.linkdb.links[-1]
+    for lxlink in lanlink.lxlink:
+        if lxlink is not None:
+            lxlink.iih_timer.stop()
+            lxlink.dis_timer.stop()
+    return lanlink
+
+
+def get_lspid (index, pnid=0, segment=0):
+    return struct.pack(">HIBB", 0, index, pnid, segment)
+
+
+def get_lsp (lanlink, lspid, lifetime=1200):
+    """Get an LSP segment (not in the LSDB) with no TLVs"""
+    hdr, buf, unused = pdu.get_pdu_buffer(sizeof(pdu.LSPPDU), clns.PDU_TYPE_LSP_L1)
+    memcpy(hdr.lspid, lspid)
+    hdr.seqno = 1
+    hdr.lifetime = 1200
+    hdr.pdu_len = sizeof(hdr)
+    lspseg = lsp.LSPSegment(lanlink.linkdb.inst, 0, memoryview(buf),
+                            tlv.parse_tlvs(memoryview(b""), False))
+    if not lifetime:
+        # Purged, but left for the hold timer to remove.
+        lspseg.lsphdr.lifetime = 0
+        lspseg.zero_lifetime = util.Lifetime(lsp.ZERO_MAX_AGE)
+    return lspseg
+
+
+def get_sent_lspids (intf):
+    off = sizeof(pdu.LLCFrame) + pdu.LSPPDU.lspid.offset    # pylint: disable=E1101
+    lspids = [ x[off:off + clns.CLNS_LSPID_LEN] for x in intf.sent ]
+    del intf.sent[:]
+    return lspids
+
+
+def test_flood_order ():
+    lanlink = get_link(lsp_tx_interval=0)
+    normal = [ get_lsp(lanlink, get_lspid(3)), get_lsp(lanlink, get_lspid(2)) ]
+    topo = get_lsp(lanlink, get_lspid(2, 0, 1))
+    topo.topo_change = True
+    urgent = [ get_lsp(lanlink, get_lspid(4), 0),                       # A purge
+               get_lsp(lanlink, get_lspid(1, 1)),                       # Our pseudonode
+               get_lsp(lanlink, get_lspid(1)) ]                         # Ours
+    lspsegs = normal + [ topo ] + urgent
+    random.Random(1).shuffle(lspsegs)
+    for lspseg in lspsegs:
+        lanlink.set_srm_flag(lspseg)
+
+    expect = [ get_lspid(1), get_lspid(1, 1), get_lspid(4),
+               get_lspid(2, 0, 1),
+               get_lspid(2), get_lspid(3) ]
+    lanlink.send_packets()
+    assert get_sent_lspids(lanlink.rawintf) == expect
+
+    # When only some fit they are still the first in order.
+    for lspseg in lspsegs:
+        lanlink.set_srm_flag(lspseg)
+    lanlink.txq_max = 2
+    lanlink.send_packets()
+    assert get_sent_lspids(lanlink.rawintf) == expect[:2]
+    lanlink.send_packets()
+    assert get_sent_lspids(lanlink.rawintf) == expect[2:4]
+
+
+def test_purge_queued_lsp ():
+    lanlink = get_link()
+    lspseg = get_lsp(lanlink, get_lspid(2))
+    lspseg.lsphdr.checksum = 0x1234
+    lanlink.send_lsp(lspseg)
+    queued = b"".join(bytes(x) for x in lanlink.txq[0])
+
+    # The purge must not patch the frame waiting to be sent.
+    lspseg.hold_timer.stop()
+    lspseg.expire()
+    assert lspseg.lsphdr.lifetime == 0
+    assert lspseg.lsphdr.checksum == 0
+    assert b"".join(bytes(x) for x in lanlink.txq[0]) == queued
+
+
+def test_txq_blocked ():
+    lanlink = get_link(intf_class=BlockingInterface)
+    linkdb = lanlink.linkdb
+    rawintf = lanlink.rawintf
+    frames = [ bchr(x) * 60 for x in range(0, 5) ]
+    for frame in frames:
+        lanlink.queue_frame([ frame ])
+
+    # A short count then EAGAIN, the rest stay queued in order and the link
+    # waits to be writable.
+    rawintf.budget = 2
+    lanlink.send_packets()
+    assert rawintf.sent == frames[:2]
+    assert [ x[0] for x in lanlink.txq ] == frames[2:]
+    assert lanlink.tx_blocked and lanlink.tx_blocked_count == 1
+    assert lanlink.want_write and rawintf in linkdb.wlinkfds
+    if linkdb.selector is not None:
+        assert linkdb.selector.get_key(rawintf).events & link.selectors.EVENT_WRITE
+
+    # Still blocked, nothing is lost.
+    lanlink.send_packets()
+    assert len(lanlink.txq) == 3 and lanlink.tx_blocked_count == 1
+
+    # Writable again, the rest go and the link is no longer waiting to write.
+    rawintf.budget = 10
+    lanlink.send_packets()
+    assert rawintf.sent == frames
+    assert not lanlink.txq and not lanlink.tx_blocked
+    assert not lanlink.want_write and rawintf not in linkdb.wlinkfds
+    if linkdb.selector is not None:
+        assert not linkdb.selector.get_key(rawintf).events & link.selectors.EVENT_WRITE
+
+
+class RecordingCapture (object):
+    """A capture writer recording the frames it is given"""
+    def __init__ (self):
+        self.frames = []
+
+    def capture (self, ifname, data, direction):
+        self.frames.append((ifname, b"".join(bytes(x) for x in data), direction))
+
+
+def test_txq_blocked_capture ():
+    lanlink = get_link(intf_class=BlockingInterface)
+    capture = RecordingCapture()
+    lanlink.linkdb.capture = capture
+    rawintf = lanlink.rawintf
+    frames = [ bchr(x) * 60 for x in range(0, 3) ]
+    for frame in frames:
+        lanlink.queue_frame([ frame ])
+
+    # Nothing is captured until it's sent.
+    assert not capture.frames
+    lanlink.send_packets()
+    assert not capture.frames and lanlink.tx_blocked
+
+    # Frames held back by EAGAIN are captured once when they're finally sent.
+    rawintf.budget = 1
+    lanlink.send_packets()
+    rawintf.budget = 10
+    lanlink.send_packets()
+    assert rawintf.sent == frames
+    assert capture.frames == [ ("fake0", x, pcap.DIR_OUTBOUND) for x in frames ]
+
+
+def test_flood_pacing ():
+    # The burst is exactly the token budget and the transmit queue space.
+    lanlink = get_link(lsp_tx_interval=10, lsp_tx_burst=3)
+    lanlink.txq_max = 3
+    sched = lanlink.flood_sched[0]
+    lspsegs = [ get_lsp(lanlink, get_lspid(x)) for x in range(2, 8) ]
+    for lspseg in lspsegs:
+        lanlink.set_srm_flag(lspseg)
+
+    # The tokens ran out, not the device, so the link is paced.
+    lanlink.send_packets()
+    assert get_sent_lspids(lanlink.rawintf) == [ get_lspid(x) for x in range(2, 5) ]
+    assert not lanlink.tx_blocked and lanlink.tx_blocked_count == 0
+    assert sched.throttled and sched.timer.scheduled()
+    assert not lanlink.want_write
+    sched.timer.stop()
+
+    # With tokens left a full transmit queue isn't paced, the rest follow.
+    sched.throttled = False
+    sched.bucket.tokens = 6
+    lanlink.schedule_send()
+    lanlink.send_packets()
+    assert get_sent_lspids(lanlink.rawintf) == [ get_lspid(x) for x in range(5, 8) ]
+    assert not sched.throttled and not sched.timer.scheduled()
+    assert sched.throttle_count == 1 and sched.depth == 0
+
+
+def test_ssn_set_while_sending ():
+    lanlink = get_link(psnp_interval=1)
+    flags = lanlink.flags[0]
+    lspseg = get_lsp(lanlink, get_lspid(2))
+    lanlink.set_ssn_flag(lspseg)
+    ssnflags = flags.pop_column(link.SSN, lanlink.index)
+    assert ssnflags == [ lspseg ]
+
+    # An LSP received again before the PSNP is filled needs acknowledging again.
+    lanlink.set_ssn_flag(lspseg)
+    unused, unused, tlvview = lanlink.get_psnp_buffer(0)
+    lanlink.fill_snp_packet(ssnflags, tlvview)
+    assert flags.has_column(link.SSN, lanlink.index)
+    lanlink.psnp_sched[0].timer.stop()
+
+
+def test_receive_decoded_lsp ():
+    lanlink = get_link()
+    lspseg = get_lsp(lanlink, get_lspid(2))
+    llchdr, pad = lanlink.get_llc_header(0, len(lspseg.pdubuf) + link.LLC_HEADER_LEN)
+    frame = bytearray(bytes(llchdr) + bytes(lspseg.pdubuf) + bytes(pad or b""))
+    received = []
+    lanlink.check_update_pdu = lambda *args: True
+    lanlink.linkdb.inst.update[0].receive_lsp = lambda *args: received.append(args[-2:])
+
+    # TLVs the pipeline decoded are used as given and the checksum isn't checked again.
+    tlvs = tlv.parse_tlvs(memoryview(b""), False)
+    lanlink.receive_packet(memoryview(frame), tlvs)
+    assert received[-1][0] is tlvs and received[-1][1]
+
+    lanlink.receive_packet(memoryview(frame))
+    assert received[-1][0] is not tlvs and not received[-1][1]
+
+
+def test_adjacency_copies_iih ():
+    lanlink = get_link()
+    lxlink = lanlink.lxlink[0]
+    lxlink.iih_expire()
+    lxlink.iih_timer.stop()
+
+    # Our hello as if from a neighbor, received into a buffer that is reused.
+    rxbuf = bytearray(lanlink.rawintf.sent[0])
+    frame = pdu.get_frame(memoryview(rxbuf))
+    memcpy(frame.ether_src, b"\x02\x00\x00\x00\x00\x02")
+    memcpy(frame.source_id, b"\x00\x00\x00\x00\x00\x02")
+    lanlink.receive_packet(memoryview(rxbuf))
+    rxbuf[:] = bytearray(len(rxbuf))
+
+    adj = lxlink.adjdb.bysnpa[b"\x02\x00\x00\x00\x00\x02"]
+    assert adj.sysid == b"\x00\x00\x00\x00\x00\x02"
+    assert adj.areas == [ lanlink.linkdb.inst.areaid ]
+    adj.hold_timer.stop()
+
+
+def test_selector_registration ():
+    lanlink = get_link()
+    linkdb = lanlink.linkdb
+    selector = linkdb.selector
+    if selector is None:
+        return
+    rawintf = lanlink.rawintf
+    key = selector.get_key(rawintf)
+    assert key.events == link.selectors.EVENT_READ and key.data is lanlink
+
+    # Write interest is added and removed by modifying the registration.
+    linkdb.link_send_ready(lanlink)
+    assert selector.get_key(rawintf).events == (link.selectors.EVENT_READ |
+                                                link.selectors.EVENT_WRITE)
+    lanlink.send_packets()
+    assert selector.get_key(rawintf).events == link.selectors.EVENT_READ
+
+    # A removed link is unregistered even with write interest.
+    linkdb.link_send_ready(lanlink)
+    linkdb.remove_link(lanlink)
+    assert not linkdb.links and not linkdb.linkfds and not linkdb.wlinkfds
+    assert rawintf not in linkdb.linkbyfd and linkdb.level_masks == [ 0, 0 ]
+    assert not selector.get_map()
+    assert rawintf.rsock.fileno() == -1
+
+    # Its index isn't reused.
+    linkdb.add_link("fake1")
+    assert linkdb.links[0].index == 1
+    for lxlink in linkdb.links[0].lxlink:
+        if lxlink is not None:
+            lxlink.iih_timer.stop()
+            lxlink.dis_timer.stop()
+
+
+def test_hello_socket ():
+    dst_macs = clns.ALL_LX_IS
+    iih_types = clns.PDU_TYPE_IIH_LAN_LX
+    other_types = clns.PDU_TYPE_LSP_LX + clns.PDU_TYPE_CSNP_LX + clns.PDU_TYPE_PSNP_LX
+
+    # One socket receives everything.
+    lanlink = get_link(clns.CTYPE_L12)
+    assert lanlink.hellointf is None and lanlink.rxintfs == [ lanlink.rawintf ]
+    assert lanlink.rawintf.filter == bpf.get_iso_filter(dst_macs, MAC_ADDR, iih_types + other_types)
+
+    # Hellos on a socket of their own, read first.
+    lanlink = get_link(clns.CTYPE_L12, rx_hello_socket=True)
+    linkdb = lanlink.linkdb
+    hellointf = lanlink.hellointf
+    assert hellointf is not None and hellointf is not lanlink.rawintf
+    assert lanlink.rxintfs == [ hellointf, lanlink.rawintf ]
+    assert hellointf.filter == bpf.get_iso_filter(dst_macs, MAC_ADDR, iih_types)
+    assert lanlink.rawintf.filter == bpf.get_iso_filter(dst_macs, MAC_ADDR, other_types)
+    assert linkdb.hellofds == set([ hellointf ])
+    assert linkdb.linkbyfd[hellointf] is lanlink
+
+    order = []
+    lanlink.receive_packets = order.append
+    linkdb.process_read_sockets([ lanlink.rawintf, hellointf ])
+    assert order == [ hellointf, lanlink.rawintf ]
+
+    linkdb.remove_link(lanlink)
+    assert not linkdb.hellofds
+
+
+def test_receive_fanout ():
+    lanlink = get_link(intf_class=DatagramInterface, rx_fanout=2)
+    linkdb = lanlink.linkdb
+    workers = lanlink.rxworkers
+    assert len(workers) == 2 and lanlink.rxintfs == [ lanlink.rawintf ] + workers
+    group = workers[0].rawintf.fanout[0]
+    assert [ x.rawintf.fanout for x in workers ] == [ (group, "hash"), (group, "hash") ]
+    assert lanlink.rawintf.fanout is None
+
+    # The link's socket only sends, the fanout sockets receive.
+    assert lanlink.rawintf.filter == bpf.drop_filter
+    iso_filter = workers[0].rawintf.filter
+    assert iso_filter != bpf.drop_filter and workers[1].rawintf.filter == iso_filter
+    assert all(linkdb.linkbyfd[x] is lanlink for x in workers)
+
+    # Frames received by a worker are processed in order by the packet thread,
+    # in buffers of their own.
+    received = []
+    lanlink.receive_packet = lambda pkt, tlvs=None: received.append(pkt)
+    frames = [ bchr(x) * 60 for x in range(0, 3) ]
+    for frame in frames:
+        workers[1].rawintf.wsock.send(frame)
+    while len(received) < len(frames):
+        assert select.select([ workers[1] ], [], [], 5)[0]
+        linkdb.process_read_sockets([ workers[1] ])
+    assert [ bytes(x) for x in received ] == frames
+    assert all(lsp.is_private_buffer(x) for x in received)
+    assert workers[1].rx_frames == 3 and not workers[0].rx_frames
+    assert not select.select([ workers[1] ], [], [], 0)[0]
+
+    linkdb.remove_link(lanlink)
+    assert not any(x.thread.is_alive() for x in workers)
+
+
+def test_receive_worker_queue_full ():
+    rawintf = DatagramInterface("fake0")
+    worker = link.ReceiveWorker(rawintf, maxbatches=1)
+    frames = [ bchr(x) * 60 for x in range(0, 3) ]
+    for frame in frames:
+        rawintf.wsock.send(frame)
+
+    # The worker waits for room rather than dropping frames.
+    deadline = time.time() + 5
+    while not worker.full_count:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert len(worker.batches) == 1
+    received = []
+    while len(received) < len(frames):
+        assert select.select([ worker ], [], [], 5)[0]
+        received.extend(bytes(x) for x in worker.recv_pkts())
+    assert received == frames
+    worker.close()
+    assert not worker.thread.is_alive()
+
+
+def test_lsp_expire_races ():
+    lanlink = get_link()
+    lspseg = get_lsp(lanlink, get_lspid(2))
+
+    # Updated after the hold timer fired, the new timer is running.
+    lspseg.expire()
+    assert lspseg.lsphdr.lifetime == 1200 and lspseg.zero_lifetime is None
+
+    lspseg.hold_timer.stop()
+    lspseg.expire()
+    assert lspseg.lsphdr.lifetime == 0 and lspseg.zero_lifetime is not None
+    assert lspseg.update_lifetime()
+
+    # Removed after its zero age, an LSP picked to be sent isn't.
+    lspseg.hold_timer.stop()
+    lspseg.expire()
+    assert not lspseg.update_lifetime()
+
+
+def test_send_removed_lsp ():
+    lanlink = get_link(lsp_tx_interval=0)
+    lspsegs = [ get_lsp(lanlink, get_lspid(2)), get_lsp(lanlink, get_lspid(3), 0) ]
+    for lspseg in lspsegs:
+        lanlink.set_srm_flag(lspseg)
+
+    # Its zero age ran out, and it was removed, after it was picked to be sent.
+    lspsegs[1].zero_lifetime = None
+    lanlink.send_packets()
+    assert get_sent_lspids(lanlink.rawintf) == [ get_lspid(2) ]
+    assert not lanlink.flags[0].has_column(link.SRM, lanlink.index)
+
+
+def test_lsp_expire_unfilled ():
+    lanlink = get_link()
+    uproc = lanlink.linkdb.inst.update[0]
+    lspid = get_lspid(2)
+
+    # A placeholder for an LSP listed in a received SNP (7.3.15.2: b5) that never came.
+    lsphdr = pdu.LSPZeroSegFrame()
+    memcpy(lsphdr.lspid, lspid)
+    lsphdr.seqno = 0
+    lsphdr.checksum = 0x1234
+    lsphdr.lifetime = 1200
+    lspseg = lsp.LSPSegment(lanlink.linkdb.inst, 0, lsphdr, None)
+    uproc.dbhash[lspid] = lspseg
+    lanlink.set_ssn_flag(lspseg)
+
+    # It is removed rather than purged.
+    lspseg.hold_timer.stop()
+    lspseg.expire()
+    assert uproc.get_lsp_segment(lspid) is None
+    assert lspseg.zero_lifetime is None
+    assert not lanlink.flags[0].has_column(link.SRM, lanlink.index)
+    assert not lanlink.flags[0].has_column(link.SSN, lanlink.index)
+
+
+def test_own_lsp_lifetime ():
+    lanlink = get_link()
+    uproc = lanlink.linkdb.inst.update[0]
+    uproc.our_lsp.regenerate()
+    lspseg = uproc.get_lsp_segment(SYSID + b"\x00\x00")
+    assert lspseg.lsphdr.lifetime == lsp.MAX_AGE
+    assert lspseg.lifetime.timeleft() > lsp.MAX_AGE - 5
+
+
+def test_llc_header_cache ():
+    lanlink = get_link(clns.CTYPE_L12)
+    llchdr, pad = lanlink.get_llc_header(0, 100)
+    assert llchdr[:6] == clns.ALL_L1_IS
+    assert llchdr[6:12] == MAC_ADDR
+    assert llchdr[12:] == b"\x00\x64\xfe\xfe\x03"
+    assert pad is None
+    # Cached, not rebuilt.
+    assert lanlink.get_llc_header(0, 100)[0] is llchdr
+
+    # Short frames are padded to the Ethernet minimum.
+    llchdr2, pad = lanlink.get_llc_header(1, 30)
+    assert llchdr2[:6] == clns.ALL_L2_IS
+    assert llchdr2[12:14] == b"\x00\x2e"
+    assert len(pad) == link.ETHER_MIN_PAYLOAD - 30
+    assert len(lanlink.llc_headers) == 2
+
+    # A MAC address change invalidates the cache.
+    newmac = b"\x02\x00\x00\x00\x00\x02"
+    lanlink.linkdb.intf_changed(FakeIntf("fake0", newmac, lanlink.ipv4_prefix))
+    assert lanlink.mac_addr == newmac
+    assert not lanlink.llc_headers
+    assert lanlink.get_llc_header(0, 100)[0][6:12] == newmac
+
+
+
+def test_intf_changed ():
+    lanlink = get_link(clns.CTYPE_L12)
+    linkdb = lanlink.linkdb
+    gens = []
+    for uproc in linkdb.inst.update:
+        uproc.our_lsp.sched_gen = lambda delay=0, uproc=uproc: gens.append(uproc.lindex)
+
+    # A new address is advertised in our LSPs at both levels.
+    prefix = ipaddress.ip_interface("192.0.2.1/24")
+    linkdb.intf_changed(FakeIntf("fake0", MAC_ADDR, prefix))
+    assert lanlink.ipv4_prefix == prefix
+    assert sorted(gens) == [ 0, 1 ]
+
+    # Unchanged or for another interface nothing is regenerated.
+    del gens[:]
+    linkdb.intf_changed(FakeIntf("fake0", MAC_ADDR, prefix))
+    linkdb.intf_changed(FakeIntf("fake1", MAC_ADDR, ipaddress.ip_interface("198.51.100.1/24")))
+    assert gens == [] and lanlink.ipv4_prefix == prefix
+
+    # Nor is it for a MAC address change, which only refilters.
+    newmac = b"\x02\x00\x00\x00\x00\x02"
+    linkdb.intf_changed(FakeIntf("fake0", newmac, prefix))
+    assert gens == [] and lanlink.mac_addr == newmac
+    assert lanlink.rawintf.filter == bpf.get_iso_filter(
+        [ clns.ALL_L1_IS, clns.ALL_L2_IS ], newmac,
+        clns.PDU_TYPE_IIH_LAN_LX + clns.PDU_TYPE_LSP_LX + clns.PDU_TYPE_CSNP_LX +
+        clns.PDU_TYPE_PSNP_LX)
+
+    # Losing the address regenerates them again.
+    linkdb.intf_changed(FakeIntf("fake0", newmac, None))
+    assert lanlink.ipv4_prefix is None and sorted(gens) == [ 0, 1 ]
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,40 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import mmap
+from pyisis.lsp import is_private_buffer, retain_pdu
+
+
+def test_retain_private ():
+    view = memoryview(bytearray(b"\x01" * 64))[14:]
+    assert is_private_buffer(view)
+    assert retain_pdu(view) is view
+
+
+def test_retain_shared ():
+    # Views of a receive ring (or anything but our own bytearray) are copied.
+    ring = mmap.mmap(-1, 4096)
+    view = memoryview(ring)[14:78]
+    assert not is_private_buffer(view)
+    kept = retain_pdu(view)
+    assert isinstance(kept, bytearray) and kept == view
+    view[0] = 0xFF
+    assert kept[0] == 0
+    view.release()
+    ring.close()
+
+    kept = retain_pdu(b"\x02" * 16)
+    assert isinstance(kept, bytearray)
@@ -0,0 +1,180 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+import errno
+import ipaddress
+import socket
+import struct
+import pyisis.lib.netlink as netlink
+
+MAC1 = b"\x02\xfc\x00\x00\x00\x01"
+MAC2 = b"\x02\xfc\x00\x00\x00\x02"
+
+
+def get_link_msg (msgtype, ifindex, ifname, mac_addr, flags=0x1043):
+    payload = (netlink.IfInfoMsgStruct.pack(socket.AF_UNSPEC, 1, ifindex, flags, 0) +
+               netlink.get_rtattr(netlink.IFLA_IFNAME, ifname.encode("ascii") + b"\0") +
+               netlink.get_rtattr(netlink.IFLA_ADDRESS, mac_addr))
+    return netlink.get_nlmsg(msgtype, 0, 0, payload)
+
+
+def get_addr_msg (msgtype, ifindex, prefix):
+    prefix = ipaddress.ip_interface(prefix)
+    payload = (netlink.IfAddrMsgStruct.pack(socket.AF_INET, prefix.network.prefixlen, 0, 0,
+                                            ifindex) +
+               netlink.get_rtattr(netlink.IFA_LOCAL, prefix.ip.packed))
+    return netlink.get_nlmsg(msgtype, 0, 0, payload)
+
+
+class FakeEventSocket (object):
+    """A non-blocking socket with netlink event datagrams waiting"""
+    def __init__ (self):
+        self.events = []
+
+    def setblocking (self, unused):
+        pass
+
+    def recv (self, unused):
+        if not self.events:
+            raise socket.error(errno.EAGAIN, "Resource temporarily unavailable")
+        return self.events.pop(0)
+
+
+class FakeNetlinkSocket (object):
+    """A netlink socket answering dumps with the messages in dumps"""
+    dumps = {}
+
+    def __init__ (self, groups=0):
+        self.groups = groups
+        self.socket = FakeEventSocket()
+        self.rcvbuf = 2 ** 20
+
+    def fileno (self):
+        return -1
+
+    def close (self):
+        pass
+
+    def dump (self, msgtype, unused, handler):
+        for msg in self.dumps.get(msgtype, []):
+            for rmsgtype, unused, unused, payload in netlink.parse_nlmsgs(msg):
+                handler(rmsgtype, payload)
+
+
+def test_netlink_link_addr_msgs ():
+    payload = (netlink.IfInfoMsgStruct.pack(socket.AF_UNSPEC, 1, 4, 0x1043, 0) +
+               netlink.get_rtattr(netlink.IFLA_IFNAME, b"eth0\0") +
+               netlink.get_rtattr(netlink.IFLA_ADDRESS, b"\x02\xfc\x00\x00\x00\x01") +
+               netlink.get_rtattr(netlink.IFLA_MTU, struct.pack("=I", 1500)))
+    ifindex, ifname, flags, attrs = netlink.parse_link_payload(payload)
+    assert (ifindex, ifname, flags) == (4, "eth0", 0x1043)
+    assert attrs[netlink.IFLA_ADDRESS] == b"\x02\xfc\x00\x00\x00\x01"
+
+    payload = (netlink.IfAddrMsgStruct.pack(socket.AF_INET, 24, 0, 0, 4) +
+               netlink.get_rtattr(netlink.IFA_ADDRESS, b"\xc0\x00\x02\x01") +
+               netlink.get_rtattr(netlink.IFA_LOCAL, b"\xc0\x00\x02\x02"))
+    ifindex, addr = netlink.parse_addr_payload(payload)
+    assert ifindex == 4
+    assert str(addr) == "192.0.2.2/24"
+
+    payload = netlink.IfAddrMsgStruct.pack(socket.AF_INET6, 64, 0, 0, 4)
+    assert netlink.parse_addr_payload(payload) == (4, None)
+
+
+def test_netlink_route_msg ():
+    gw1, gw2 = b"\x0a\x00\x00\x01", b"\x0a\x00\x00\x02"
+    payload = netlink.get_route_payload(socket.AF_INET, b"\x0a\x01\x00\x00", 16,
+                                        [ (2, gw1) ], priority=20)
+    msg = netlink.get_nlmsg(netlink.RTM_NEWROUTE, netlink.NLM_F_REQUEST, 7, payload)
+    assert len(msg) % 4 == 0
+    [ (msgtype, flags, seq, body) ] = netlink.parse_nlmsgs(msg)
+    assert (msgtype, flags, seq) == (netlink.RTM_NEWROUTE, netlink.NLM_F_REQUEST, 7)
+    assert body == payload
+
+    family, dstlen = struct.unpack_from("=BB", payload)
+    assert (family, dstlen) == (socket.AF_INET, 16)
+    attrs = netlink.parse_rtattrs(payload, netlink.RTMsgStruct.size)
+    assert attrs[netlink.RTA_DST] == b"\x0a\x01\x00\x00"
+    assert attrs[netlink.RTA_GATEWAY] == gw1
+    assert struct.unpack("=i", attrs[netlink.RTA_OIF])[0] == 2
+    assert struct.unpack("=I", attrs[netlink.RTA_PRIORITY])[0] == 20
+
+    payload = netlink.get_route_payload(socket.AF_INET, b"\x0a\x01\x00\x00", 16,
+                                        [ (2, gw1), (3, gw2) ])
+    assert netlink.RTAttrStruct.unpack_from(payload, netlink.RTMsgStruct.size + 8)[1] == \
+        netlink.RTA_MULTIPATH
+
+
+def test_interface_table (monkeypatch):
+    monkeypatch.setattr(netlink, "NetlinkSocket", FakeNetlinkSocket)
+    monkeypatch.setattr(FakeNetlinkSocket, "dumps", {
+        netlink.RTM_GETLINK: [ get_link_msg(netlink.RTM_NEWLINK, 4, "eth0", MAC1) ],
+        netlink.RTM_GETADDR: [ get_addr_msg(netlink.RTM_NEWADDR, 4, "192.0.2.2/24") ],
+    })
+    changed = []
+    table = netlink.InterfaceTable(changed.append)
+    events = table.nlsock.socket.events
+
+    # The initial load isn't reported as changes.
+    intf = table.get("eth0")
+    assert (intf.ifindex, intf.mac_addr, intf.flags) == (4, MAC1, 0x1043)
+    assert str(intf.get_ipv4_prefix()) == "192.0.2.2/24"
+    assert changed == []
+
+    # A second address is added, the first stays primary. Both messages
+    # arrive in one datagram, a repeat isn't a change.
+    events.append(get_addr_msg(netlink.RTM_NEWADDR, 4, "198.51.100.1/24") +
+                  get_addr_msg(netlink.RTM_NEWADDR, 4, "198.51.100.1/24"))
+    table.receive_events()
+    assert changed == [ intf ]
+    assert [ str(x) for x in intf.ipv4_addrs ] == [ "192.0.2.2/24", "198.51.100.1/24" ]
+
+    # Removing the primary address makes the next one primary.
+    del changed[:]
+    events.append(get_addr_msg(netlink.RTM_DELADDR, 4, "192.0.2.2/24"))
+    events.append(get_addr_msg(netlink.RTM_DELADDR, 4, "192.0.2.9/24"))
+    table.receive_events()
+    assert changed == [ intf ]
+    assert str(intf.get_ipv4_prefix()) == "198.51.100.1/24"
+
+    # Addresses on unknown interfaces are ignored.
+    del changed[:]
+    events.append(get_addr_msg(netlink.RTM_NEWADDR, 9, "203.0.113.1/24"))
+    table.receive_events()
+    assert changed == []
+
+    # A rename and MAC address change, the name lookup follows.
+    events.append(get_link_msg(netlink.RTM_NEWLINK, 4, "eth1", MAC2, 0x1002))
+    table.receive_events()
+    assert changed == [ intf ]
+    assert table.get("eth0") is None and table.get("eth1") is intf
+    assert (intf.mac_addr, intf.flags) == (MAC2, 0x1002)
+
+    # A new interface and then the removal of the renamed one.
+    del changed[:]
+    events.append(get_link_msg(netlink.RTM_NEWLINK, 5, "eth2", MAC1))
+    events.append(get_link_msg(netlink.RTM_DELLINK, 4, "eth1", MAC2))
+    table.receive_events()
+    assert [ x.name for x in changed ] == [ "eth2", "eth1" ]
+    assert table.get("eth1") is None and table.get("eth2").ifindex == 5
+    assert 4 not in table.byindex
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import errno
+import os
+import struct
+import tempfile
+import pyisis.lib.pcap as pcap
+
+
+def test_capture_roundtrip ():
+    fd, path = tempfile.mkstemp(suffix=".pcapng")
+    os.close(fd)
+    try:
+        capture = pcap.CaptureWriter(path)
+        buf = bytearray(b"\x01" * 61)
+        capture.capture("eth0", memoryview(buf), pcap.DIR_INBOUND)
+        # A received buffer may be reused once captured.
+        buf[0] = 0xff
+        capture.capture("eth1", [ b"\x02" * 17, memoryview(b"\x03" * 3) ], pcap.DIR_OUTBOUND)
+        capture.capture("eth0", b"\x04" * 64)
+        capture.close()
+        assert capture.captured == 3 and capture.dropped == 0
+
+        frames = list(pcap.read_pcap(path))
+        assert [ (x[0], x[2], x[3]) for x in frames ] == [
+            ("eth0", pcap.DIR_INBOUND, b"\x01" * 61),
+            ("eth1", pcap.DIR_OUTBOUND, b"\x02" * 17 + b"\x03" * 3),
+            ("eth0", pcap.DIR_UNKNOWN, b"\x04" * 64),
+        ]
+        # Nanosecond timestamps in order.
+        assert frames[0][1] <= frames[1][1] <= frames[2][1]
+        assert frames[0][1] > 10 ** 18
+    finally:
+        os.unlink(path)
+
+
+def test_capture_write_error ():
+    fd, path = tempfile.mkstemp(suffix=".pcapng")
+    os.close(fd)
+    try:
+        capture = pcap.CaptureWriter(path, maxqueue=2)
+
+        def write (*unused):
+            raise IOError(errno.ENOSPC, "No space left on device")
+        capture.writer.write = write
+
+        # The writer stops but keeps the queue from filling, close doesn't block.
+        for unused in range(0, 20):
+            capture.capture("eth0", b"\x01" * 64)
+        capture.close()
+        assert not capture.thread.is_alive()
+        assert capture.captured == 0 and capture.dropped == 20
+
+        # Closing again or capturing after close is harmless.
+        capture.capture("eth0", b"\x01" * 64)
+        capture.close()
+        assert capture.captured == 0 and capture.dropped == 21
+    finally:
+        os.unlink(path)
+
+
+def test_read_classic_pcap ():
+    fd, path = tempfile.mkstemp(suffix=".pcap")
+    with os.fdopen(fd, "wb") as pfile:
+        pfile.write(struct.pack(">IHHiIII", pcap.PCAP_MAGIC_USEC, 2, 4, 0, 0, 65535, 1))
+        pfile.write(struct.pack(">IIII", 10, 5, 3, 3) + b"abc")
+    try:
+        assert list(pcap.read_pcap(path)) == [ (None, 10000005000, pcap.DIR_UNKNOWN, b"abc") ]
+    finally:
+        os.unlink(path)
@@ -0,0 +1,90 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from ctypes import sizeof
+from pyisis.lib.cksum import iso_cksum
+from pyisis.pipeline import ReceivePipeline, is_lsp_frame, verify_lsp_frame
+from pyisis.pipeline import decode_lsp_frame, decode_lsp_frames
+import pyisis.pdu as pdu
+import pyisis.tlv as tlv
+
+TLV_DATA = (b"\x89\x03rtr" +                                        # Hostname
+            b"\x16\x16" +                                           # Ext IS reach
+            b"\x00\x00\x00\x00\x00\x02\x00\x00\x00\x0a\x00" +
+            b"\x00\x00\x00\x00\x00\x03\x01\x00\x00\x14\x00" +
+            b"\x87\x08\x00\x00\x00\x0a\x18\x0a\x00\x01")            # Ext IP reach
+
+
+def get_lsp_frame (seqno, lifetime=1200, tlvdata=TLV_DATA):
+    lsphdr, buf, unused = pdu.get_raw_lsp_pdu(0)
+    pdulen = sizeof(lsphdr) + len(tlvdata)
+    buf[sizeof(lsphdr):pdulen] = tlvdata
+    lsphdr.pdu_len = pdulen
+    lsphdr.lifetime = lifetime
+    lsphdr.seqno = seqno
+    lsphdr.checksum = iso_cksum(buf[12:pdulen], 12)
+    llc = b"\xfe\xfe\x03"
+    return bytearray(b"\x01\x80\xc2\x00\x00\x14" + b"\x02" * 6 + b"\x00\x40" + llc + buf[:pdulen])
+
+
+def test_verify_lsp_frame ():
+    frame = get_lsp_frame(1)
+    assert is_lsp_frame(frame)
+    assert verify_lsp_frame(frame)
+    frame[-1] ^= 0x1
+    assert not verify_lsp_frame(frame)
+    # Purges aren't verified, nor are truncated frames.
+    assert not verify_lsp_frame(get_lsp_frame(2, 0))
+    assert not verify_lsp_frame(get_lsp_frame(3)[:-1])
+
+
+def get_tlv_strings (tlvs):
+    return dict((k, [ str(x) for x in v ]) for k, v in tlvs.items())
+
+
+def test_decode_lsp_frame ():
+    expect = get_tlv_strings(tlv.parse_tlvs(memoryview(TLV_DATA), False))
+    assert sorted(expect) == [ tlv.TLV_EXT_IS_REACH, tlv.TLV_EXT_IPV4_PREFIX, tlv.TLV_HOSTNAME ]
+    assert get_tlv_strings(decode_lsp_frame(get_lsp_frame(1))) == expect
+    bad = get_lsp_frame(2)
+    bad[-1] ^= 0x1
+    # A bad checksum, a purge and TLVs that don't decode all get None.
+    short = get_lsp_frame(4, tlvdata=b"\x89\x09rtr")
+    assert decode_lsp_frames([ bad, get_lsp_frame(3, 0), short ]) == [ None, None, None ]
+
+
+def test_pipeline_inline ():
+    pipeline = ReceivePipeline(0)
+    assert pipeline.decode([ get_lsp_frame(x) for x in range(1, 20) ]) is None
+
+
+def test_pipeline_workers ():
+    pipeline = ReceivePipeline(2, min_bytes=2 * len(get_lsp_frame(1)))
+    try:
+        hello = bytearray(64)
+        bad = get_lsp_frame(5)
+        bad[-1] ^= 0x1
+        pkts = [ get_lsp_frame(1), hello, get_lsp_frame(2), bad, memoryview(get_lsp_frame(3)) ]
+        decoded = pipeline.decode(pkts)
+        assert [ x is not None for x in decoded ] == [ True, False, True, False, True ]
+        # The TLVs decoded by the workers are the same as those decoded here.
+        expect = get_tlv_strings(tlv.parse_tlvs(memoryview(TLV_DATA), False))
+        assert all(get_tlv_strings(decoded[x]) == expect for x in (0, 2, 4))
+        assert pipeline.decoded == 3 and pipeline.failed == 1
+        # Too little to be worth it.
+        assert pipeline.decode([ get_lsp_frame(1), hello ]) is None
+    finally:
+        pipeline.shutdown()
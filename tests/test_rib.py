@@ -0,0 +1,218 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+import ipaddress
+import json
+import random
+import struct
+import pyisis.clns as clns
+import pyisis.rib as rib
+import pyisis.lib.netlink as netlink
+
+
+def pfx (s):
+    net = ipaddress.ip_network(s)
+    return net.network_address.packed, net.prefixlen
+
+
+def test_trie ():
+    trie = rib.PatriciaTrie()
+    prefixes = [ "10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "10.1.3.0/24", "0.0.0.0/0",
+                 "192.168.1.1/32", "10.128.0.0/9" ]
+    for i, s in enumerate(prefixes):
+        trie[pfx(s)] = i
+    assert len(trie) == len(prefixes)
+    for i, s in enumerate(prefixes):
+        assert trie[pfx(s)] == i
+    assert pfx("10.1.0.0/17") not in trie
+    assert trie.get(pfx("10.0.0.0/7")) is None
+
+    # Host bits are ignored
+    assert trie[(b"\x0a\x01\x02\x03", 24)] == 2
+
+    # Ordered iteration
+    assert list(trie) == [ pfx(x) for x in sorted(prefixes, key=lambda x: pfx(x)) ]
+
+    assert trie.longest_match(b"\x0a\x01\x02\x05") == (pfx("10.1.2.0/24"), 2)
+    assert trie.longest_match(b"\x0a\x01\x04\x05") == (pfx("10.1.0.0/16"), 1)
+    assert trie.longest_match(b"\x0a\x81\x04\x05") == (pfx("10.128.0.0/9"), 6)
+    assert trie.longest_match(b"\x0b\x00\x00\x00") == (pfx("0.0.0.0/0"), 4)
+
+    del trie[pfx("10.1.0.0/16")]
+    assert trie.longest_match(b"\x0a\x01\x04\x05") == (pfx("10.0.0.0/8"), 0)
+    assert trie.pop(pfx("10.1.0.0/16"), None) is None
+    for s in prefixes:
+        trie.pop(pfx(s), None)
+    assert len(trie) == 0
+    assert trie.root is None
+
+
+def test_trie_random ():
+    rand = random.Random(1)
+    trie = rib.PatriciaTrie()
+    expect = {}
+    for i in range(0, 2000):
+        plen = rand.randint(0, 32)
+        prefix = pfx(ipaddress.ip_network((rand.getrandbits(32), plen), strict=False))
+        if rand.random() < .3 and expect:
+            prefix = rand.choice(sorted(expect))
+            del trie[prefix]
+            del expect[prefix]
+        else:
+            trie[prefix] = i
+            expect[prefix] = i
+    assert len(trie) == len(expect)
+    assert list(trie.items()) == sorted(expect.items())
+
+
+A = clns.iso_encode("0000.0000.000a")
+B = clns.iso_encode("0000.0000.000b")
+
+
+def test_rib_delta ():
+    sink = rib.MemorySink()
+    table = rib.RIB([ sink ], batch_size=2)
+    p1, p2, p3 = pfx("10.0.1.0/24"), pfx("10.0.2.0/24"), pfx("10.0.3.0/24")
+
+    l2routes = [ (p1, (20, frozenset((A,)))),
+                 (p2, (20, frozenset((A,)))),
+                 (p3, (20, frozenset((A,)))) ]
+    assert table.update(1, l2routes, [], []) == 3
+    assert sink.batches == 2
+    assert sink.table[p1].lindex == 1
+    assert sink.version == 1
+
+    # Level-1 is preferred even with a larger metric.
+    assert table.update(0, [ (p1, (30, frozenset((B,)))) ], [], []) == 1
+    assert sink.table[p1].lindex == 0
+    assert sink.table[p1].metric == 30
+    assert sink.table[p1].version == 2
+    assert sink.table[p2].version == 1
+
+    # An L2 change hidden by the L1 route isn't published.
+    batches = sink.batches
+    assert table.update(1, [], [ (p1, (10, frozenset((A,)))) ], []) == 0
+    assert sink.batches == batches
+
+    # Removing the L1 route falls back to L2.
+    assert table.update(0, [], [], [ (p1, None) ]) == 1
+    assert sink.table[p1].lindex == 1
+    assert sink.table[p1].metric == 10
+
+    assert table.update(1, [], [], l2routes) == 3
+    assert sink.table == {}
+    assert len(table) == 0
+
+    # A new sink is brought up to date.
+    table.update(1, l2routes, [], [])
+    sink2 = rib.MemorySink()
+    table.add_sink(sink2)
+    assert sorted(sink2.table) == [ p1, p2, p3 ]
+    assert table.lookup(b"\x0a\x00\x02\x01").prefix == p2
+
+
+def test_jsonlines_sink (tmpdir):
+    path = str(tmpdir.join("routes.jsonl"))
+    table = rib.RIB([ rib.JSONLinesSink(path) ])
+    table.update(0, [ (pfx("10.0.1.0/24"), (20, frozenset((A, B)))) ], [], [])
+    table.update(0, [], [], [ (pfx("10.0.1.0/24"), None) ])
+    table.close()
+    with open(path) as jfile:
+        lines = [ json.loads(x) for x in jfile ]
+    assert lines[0] == { "version": 1, "op": "add", "prefix": "10.0.1.0/24", "level": 1,
+                         "metric": 20, "nexthops": [ "0000.0000.000a", "0000.0000.000b" ] }
+    assert lines[1]["op"] == "delete"
+    assert lines[1]["version"] == 2
+
+
+class FakeNetlinkSocket (object):
+    def __init__ (self):
+        self.sent = []
+
+    def send_batch (self, requests):
+        self.sent.extend(requests)
+        return []
+
+    def close (self):
+        pass
+
+
+def get_route_attrs (payload):
+    attrs = {}
+    offset = netlink.RTMsgStruct.size
+    while offset < len(payload):
+        alen, atype = netlink.RTAttrStruct.unpack_from(payload, offset)
+        attrs[atype] = payload[offset + 4:offset + alen]
+        offset += netlink.nlmsg_align(alen)
+    return attrs
+
+
+def test_netlink_sink ():
+    gateways = { A: [ (2, b"\x0a\x00\x00\x01") ], B: [] }
+    sink = rib.NetlinkSink(lambda lindex, sysid: list(gateways[sysid]))
+    sink.nlsock.close()
+    sink.nlsock = FakeNetlinkSocket()
+    sent = sink.nlsock.sent
+    table = rib.RIB([ sink ])
+    p1, p2 = pfx("10.0.1.0/24"), pfx("10.0.2.0/24")
+
+    table.update(0, [ (p1, (20, frozenset((A,)))), (p2, (20, frozenset((B,)))) ], [], [])
+    # The prefix via B doesn't resolve yet.
+    assert [ x[0] for x in sent ] == [ netlink.RTM_NEWROUTE ]
+
+    # A metric change replaces the route with the same fixed kernel priority.
+    del sent[:]
+    table.update(0, [], [ (p1, (30, frozenset((A,)))) ], [])
+    assert sent == []
+    gateways[A] = [ (3, b"\x0a\x00\x00\x09") ]
+    table.update(0, [], [ (p1, (40, frozenset((A,)))) ], [])
+    [ (msgtype, flags, payload) ] = sent
+    assert flags & netlink.NLM_F_REPLACE
+    attrs = get_route_attrs(payload)
+    assert struct.unpack("=I", attrs[netlink.RTA_PRIORITY])[0] == rib.KERNEL_ROUTE_PRIORITY
+    assert attrs[netlink.RTA_GATEWAY] == b"\x0a\x00\x00\x09"
+
+    # An adjacency to B comes up, only the newly resolvable route is installed.
+    del sent[:]
+    gateways[B] = [ (2, b"\x0a\x00\x00\x02") ]
+    table.nexthops_changed(0)
+    assert len(sent) == 1 and get_route_attrs(sent[0][2])[netlink.RTA_DST] == p2[0]
+    del sent[:]
+    table.nexthops_changed(1)
+    assert sent == []
+    table.nexthops_changed(None, True)
+    assert len(sent) == 2
+
+    # The adjacency to A goes down and the delete carries the same priority.
+    del sent[:]
+    gateways[A] = []
+    table.nexthops_changed(0)
+    [ (msgtype, flags, payload) ] = sent
+    assert msgtype == netlink.RTM_DELROUTE
+    attrs = get_route_attrs(payload)
+    assert struct.unpack("=I", attrs[netlink.RTA_PRIORITY])[0] == rib.KERNEL_ROUTE_PRIORITY
+    del sent[:]
+    table.update(0, [], [], [ (p1, None) ])
+    assert sent == []
+    table.update(0, [], [], [ (p2, None) ])
+    assert [ x[0] for x in sent ] == [ netlink.RTM_DELROUTE ]
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
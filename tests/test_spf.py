@@ -0,0 +1,255 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import, division, nested_scopes, print_function, unicode_literals
+import pyisis.clns as clns
+import pyisis.instance as instance
+import pyisis.rib as rib
+import pyisis.spf as spf
+
+
+def nodeid (sysid, pnid=0):
+    return clns.iso_encode(sysid) + bytes(bytearray((pnid,)))
+
+
+A = nodeid("0000.0000.000a")
+B = nodeid("0000.0000.000b")
+C = nodeid("0000.0000.000c")
+D = nodeid("0000.0000.000d")
+LAN = nodeid("0000.0000.000b", 1)
+
+PFX_D = (b"\x0a\x00\x0d\x00", 24)
+PFX_C = (b"\x0a\x00\x0c\x00", 24)
+
+
+def get_snapshot ():
+    # A -- B -- D, A -- LAN(B) -- C, C -- D
+    return {
+        A: (False, { B: 10, LAN: 10 }, ()),
+        B: (False, { A: 10, D: 10, LAN: 10 }, ()),
+        LAN: (False, { A: 0, B: 0, C: 0 }, ()),
+        C: (False, { LAN: 10, D: 10 }, ((PFX_C, 1),)),
+        D: (False, { B: 10, C: 10 }, ((PFX_D, 1),)),
+    }
+
+
+def test_compute_spt ():
+    spt = spf.compute_spt(get_snapshot(), A)
+    assert spt[A] == (0, frozenset())
+    assert spt[B] == (10, frozenset((B[:6],)))
+    assert spt[LAN] == (10, frozenset())
+    assert spt[C] == (10, frozenset((C[:6],)))
+    # ECMP through both B and C
+    assert spt[D] == (20, frozenset((B[:6], C[:6])))
+
+
+def test_two_way_check ():
+    snapshot = get_snapshot()
+    overload, nbrs, prefixes = snapshot[D]
+    del nbrs[B]
+    del nbrs[C]
+    spt = spf.compute_spt(snapshot, A)
+    assert D not in spt
+
+
+def test_overload ():
+    snapshot = get_snapshot()
+    snapshot[B] = (True,) + snapshot[B][1:]
+    spt = spf.compute_spt(snapshot, A)
+    assert spt[B] == (10, frozenset((B[:6],)))
+    assert spt[D] == (20, frozenset((C[:6],)))
+
+
+def test_compute_routes ():
+    snapshot = get_snapshot()
+    routes = spf.compute_routes(snapshot, spf.compute_spt(snapshot, A))
+    assert routes[PFX_C] == (11, frozenset((C[:6],)))
+    assert routes[PFX_D] == (21, frozenset((B[:6], C[:6])))
+
+
+def test_route_delta ():
+    old = { PFX_C: (11, frozenset((C[:6],))),
+            PFX_D: (21, frozenset((B[:6],))) }
+    new = { PFX_D: (21, frozenset((B[:6], C[:6]))) }
+    adds, changes, deletes = spf.route_delta(old, new)
+    assert adds == []
+    assert changes == [ (PFX_D, new[PFX_D]) ]
+    assert deletes == [ (PFX_C, old[PFX_C]) ]
+
+    adds, changes, deletes = spf.route_delta(new, old)
+    assert adds == [ (PFX_C, old[PFX_C]) ]
+
+
+def get_ring_snapshot ():
+    # A -- B -- C -- D -- E -- A with a prefix on B
+    E = nodeid("0000.0000.000e")
+    ring = [ A, B, C, D, E ]
+    snapshot = {}
+    for i, node in enumerate(ring):
+        nbrs = { ring[i - 1]: 10, ring[(i + 1) % len(ring)]: 10 }
+        prefixes = ((PFX_D, 1),) if node == B else ()
+        snapshot[node] = (False, nbrs, prefixes)
+    return snapshot, E
+
+
+def get_backups (snapshot, root):
+    spt, routes = spf.run_spf(snapshot, root)
+    sdist = dict((node, d) for node, (d, unused) in spt.items())
+    # Adjacent systems are those that are their own nexthop.
+    nbrs = [ node for node, (d, hops) in spt.items() if hops == frozenset((node[:6],)) ]
+    nbrdists = dict((nbr, spf.compute_distances(snapshot, nbr)) for nbr in nbrs)
+    return spf.compute_backups(snapshot, root, sdist, nbrdists, routes)
+
+
+def test_lfa ():
+    snapshot = get_snapshot()
+    # Make C more expensive from A so D is reached through B only.
+    snapshot[A][1][LAN] = 15
+    backups = get_backups(snapshot, A)
+    assert spf.run_spf(snapshot, A)[1][PFX_D][1] == frozenset((B[:6],))
+    assert backups[PFX_D] == (((C[:6], True),), ())
+
+
+def test_remote_lfa ():
+    snapshot, E = get_ring_snapshot()
+    backups = get_backups(snapshot, A)
+    # No LFA through E, D is the only PQ node for the link to B.
+    assert backups[PFX_D] == ((), (D[:6],))
+
+    # Adding a direct link from E to B makes E an LFA instead.
+    snapshot[E][1][B] = 10
+    snapshot[B][1][E] = 10
+    backups = get_backups(snapshot, A)
+    assert backups[PFX_D] == (((E[:6], False),), ())
+
+
+def test_executor ():
+    inline = spf.SPFExecutor(0)
+    expect = inline.submit(spf.run_spf, get_snapshot(), A).result()
+
+    executor = spf.SPFExecutor(1)
+    try:
+        assert executor.submit(spf.run_spf, get_snapshot(), A).result() == expect
+    finally:
+        executor.shutdown()
+
+
+def test_instance_close ():
+    shared = spf.SPFExecutor(1)
+    try:
+        insts = [ instance.Instance(clns.CTYPE_L1, clns.iso_encode("49.0001"), A[:6], 64,
+                                    spf_executor=shared) for unused in range(0, 2) ]
+        for inst in insts:
+            assert inst.spf_executor is shared
+            inst.close()
+        # The shared pool outlives the instances.
+        assert shared.pool is not None
+        assert shared.submit(spf.compute_distances, get_snapshot(), A).result()[D] == 20
+    finally:
+        shared.shutdown()
+
+    class CloseSink (rib.RIBSink):
+        closed = False
+
+        def close (self):
+            self.closed = True
+
+    sink = CloseSink()
+    inst = instance.Instance(clns.CTYPE_L1, clns.iso_encode("49.0001"), A[:6], 64, spf_workers=1,
+                             rib_sinks=[ sink ])
+    assert inst.spf_executor.pool is not None
+    inst.close()
+    assert inst.spf_executor.pool is None
+    assert sink.closed
+
+
+def test_spt_cache ():
+    cache = spf.SPTCache(2)
+    cache.put((0, A, 1), "a1")
+    cache.put((0, B, 1), "b1")
+    assert cache.get((0, A, 1)) == "a1"
+    # B is now least recently used.
+    cache.put((0, C, 1), "c1")
+    assert cache.get((0, B, 1)) is None
+    assert cache.get((0, A, 1)) == "a1"
+    assert cache.get((0, A, 2)) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+class FakeUpdate (object):
+    def __init__ (self):
+        self.topology_version = 1
+
+
+class FakeInstance (object):
+    def __init__ (self):
+        self.sysid = A[:6]
+        self.update = [ FakeUpdate() ]
+        self.spt_cache = spf.SPTCache()
+        self.spf_executor = spf.SPFExecutor(0)
+
+
+def test_spf_from (monkeypatch):
+    snapshots = []
+
+    def get_versioned_snapshot (uproc):
+        snapshots.append(uproc.topology_version)
+        return uproc.topology_version, get_snapshot()
+    monkeypatch.setattr(spf, "get_versioned_snapshot", get_versioned_snapshot)
+
+    inst = FakeInstance()
+    decision = spf.DecisionProcess(inst, 0)
+    version, spt = decision.spf_from(D)
+    assert version == 1
+    assert spt[A] == (20, frozenset((B[:6], C[:6])))
+    assert decision.spf_from(D) == (1, spt)
+    assert snapshots == [ 1 ]
+
+    inst.update[0].topology_version = 2
+    assert decision.spf_from(D)[0] == 2
+    assert snapshots == [ 1, 2 ]
+
+
+def test_backup_nbr_failed ():
+    inst = FakeInstance()
+    decision = spf.DecisionProcess(inst, 0)
+    snapshot = get_snapshot()
+    snapshot[A][1][LAN] = 15
+    decision.snapshot = snapshot
+    decision.spt, decision.routes = spf.run_spf(snapshot, A)
+    decision.backups = { PFX_C: "stale" }
+
+    def fail ():
+        raise ValueError("worker died")
+
+    # A failed neighbor SPF still completes the generation without that neighbor.
+    gen = decision.backup_gen
+    decision.get_backup_nbr_done(gen, (0, B, 1), 2)(spf._InlineFuture(fail))
+    assert decision.backup_count == 0
+    decision.backup_nbr_result(gen, C, 2, spf.compute_spt(snapshot, C))
+    assert decision.backup_count == 1
+    # Without the primary's distances node protection isn't known.
+    assert decision.backups[PFX_D] == (((C[:6], False),), ())
+
+    # A failed backup computation drops the now stale backups.
+    decision.get_backup_done(gen)(spf._InlineFuture(fail))
+    assert decision.backups == {}
+
+
+__author__ = 'Christian Hopps'
+__date__ = 'November 9 2014'
+__version__ = '1.0'
+__docformat__ = "restructuredtext en"
@@ -68,6 +68,30 @@ def test_restart_timer ():
     timer.start(2)
     timer.start(1)
 
+
+def test_stale_expire ():
+    done = []
+
+    def expire ():
+        done.append(1)
+
+    heap = timers.TimerHeap("TimerHeap")
+    timer = timers.Timer(heap, 0, expire)
+    timer.start(.05)
+    gen = heap.rtimer_gen
+
+    # A real-time timer cancelled too late runs anyway, it must not expire
+    # timers or start another real-time timer.
+    timer.start(.1)
+    assert heap.rtimer_gen != gen
+    heap.expire(gen)
+    assert not done and not heap.expiring and timer.scheduled()
+
+    while not done:
+        time.sleep(.01)
+    time.sleep(.05)
+    assert done == [ 1 ] and heap.rtimer is None
+
 __author__ = 'Christian Hopps'
 __date__ = 'November 1 2014'
 __version__ = '1.0'
@@ -125,8 +125,46 @@ def test_tlv_insert_entries ():
     assert len(tlvbuf) == 1 + len(testval)
     assert buf == bchr(code) + bchr(len(testval)) + testval + b"\xAF" * (len(testval) + 1)
 
+    # Test values that overflow the maximum TLV length are split into 2 TLVs
+    bufsize = 1024
+    buflist = []
+    buf = new_buf_func(None, (buflist, bufsize))[0]
+    tlvbuf, args = tlv.tlv_insert_entries(code,
+                                          buf,
+                                          get_value_iter(32),
+                                          new_buf_func,
+                                          (buflist, bufsize))
+    assert len(args[0]) == 1
+    assert buf[:2 + 31 * 8] == bchr(code) + bchr(31 * 8) + testval * 31
+    assert buf[2 + 31 * 8:2 + 32 * 8 + 2] == bchr(code) + bchr(len(testval)) + testval
+    assert memspan(buf, tlvbuf) == 32 * 8 + 4
+
     # XXX test case where tlvbuf is len == 1 or len == 0
 
+
+def test_ext_ipv4_prefix_value ():
+    value = tlv.get_ext_ipv4_prefix_value(b"\x0a\x01\x02\x00", 23, 100)
+    assert len(value) == 5 + 3
+    buf = bytearray(2 + len(value))
+    tlv.tlv_append(memoryview(buf), tlv.TLV_EXT_IPV4_PREFIX, value)
+    tlvs = tlv.parse_tlvs(memoryview(buf), False)
+    entry = tlvs[tlv.TLV_EXT_IPV4_PREFIX][0].values[0]
+    assert str(entry.addr) == "10.1.2.0"
+    assert entry.pfxlen == 23
+    assert entry.metric == 100
+    assert not entry.updown
+
+
+def test_snp_entry_capacity ():
+    # 15 entries per full TLV
+    assert tlv.get_snp_entry_capacity(1) == 0
+    assert tlv.get_snp_entry_capacity(2 + 16) == 1
+    assert tlv.get_snp_entry_capacity(257) == 15
+    assert tlv.get_snp_entry_capacity(242 + 2 + 32) == 17
+    # A 1492 byte PSNP (less 17 bytes of header)
+    assert tlv.get_snp_entry_capacity(1492 - 17) == 91
+
+
 __author__ = 'Christian Hopps'
 __date__ = 'November 2 2014'
 __version__ = '1.0'
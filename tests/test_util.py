@@ -16,7 +16,7 @@
 #
 
 
-from pyisis.lib.util import tlvrdb, tlvwrb
+from pyisis.lib.util import tlvrdb, tlvwrb, Backoff, TokenBucket
 
 
 def test_tlvrdb ():
@@ -34,6 +34,51 @@ def test_tlvwrb ():
     bam[1] = tlvwrb(4)
     assert ba == b'\x03\x04'
 
+
+def test_token_bucket ():
+    now = [ 0.0 ]
+    bucket = TokenBucket(10, 5, lambda: now[0])
+    assert bucket.consume(8) == 5
+    assert bucket.consume() == 0
+    assert abs(bucket.delay() - .1) < 1e-9
+    assert abs(bucket.delay(10) - .5) < 1e-9
+
+    now[0] = .25
+    assert bucket.consume(8) == 2
+    now[0] = 10
+    assert bucket.consume(8) == 5
+    assert bucket.delay() > 0
+
+    unlimited = TokenBucket(0, 1)
+    assert unlimited.consume(100) == 100
+    assert unlimited.delay() == 0
+
+
+def test_backoff ():
+    now = [ 0.0 ]
+    backoff = Backoff(.05, .2, 1, lambda: now[0])
+    assert backoff.delay() == .05
+    now[0] = .05
+    backoff.fired()
+
+    # Flapping backs off from the last event up to the maximum.
+    waits = []
+    for unused in range(0, 5):
+        delay = backoff.delay()
+        waits.append(delay)
+        now[0] += delay
+        backoff.fired()
+    assert [ round(x, 6) for x in waits ] == [ .2, .4, .8, 1, 1 ]
+
+    # Time already passed since the last event counts.
+    now[0] += .5
+    assert abs(backoff.delay() - .5) < 1e-9
+
+    # Quiet resets to the initial wait.
+    now[0] += 2
+    assert backoff.delay() == .05
+
+
 __author__ = 'Christian Hopps'
 __date__ = 'November 3 2014'
 __version__ = '1.0'
@@ -0,0 +1,85 @@
+#
+# Copyright (c) 2014 by Christian E. Hopps.
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import select
+import time
+import pyisis.clns as clns
+import pyisis.lib.vnet as vnet
+
+
+def get_frame (dst, src, pdu_type):
+    return [ dst + src + b"\x00\x40\xfe\xfe\x03\x83\x1b\x01\x00", bytearray([ pdu_type ]) +
+             b"\x00" * 40 ]
+
+
+def readable (intf):
+    return intf in select.select([ intf ], [], [], 0)[0]
+
+
+def test_delivery ():
+    net = vnet.VirtualNetwork(1)
+    net.add_lan("lan0")
+    a, b, c = [ net.open_intf("lan0") for unused in range(0, 3) ]
+    assert len(set(x.mac_addr for x in (a, b, c))) == 3
+    assert a.get_if_addrs()[1] != b.get_if_addrs()[1]
+    b.add_drop_group(True, clns.ALL_L1_IS)
+
+    # Multicast reaches only members, never the sender.
+    assert a.sendmmsg([ get_frame(clns.ALL_L1_IS, a.mac_addr, 18) ]) == 1
+    assert readable(b) and not readable(c) and not readable(a)
+    pkts = b.recv_pkts()
+    assert len(pkts) == 1 and bytes(pkts[0][:6]) == clns.ALL_L1_IS
+    assert not readable(b)
+    pkts[0][0] = 0                                          # A buffer of its own
+
+    # Unicast by MAC.
+    c.sendmmsg([ get_frame(a.mac_addr, c.mac_addr, 24) ] * 3)
+    assert len(a.recv_pkts()) == 3 and not b.recv_pkts()
+
+    frames, delivered, lost, pdu_types = net.get_stats()
+    assert (frames, delivered, lost) == (4, 4, 0)
+    assert pdu_types == { 18: 1, 24: 3 }
+
+
+def test_batch_delay_loss ():
+    lan = vnet.VirtualLAN("lan0", delay=.05, seed=1)
+    a = vnet.VirtualInterface(lan, "lan0", b"\x02\x00\x00\x00\x00\x01", batch=2)
+    b = vnet.VirtualInterface(lan, "lan0", b"\x02\x00\x00\x00\x00\x02", batch=2)
+    a.sendmmsg([ get_frame(b.mac_addr, a.mac_addr, 18) ] * 3)
+    assert not readable(b)
+    time.sleep(.2)
+    # Still readable while frames remain after a batch.
+    assert len(b.recv_pkts()) == 2 and readable(b)
+    assert len(b.recv_pkts()) == 1 and not readable(b)
+
+    lan = vnet.VirtualLAN("lan1", loss=1)
+    a = vnet.VirtualInterface(lan, "lan1", b"\x02\x00\x00\x00\x00\x01")
+    b = vnet.VirtualInterface(lan, "lan1", b"\x02\x00\x00\x00\x00\x02")
+    a.sendmmsg([ get_frame(b.mac_addr, a.mac_addr, 18) ])
+    assert lan.lost == 1 and not b.recv_pkts()
+
+
+def test_shared_timerheap ():
+    # The delayed frames of all of a network's LANs are delivered by one timer heap.
+    net = vnet.VirtualNetwork(1)
+    lans = [ net.add_lan("lan{}".format(x), delay=.05) for x in range(0, 3) ]
+    assert all(x.timerheap is net.timerheap for x in lans)
+    assert net.add_lan("lan3").timerheap is net.timerheap
+    a, b = net.open_intf("lan2"), net.open_intf("lan2")
+    a.sendmmsg([ get_frame(b.mac_addr, a.mac_addr, 18) ])
+    assert not readable(b)
+    time.sleep(.2)
+    assert len(b.recv_pkts()) == 1